@@ -0,0 +1,222 @@
+"""
+Cached, expiring token authentication.
+
+DRF's TokenAuthentication joins Token and User on every request. Here resolved
+tokens are kept in a bounded per-process LRU map for TOKEN_AUTH_CACHE_TTL
+seconds and, if TOKEN_AUTH_SHARED_CACHE names a cache alias, in that shared cache
+too, so most requests authenticate without a query. Deleting a token (logout,
+rotation) or saving its user (deactivation, profile changes) invalidates the
+entries in this process and in the shared cache; other processes' local entries
+expire after the TTL, which bounds how stale they can be.
+
+Tokens expire AUTH_TOKEN_LIFETIME seconds after they were issued; `issue_token`
+replaces an expired token with a fresh one at login.
+
+`aauthenticate` does the same for async views, with the lookup on a cache miss
+made through the async ORM.
+"""
+import copy
+import datetime
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+CachedToken = namedtuple('CachedToken', ['user', 'created', 'cached_until'])
+
+
+def token_lifetime():
+    seconds = getattr(settings, 'AUTH_TOKEN_LIFETIME', None)
+    return datetime.timedelta(seconds=seconds) if seconds else None
+
+
+def token_expires_at(token_created):
+    lifetime = token_lifetime()
+    return token_created + lifetime if lifetime is not None else None
+
+
+def is_expired(token_created):
+    expires_at = token_expires_at(token_created)
+    return expires_at is not None and expires_at <= timezone.now()
+
+
+def issue_token(user):
+    # The user's current token, replaced by a new one if it has expired
+    token, created = Token.objects.get_or_create(user=user)
+    if not created and is_expired(token.created):
+        token.delete() # Invalidates cached entries through the post_delete signal
+        token = Token.objects.create(user=user)
+    return token
+
+
+class TokenCache:
+    """Thread-safe LRU map of token key -> CachedToken whose entries expire after `ttl` seconds."""
+
+    def __init__(self, max_size=10000, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._keys_by_user = {} # user id -> cached keys, so delete_user (on every User save) doesn't scan
+        self._lock = threading.Lock()
+
+    def _pop(self, key):
+        # Caller holds the lock
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._keys_by_user[entry.user.pk]
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[entry.user.pk]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.cached_until <= time.monotonic():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, user, created):
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = CachedToken(user, created, time.monotonic() + self.ttl)
+            self._keys_by_user.setdefault(user.pk, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._pop(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def delete_user(self, user_id):
+        with self._lock:
+            for key in self._keys_by_user.pop(user_id, ()):
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+
+token_cache = TokenCache(
+    max_size=getattr(settings, 'TOKEN_AUTH_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'TOKEN_AUTH_CACHE_TTL', 60),
+)
+
+
+def shared_cache():
+    alias = getattr(settings, 'TOKEN_AUTH_SHARED_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def _shared_key(key):
+    # Never use the raw token as a cache key
+    return 'auth-token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def invalidate_token(key):
+    token_cache.delete(key)
+    cache = shared_cache()
+    if cache is not None:
+        cache.delete(_shared_key(key))
+
+
+def invalidate_user(user_id):
+    token_cache.delete_user(user_id)
+    cache = shared_cache()
+    if cache is not None:
+        keys = Token.objects.filter(user_id=user_id).values_list('key', flat=True)
+        cache.delete_many([_shared_key(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        entry = token_cache.get(key)
+        if entry is None:
+            user, created = self.load_credentials(key)
+            token_cache.set(key, user, created)
+        else:
+            user, created = entry.user, entry.created
+        return self.check_credentials(key, user, created)
+
+    async def aauthenticate(self, request):
+        # Async counterpart of authenticate() for plain Django async views
+        key = self.get_key(request)
+        if key is None:
+            return None
+        entry = token_cache.get(key) # In-process map, never blocks on I/O
+        if entry is None:
+            user, created = await self.aload_credentials(key)
+            token_cache.set(key, user, created)
+        else:
+            user, created = entry.user, entry.created
+        return self.check_credentials(key, user, created)
+
+    def get_key(self, request):
+        # Token key from the Authorization header, parsed the same way as TokenAuthentication.authenticate()
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) == 1:
+            raise AuthenticationFailed(_('Invalid token header. No credentials provided.'))
+        if len(auth) > 2:
+            raise AuthenticationFailed(_('Invalid token header. Token string should not contain spaces.'))
+        try:
+            return auth[1].decode()
+        except UnicodeError:
+            raise AuthenticationFailed(_('Invalid token header. Token string should not contain invalid characters.'))
+
+    def check_credentials(self, key, user, created):
+        if is_expired(created):
+            raise AuthenticationFailed(_('Token has expired.'))
+        # Each request gets its own copy, so views can't mutate the cached instance
+        user = copy.copy(user)
+        return (user, Token(key=key, user=user, created=created))
+
+    def load_credentials(self, key):
+        cache = shared_cache()
+        if cache is not None:
+            cached = cache.get(_shared_key(key))
+            if cached is not None:
+                return cached
+
+        try:
+            token = Token.objects.select_related('user').get(key=key)
+        except Token.DoesNotExist:
+            raise AuthenticationFailed(_('Invalid token.'))
+        if not token.user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+
+        if cache is not None:
+            cache.set(_shared_key(key), (token.user, token.created), getattr(settings, 'TOKEN_AUTH_CACHE_TTL', 60))
+        return token.user, token.created
+
+    async def aload_credentials(self, key):
+        cache = shared_cache()
+        if cache is not None:
+            cached = await cache.aget(_shared_key(key))
+            if cached is not None:
+                return cached
+
+        try:
+            token = await Token.objects.select_related('user').aget(key=key)
+        except Token.DoesNotExist:
+            raise AuthenticationFailed(_('Invalid token.'))
+        if not token.user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+
+        if cache is not None:
+            await cache.aset(_shared_key(key), (token.user, token.created), getattr(settings, 'TOKEN_AUTH_CACHE_TTL', 60))
+        return token.user, token.created
@@ -0,0 +1,186 @@
+"""
+Profile picture pipeline.
+
+The registration and profile endpoints read uploads through
+`ProfilePictureUploadHandler`, which refuses the request with a 400 as soon as
+its file data passes PROFILE_PICTURE_MAX_BYTES (or its declared length can't fit
+a picture that size), so oversized uploads are neither buffered nor written to
+disk. Smaller uploads above FILE_UPLOAD_MAX_MEMORY_SIZE are streamed to a
+temporary file by Django, and `validate_profile_picture` rejects files over
+PROFILE_PICTURE_MAX_PIXELS from the image header, before anything is decoded.
+Once the upload is saved and committed, a background worker renders one square
+thumbnail per PROFILE_PICTURE_SIZES entry (WebP, or JPEG if Pillow lacks WebP
+support), re-encoded without EXIF or other metadata, and records their storage
+names in `User.profile_picture_variants`. Serializers expose those as
+size-specific URLs. The original upload is kept so sizes can be re-rendered with
+the process_profile_pictures command.
+"""
+import hashlib
+import io
+import logging
+import posixpath
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import FileUploadHandler
+from django.db import transaction
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageOps, features
+from rest_framework import exceptions
+
+from social_media_api.background import BatchWorker
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'profile_pics/variants'
+SAVE_OPTIONS = {
+    'WEBP': {'quality': 80, 'method': 4},
+    'JPEG': {'quality': 85, 'optimize': True, 'progressive': True},
+}
+
+
+def max_bytes():
+    return getattr(settings, 'PROFILE_PICTURE_MAX_BYTES', 5 * 1024 * 1024)
+
+
+def max_pixels():
+    return getattr(settings, 'PROFILE_PICTURE_MAX_PIXELS', 25_000_000)
+
+
+def sizes():
+    return getattr(settings, 'PROFILE_PICTURE_SIZES', {'small': 48, 'medium': 160, 'large': 480})
+
+
+def output_format():
+    fmt = getattr(settings, 'PROFILE_PICTURE_FORMAT', 'WEBP').upper()
+    if fmt == 'WEBP' and not features.check('webp'):
+        return 'JPEG'
+    return fmt
+
+
+def too_large_message():
+    return f'Profile pictures can be at most {filesizeformat(max_bytes())}.'
+
+
+class ProfilePictureUploadHandler(FileUploadHandler):
+    """First upload handler of the profile endpoints: stops reading a request once its file is too large."""
+
+    FORM_OVERHEAD = 64 * 1024 # Part headers and boundaries on top of the file and the other fields
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # Other fields are capped by DATA_UPLOAD_MAX_MEMORY_SIZE, so a longer body must carry a file over the limit
+        fields = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        if fields is not None and content_length > max_bytes() + fields + self.FORM_OVERHEAD:
+            self.reject()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > max_bytes():
+            self.reject()
+        return raw_data # Passed on to the handler that stores the file
+
+    def file_complete(self, file_size):
+        return None
+
+    def reject(self):
+        raise exceptions.ValidationError({'profile_picture': [too_large_message()]})
+
+
+def validate_profile_picture(file):
+    if file.size > max_bytes():
+        raise ValidationError(too_large_message())
+    # The image field has already opened the header; its dimensions are known without decoding the pixels
+    image = getattr(file, 'image', None)
+    if image is not None and image.width * image.height > max_pixels():
+        raise ValidationError(f'Profile pictures can be at most {max_pixels():,} pixels.')
+
+
+def render(image, size, fmt):
+    # Square crop around the centre, scaled down to `size`; a new image carries no EXIF, ICC or XMP data
+    thumbnail = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    thumbnail.save(buffer, fmt, **SAVE_OPTIONS.get(fmt, {}))
+    return buffer.getvalue()
+
+
+def render_variants(user_id, name):
+    fmt = output_format()
+    with default_storage.open(name) as source, Image.open(source) as image:
+        if image.width * image.height > max_pixels():
+            raise ValueError(f'{name} is {image.width}x{image.height}, over the pixel limit')
+        image = ImageOps.exif_transpose(image) # Apply the camera orientation before the EXIF is dropped
+        image = image.convert('RGBA' if fmt != 'JPEG' and image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+        token = hashlib.sha256(name.encode()).hexdigest()[:12] # New upload, new URLs: variants can be cached forever
+        variants = {}
+        for label, size in sizes().items():
+            path = posixpath.join(VARIANTS_DIR, str(user_id), f'{token}-{size}.{fmt.lower()}')
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            variants[label] = default_storage.save(path, ContentFile(render(image, size, fmt)))
+    return variants
+
+
+def process(user_id, name):
+    variants = render_variants(user_id, name)
+    previous = User.objects.filter(pk=user_id).values_list('profile_picture_variants', flat=True).first() or {}
+    # Only record them if the picture wasn't replaced meanwhile; otherwise the newer upload's job wins
+    if User.objects.filter(pk=user_id, profile_picture=name).update(profile_picture_variants=variants):
+        delete_files(set(previous.values()) - set(variants.values()))
+    else:
+        delete_files(variants.values())
+
+
+def delete_files(names):
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except OSError:
+            logger.warning('Could not delete profile picture variant %s', name)
+
+
+def process_batch(jobs):
+    # Jobs are (user_id, storage name); a user who uploaded twice in a batch only needs the last one
+    latest = dict(jobs)
+    for user_id, name in latest.items():
+        try:
+            process(user_id, name)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            logger.exception('Could not process profile picture %s of user %s', name, user_id)
+
+
+worker = BatchWorker(
+    process_batch,
+    name='profile-picture-worker',
+    batch_size=10, # Decoding is CPU-bound; keep batches short
+    flush_interval=0.1,
+)
+
+
+def dispatch(job):
+    if getattr(settings, 'PROFILE_PICTURE_PROCESSING_ASYNC', True):
+        worker.submit(job)
+    else:
+        process_batch([job])
+
+
+def schedule(user):
+    # Call after saving a new (or cleared) profile picture; variants are rendered once the transaction commits
+    if not user.profile_picture:
+        previous = user.profile_picture_variants
+        User.objects.filter(pk=user.pk).update(profile_picture_variants={})
+        user.profile_picture_variants = {}
+        transaction.on_commit(lambda: delete_files(previous.values()))
+        return
+    job = (user.pk, user.profile_picture.name)
+    transaction.on_commit(lambda: dispatch(job))
+
+
+def variant_urls(user, request=None):
+    # {label: url} for the rendered sizes; empty until the worker has processed the picture
+    urls = {}
+    for label, name in (user.profile_picture_variants or {}).items():
+        url = default_storage.url(name)
+        urls[label] = request.build_absolute_uri(url) if request is not None else url
+    return urls
@@ -0,0 +1,113 @@
+"""
+Per-user data export as NDJSON.
+
+One JSON object per line, each with a `type`: the user's profile, then their
+posts, comments, likes, the accounts they follow and that follow them, and
+their notifications. Every section is read with `.values()` (related names come
+from joins, so there are no per-row queries) and `.iterator(chunk_size=...)`, and
+lines are encoded as they are read. Nothing holds more than one chunk of rows
+and one output buffer, so memory use doesn't grow with the size of the account.
+`stream()` optionally gzips the output incrementally.
+
+Served by /api/accounts/export/ as a StreamingHttpResponse and written to a file
+by the export_user_data command. Django buffers synchronous streams under ASGI,
+so large accounts should be exported from WSGI workers or with the command.
+"""
+import json
+import zlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from notifications.models import Notification
+from notifications.read_state import with_read_state
+from posts.models import Comment, Like, Post
+from .graph import Follow
+
+BUFFER_SIZE = 64 * 1024 # Bytes collected before a chunk is handed to the response (or compressor)
+
+
+def default_chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+def sections(user):
+    # (record type, queryset of dicts, renamed keys), in export order; orderings follow the indexes used by the filters
+    return [
+        ('post', Post.objects.filter(author_id=user.pk).order_by('created_at', 'pk').values(
+            'id', 'title', 'content', 'created_at', 'updated_at', 'likes_count', 'comments_count',
+        ), {}),
+        ('comment', Comment.objects.filter(author_id=user.pk).order_by('pk').values(
+            'id', 'post_id', 'content', 'created_at', 'updated_at',
+        ), {}),
+        ('like', Like.objects.filter(user_id=user.pk).order_by('pk').values(
+            'post_id', 'post__title', 'created_at',
+        ), {'post__title': 'post_title'}),
+        # A follow row (from_user=B, to_user=A) means "A follows B"
+        ('following', Follow.objects.filter(to_user_id=user.pk).order_by('pk').values(
+            'from_user_id', 'from_user__username',
+        ), {'from_user_id': 'user_id', 'from_user__username': 'username'}),
+        ('follower', Follow.objects.filter(from_user_id=user.pk).order_by('pk').values(
+            'to_user_id', 'to_user__username',
+        ), {'to_user_id': 'user_id', 'to_user__username': 'username'}),
+        ('notification', with_read_state(Notification.objects.filter(recipient_id=user.pk)).order_by('timestamp', 'pk').values(
+            'id', 'actor_id', 'actor__username', 'actor_count', 'verb',
+            'content_type__app_label', 'content_type__model', 'object_id', 'timestamp', 'is_read',
+        ), {'actor__username': 'actor_username', 'object_id': 'target_id'}),
+    ]
+
+
+def profile(user):
+    return {
+        'type': 'user',
+        'id': user.pk,
+        'username': user.username,
+        'email': user.email,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'bio': user.bio,
+        'profile_picture': user.profile_picture.name if user.profile_picture else None,
+        'date_joined': user.date_joined,
+        'followers_count': user.followers_count,
+        'following_count': user.following_count,
+    }
+
+
+def records(user, chunk_size=None):
+    yield profile(user)
+    for record_type, queryset, renamed in sections(user):
+        for row in queryset.iterator(chunk_size=chunk_size or default_chunk_size()):
+            record = {'type': record_type}
+            for key, value in row.items():
+                record[renamed.get(key, key)] = value
+            if record_type == 'notification':
+                record['target_type'] = f"{record.pop('content_type__app_label')}.{record.pop('content_type__model')}"
+            yield record
+
+
+def lines(user, chunk_size=None):
+    # NDJSON, encoded and grouped into buffers of about BUFFER_SIZE bytes
+    buffer, size = [], 0
+    for record in records(user, chunk_size):
+        line = (json.dumps(record, cls=DjangoJSONEncoder) + '\n').encode()
+        buffer.append(line)
+        size += len(line)
+        if size >= BUFFER_SIZE:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def gzipped(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS) # 16 +: gzip header and trailer
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream(user, compress=False, chunk_size=None):
+    chunks = lines(user, chunk_size)
+    return gzipped(chunks) if compress else chunks
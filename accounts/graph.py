@@ -0,0 +1,88 @@
+"""
+Follow graph operations.
+
+Edges live in the auto-created `User.followers` through table, where a row
+(from_user=B, to_user=A) means "A follows B". Membership questions are answered
+with single indexed queries on that table instead of loading `following.all()`.
+Follow/unfollow are idempotent: the unique (from_user, to_user) constraint
+decides whether an edge was created, so concurrent requests can't double count.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+
+from posts import timeline
+from . import suggestions
+from .models import User
+
+Follow = User.followers.through
+
+
+def is_following(follower_id, followee_id):
+    return Follow.objects.filter(from_user_id=followee_id, to_user_id=follower_id).exists()
+
+
+def relationship(user_id, other_id):
+    # Both directions in one query
+    edges = set(Follow.objects.filter(
+        Q(from_user_id=other_id, to_user_id=user_id) | Q(from_user_id=user_id, to_user_id=other_id)
+    ).values_list('from_user_id', 'to_user_id'))
+    following = (other_id, user_id) in edges
+    followed_by = (user_id, other_id) in edges
+    return {'following': following, 'followed_by': followed_by, 'mutual': following and followed_by}
+
+
+def is_mutual(user_id, other_id):
+    return relationship(user_id, other_id)['mutual']
+
+
+def following_among(follower_id, user_ids):
+    # Which of the given users the follower follows
+    return set(Follow.objects.filter(to_user_id=follower_id, from_user_id__in=user_ids).values_list('from_user_id', flat=True))
+
+
+def _add_edge(follower_id, followee_id):
+    try:
+        with transaction.atomic():
+            Follow.objects.create(from_user_id=followee_id, to_user_id=follower_id)
+        return True
+    except IntegrityError: # Already following
+        return False
+
+
+def bulk_follow(follower, followees):
+    # Returns the users that were newly followed; existing edges are left alone
+    with transaction.atomic():
+        followed = [followee for followee in followees if followee.pk != follower.pk and _add_edge(follower.pk, followee.pk)]
+        if followed:
+            User.objects.filter(pk=follower.pk).update(following_count=F('following_count') + len(followed))
+            User.objects.filter(pk__in=[followee.pk for followee in followed]).update(followers_count=F('followers_count') + 1)
+            timeline.audience_changed([followee.pk for followee in followed], followed=True)
+            for followee in followed:
+                timeline.backfill(follower, followee)
+            suggestions.mark_stale(follower.pk, [followee.pk for followee in followed])
+    return followed
+
+
+def bulk_unfollow(follower, followees):
+    # Returns the users that were actually unfollowed
+    with transaction.atomic():
+        unfollowed = [
+            followee for followee in followees
+            if Follow.objects.filter(from_user_id=followee.pk, to_user_id=follower.pk).delete()[0]
+        ]
+        if unfollowed:
+            User.objects.filter(pk=follower.pk).update(following_count=F('following_count') - len(unfollowed))
+            User.objects.filter(pk__in=[followee.pk for followee in unfollowed]).update(followers_count=F('followers_count') - 1)
+            timeline.audience_changed([followee.pk for followee in unfollowed], followed=False)
+            for followee in unfollowed:
+                timeline.trim(follower, followee)
+            suggestions.mark_stale(follower.pk)
+    return unfollowed
+
+
+def follow(follower, followee):
+    return bool(bulk_follow(follower, [followee]))
+
+
+def unfollow(follower, followee):
+    return bool(bulk_unfollow(follower, [followee]))
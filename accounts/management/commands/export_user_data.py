@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts import export
+from accounts.models import User
+
+
+class Command(BaseCommand):
+    help = "Write a user's posts, comments, likes, follows and notifications as NDJSON (optionally gzipped)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--output', '-o', help='File to write (default: standard output).')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output.')
+        parser.add_argument('--chunk-size', type=int, help='Rows fetched per query (default: EXPORT_CHUNK_SIZE).')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['username']!r}.")
+        chunks = export.stream(user, compress=options['gzip'], chunk_size=options['chunk_size'])
+        if not options['output'] or options['output'] == '-':
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+        written = 0
+        with open(options['output'], 'wb') as output:
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+        self.stdout.write(self.style.SUCCESS(f'Exported {user.username} to {options["output"]} ({written} bytes).'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from accounts import avatars
+from accounts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Render profile picture thumbnails (e.g. for pictures uploaded before the pipeline, or after changing sizes).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Re-render every picture instead of only pictures without thumbnails.')
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='Only process this user id (repeatable).')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Users fetched per query.')
+
+    def handle(self, *args, **options):
+        users = User.objects.exclude(profile_picture='').exclude(profile_picture__isnull=True).order_by('pk')
+        if options['user_ids']:
+            users = users.filter(pk__in=options['user_ids'])
+        elif not options['all']:
+            users = users.filter(profile_picture_variants={})
+        processed = 0
+        batch = []
+        for job in users.values_list('pk', 'profile_picture').iterator(chunk_size=options['chunk_size']):
+            batch.append(job)
+            if len(batch) >= options['chunk_size']:
+                avatars.process_batch(batch)
+                processed += len(batch)
+                batch = []
+        avatars.process_batch(batch)
+        processed += len(batch)
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} profile pictures.'))
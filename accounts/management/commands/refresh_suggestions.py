@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from accounts import suggestions
+from accounts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Precompute "people you may know" suggestions from the follow graph.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Recompute every active user instead of only users whose follows changed.')
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='Only recompute this user id (repeatable).')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Users fetched per query.')
+
+    def handle(self, *args, **options):
+        if options['user_ids'] or options['all']:
+            users = User.objects.filter(is_active=True).order_by('pk').values_list('pk', flat=True)
+            if options['user_ids']:
+                users = users.filter(pk__in=options['user_ids'])
+            refreshed = 0
+            for user_id in users.iterator(chunk_size=options['chunk_size']):
+                suggestions.refresh_user(user_id)
+                refreshed += 1
+        else:
+            refreshed = suggestions.refresh_pending(batch_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Refreshed suggestions for {refreshed} users.'))
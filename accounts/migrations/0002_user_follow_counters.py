@@ -0,0 +1,38 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:53
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_follow_counters(apps, schema_editor):
+    User = apps.get_model('accounts', 'User')
+    Follow = User.followers.through # from_user is followed by to_user
+
+    def edges(column):
+        return Coalesce(Subquery(
+            Follow.objects.filter(**{column: OuterRef('pk')}).order_by().values(column).annotate(n=Count('pk')).values('n')
+        ), 0)
+
+    User.objects.update(followers_count=edges('from_user'), following_count=edges('to_user'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_follow_counters, migrations.RunPython.noop),
+    ]
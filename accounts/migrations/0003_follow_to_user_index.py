@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # The auto-created through table only has the (from_user, to_user) unique index;
+    # "whom does A follow" lookups start from to_user, so index that direction too.
+
+    dependencies = [
+        ('accounts', '0002_user_follow_counters'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX accounts_user_followers_to_from ON accounts_user_followers (to_user_id, from_user_id)',
+            'DROP INDEX accounts_user_followers_to_from',
+        ),
+    ]
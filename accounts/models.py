@@ -4,7 +4,34 @@ from django.contrib.auth.models import AbstractUser
 class User(AbstractUser):
     bio = models.TextField(blank=True)
     profile_picture = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
+    profile_picture_variants = models.JSONField(default=dict, blank=True, editable=False) # Size label -> storage name, written by accounts.avatars
     followers = models.ManyToManyField('self', symmetrical=False, related_name='following', blank=True)
+    # Denormalized sizes of the follow graph, maintained by the follow/unfollow views
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.username
+
+class FollowSuggestion(models.Model):
+    # Precomputed "people you may know" row: a second-degree candidate for the user, ranked by overlap
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='follow_suggestions')
+    candidate = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField() # Overlap weighted by how selective each shared follow is
+    mutual_count = models.PositiveIntegerField() # Number of people the user follows who follow the candidate
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'candidate')
+        ordering = ['-score']
+        indexes = [
+            models.Index(fields=['user', '-score'], name='accounts_suggestion_rank'),
+        ]
+
+    def __str__(self):
+        return f"Suggest {self.candidate_id} to {self.user_id} ({self.score:.2f})"
+
+class PendingSuggestionRefresh(models.Model):
+    # Users whose follow edges changed since their suggestions were computed
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    marked_at = models.DateTimeField(auto_now=True)
@@ -1,26 +1,50 @@
 # accounts/serializers.py
 from rest_framework import serializers
-from .models import User
+from .models import User, FollowSuggestion
+from .avatars import validate_profile_picture, variant_urls
 from django.contrib.auth import authenticate
 
+# extra_kwargs validators replace the model field's, so its own (the image extension check) are kept explicitly
+PROFILE_PICTURE_VALIDATORS = [*User._meta.get_field('profile_picture').validators, validate_profile_picture]
+
+class ProfilePictureUrlsField(serializers.ReadOnlyField):
+    # Size-specific avatar URLs ({'small': ..., 'medium': ..., 'large': ...}) so lists don't load the original upload
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, user):
+        return variant_urls(user, self.context.get('request'))
+
 class UserSerializer(serializers.ModelSerializer):
-    followers_usernames = serializers.SlugRelatedField(
-        many=True,
-        read_only=True,
-        slug_field='username',
-        source='followers' # Accesses users who follow this instance
-    )
-    following_usernames = serializers.SlugRelatedField(
-        many=True,
-        read_only=True,
-        slug_field='username',
-        source='following' # Accesses users this instance is following (via related_name)
-    )
-    
+    # Follower/following lists are served by the paginated /users/{id}/followers/ and /following/ endpoints;
+    # profiles only carry their denormalized sizes so the payload is the same for any audience
+    profile_picture_urls = ProfilePictureUrlsField()
+
+    class Meta:
+        model = User
+        fields = ('id', 'username', 'email', 'bio', 'profile_picture', 'profile_picture_urls', 'followers_count', 'following_count')
+        read_only_fields = ('followers_count', 'following_count',) # followers and following are managed separately
+        extra_kwargs = {'profile_picture': {'validators': PROFILE_PICTURE_VALIDATORS}}
+
+class UserSummarySerializer(serializers.ModelSerializer):
+    # Compact representation for user lists (followers, following)
+    profile_picture_urls = ProfilePictureUrlsField()
+
     class Meta:
         model = User
-        fields = ('id', 'username', 'email', 'bio', 'profile_picture', 'followers', 'following')
-        read_only_fields = ('followers_username', 'following_username',) # followers and following will be managed separately
+        fields = ('id', 'username', 'profile_picture', 'profile_picture_urls')
+
+class FollowSuggestionSerializer(serializers.ModelSerializer):
+    candidate = UserSummarySerializer(read_only=True)
+
+    class Meta:
+        model = FollowSuggestion
+        fields = ('candidate', 'score', 'mutual_count')
+
+class UserIdListSerializer(serializers.Serializer):
+    # Input for bulk follow-graph operations
+    user_ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=100)
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
@@ -28,6 +52,7 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('username', 'email', 'password', 'bio', 'profile_picture')
+        extra_kwargs = {'profile_picture': {'validators': PROFILE_PICTURE_VALIDATORS}}
 
     def create(self, validated_data):
         user = User.objects.create_user(
@@ -0,0 +1,83 @@
+"""
+"People you may know" suggestions.
+
+Candidates are second-degree follows: users followed by the people the user
+follows, excluding the user and anyone they already follow. Each shared follow
+contributes 1 / ln(2 + following_count) of the intermediate user, so overlap
+through selective accounts weighs more than overlap through accounts that
+follow everyone (Adamic-Adar). Results are precomputed into FollowSuggestion by
+a batch job; follow-graph changes mark users for an incremental refresh.
+
+When A follows or unfollows someone, A's candidates change, and so do those of
+everyone who follows A (A's follows are their second-degree candidates). Both are
+marked in one insert. For accounts with more than FOLLOW_SUGGESTIONS_STALE_FOLLOWERS
+followers only the newest ones are marked; the others catch up on the next
+`refresh_suggestions --all`.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Sum, Value
+from django.db.models.functions import Ln
+from django.utils import timezone
+
+from .models import FollowSuggestion, PendingSuggestionRefresh, User
+
+Follow = User.followers.through # from_user is followed by to_user
+
+MAX_SUGGESTIONS = getattr(settings, 'FOLLOW_SUGGESTIONS_PER_USER', 50)
+
+
+def compute_candidates(user_id, limit=MAX_SUGGESTIONS):
+    followed = Follow.objects.filter(to_user_id=user_id).values('from_user_id')
+    return (
+        Follow.objects.filter(to_user_id__in=followed, from_user__is_active=True)
+        .exclude(from_user_id=user_id)
+        .exclude(from_user_id__in=followed)
+        .values('from_user_id')
+        .annotate(
+            mutual_count=Count('pk'),
+            score=Sum(Value(1.0) / Ln(F('to_user__following_count') + 2), output_field=FloatField()),
+        )
+        .order_by('-score', '-mutual_count', 'from_user_id')[:limit]
+    )
+
+
+def refresh_user(user_id, limit=MAX_SUGGESTIONS):
+    started = timezone.now()
+    suggestions = [
+        FollowSuggestion(user_id=user_id, candidate_id=row['from_user_id'], score=row['score'], mutual_count=row['mutual_count'])
+        for row in compute_candidates(user_id, limit)
+    ]
+    with transaction.atomic():
+        FollowSuggestion.objects.filter(user_id=user_id).delete()
+        FollowSuggestion.objects.bulk_create(suggestions)
+        # A mark made while we were computing stays queued for the next pass
+        PendingSuggestionRefresh.objects.filter(user_id=user_id, marked_at__lte=started).delete()
+    return len(suggestions)
+
+
+def stale_followers_cap():
+    return getattr(settings, 'FOLLOW_SUGGESTIONS_STALE_FOLLOWERS', 1000)
+
+
+def mark_stale(user_id, followed_ids=()):
+    # Called when the user's follow edges change; newly followed users stop being suggested right away
+    if followed_ids:
+        FollowSuggestion.objects.filter(user_id=user_id, candidate_id__in=followed_ids).delete()
+    # The user's followers, newest first (served backwards by the from_user index), up to the cap
+    followers = Follow.objects.filter(from_user_id=user_id).order_by('-pk').values_list('to_user_id', flat=True)[:stale_followers_cap()]
+    PendingSuggestionRefresh.objects.bulk_create(
+        [PendingSuggestionRefresh(user_id=stale_id) for stale_id in [user_id, *followers]],
+        update_conflicts=True, unique_fields=['user'], update_fields=['marked_at'],
+    )
+
+
+def refresh_pending(batch_size=500):
+    # Incremental pass: recompute only users marked stale before this pass started
+    started = timezone.now()
+    pending = PendingSuggestionRefresh.objects.filter(marked_at__lte=started).order_by('user_id').values_list('user_id', flat=True)
+    refreshed = 0
+    for user_id in pending.iterator(chunk_size=batch_size):
+        refresh_user(user_id)
+        refreshed += 1
+    return refreshed
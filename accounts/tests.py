@@ -1,3 +1,423 @@
-from django.test import TestCase
+import datetime
+import gzip
+import io
+import json
+import math
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework import exceptions
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from notifications.models import Notification
+from posts.models import Comment, Like, Post
+from social_media_api.testing import QueryPlanMixin, requires_sqlite
+from . import avatars, graph, suggestions
+from .authentication import TokenCache, _shared_key, issue_token, shared_cache, token_cache
+from .avatars import ProfilePictureUploadHandler
+from .models import FollowSuggestion, PendingSuggestionRefresh, User
+
+
+# Every test class runs on a LocMemCache of its own, see posts/tests.py.
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'accounts-tests'}}
+
+# Query regression tests, see posts/tests.py.
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ExportQueryTestCase(QueryPlanMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice, cls.bob = [
+            User.objects.create_user(username=name, email=f'{name}@example.com', password='password')
+            for name in ('alice', 'bob')
+        ]
+        graph.follow(cls.alice, cls.bob)
+        graph.follow(cls.bob, cls.alice)
+        for i in range(10):
+            post = Post.objects.create(author=cls.alice, title=f'Post {i}', content='Some content')
+            Comment.objects.create(post=post, author=cls.alice, content='Nice')
+            Like.objects.create(user=cls.alice, post=post)
+            Notification.objects.create(recipient=cls.alice, actor=cls.bob, verb='liked', target=post)
+
+    def setUp(self):
+        self.client.force_authenticate(self.alice)
+
+    def export(self, query=''):
+        # Streamed responses run their queries while the body is consumed
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('user-export') + query)
+            content = b''.join(response.streaming_content)
+        return content, [entry['sql'] for entry in context.captured_queries]
+
+    def test_export_query_count(self):
+        # The user, then one query per section however many rows it has
+        content, queries = self.export()
+        self.assertEqual(len(queries), 7)
+        types = [json.loads(line)['type'] for line in content.splitlines()]
+        self.assertEqual(types.count('post'), 10)
+        self.assertEqual(types.count('notification'), 10)
+        self.assertEqual(types.count('following') + types.count('follower'), 2)
+
+    def test_export_gzip(self):
+        content, _ = self.export('?compress=gzip')
+        self.assertEqual(len(gzip.decompress(content).splitlines()), 1 + 10 * 4 + 2)
+
+    @requires_sqlite
+    def test_export_plan(self):
+        _, queries = self.export()
+        for sql in queries:
+            self.assertIndexedPlan(sql)
+
+
+@override_settings(CACHES=LOCAL_CACHE, NOTIFICATION_DISPATCH_ASYNC=False)
+class FollowGraphTestCase(APITestCase):
+    # Follow/unfollow through accounts.graph and the follow endpoints
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice, cls.bob, cls.carol, cls.dave = [
+            User.objects.create_user(username=name, email=f'{name}@example.com', password='password')
+            for name in ('alice', 'bob', 'carol', 'dave')
+        ]
+        graph.follow(cls.alice, cls.bob)
+
+    def setUp(self):
+        self.client.force_authenticate(self.alice)
+
+    def counts(self, *users):
+        # (following_count, followers_count) per user, as stored
+        counts = {pk: (following, followers) for pk, following, followers in User.objects.values_list('pk', 'following_count', 'followers_count')}
+        return [counts[user.pk] for user in users]
+
+    def test_bulk_follow(self):
+        followed = graph.bulk_follow(self.alice, [self.bob, self.alice, self.carol, self.dave, self.carol])
+        self.assertEqual(followed, [self.carol, self.dave]) # Not bob (already followed), herself, or carol twice
+        self.assertEqual(self.counts(self.alice, self.bob, self.carol, self.dave), [(3, 0), (0, 1), (0, 1), (0, 1)])
+        self.assertEqual(graph.bulk_follow(self.alice, [self.bob, self.carol]), [])
+        self.assertEqual(self.counts(self.alice, self.carol), [(3, 0), (0, 1)])
+
+    def test_bulk_unfollow(self):
+        graph.follow(self.alice, self.carol)
+        unfollowed = graph.bulk_unfollow(self.alice, [self.bob, self.dave, self.alice, self.bob])
+        self.assertEqual(unfollowed, [self.bob])
+        self.assertEqual(self.counts(self.alice, self.bob, self.carol), [(1, 0), (0, 0), (0, 1)])
+        self.assertFalse(graph.is_following(self.alice.pk, self.bob.pk))
+        self.assertTrue(graph.is_following(self.alice.pk, self.carol.pk))
+
+    def test_bulk_follow_endpoint(self):
+        missing = User.objects.latest('pk').pk + 1
+        with self.captureOnCommitCallbacks(execute=True): # Notifications are queued on commit
+            response = self.client.post(
+                reverse('bulk-follow'), {'user_ids': [self.bob.pk, self.carol.pk, self.alice.pk, missing]}, format='json',
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'followed': [self.carol.pk], 'already_following': [self.bob.pk], 'not_found': [missing]})
+        self.assertEqual(self.counts(self.alice, self.carol), [(2, 0), (0, 1)])
+        self.assertEqual(Notification.objects.filter(recipient=self.carol, actor=self.alice).count(), 1)
+        self.assertFalse(Notification.objects.filter(recipient=self.bob).exists()) # Not followed again
+
+    def test_bulk_unfollow_endpoint(self):
+        missing = User.objects.latest('pk').pk + 1
+        response = self.client.post(reverse('bulk-unfollow'), {'user_ids': [self.bob.pk, self.carol.pk, missing]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'unfollowed': [self.bob.pk], 'not_following': [self.carol.pk], 'not_found': [missing]})
+        self.assertEqual(self.counts(self.alice, self.bob), [(0, 0), (0, 0)])
+
+    def test_bulk_input_is_validated(self):
+        for user_ids in ([], ['bob'], [0], list(range(1, 102))):
+            response = self.client.post(reverse('bulk-follow'), {'user_ids': user_ids}, format='json')
+            self.assertEqual(response.status_code, 400)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.post(reverse('bulk-follow'), {'user_ids': [self.bob.pk]}, format='json').status_code, 401)
+
+    def test_single_follow_status_codes(self):
+        url = lambda name, user: reverse(name, kwargs={'pk': user.pk})
+        self.assertEqual(self.client.post(url('follow-user', self.carol)).status_code, 200)
+        self.assertEqual(self.client.post(url('follow-user', self.carol)).status_code, 409)
+        self.assertEqual(self.client.post(url('follow-user', self.alice)).status_code, 400)
+        self.assertEqual(self.client.post(reverse('follow-user', kwargs={'pk': User.objects.latest('pk').pk + 1})).status_code, 404)
+        self.assertEqual(self.client.post(url('unfollow-user', self.carol)).status_code, 200)
+        self.assertEqual(self.client.post(url('unfollow-user', self.carol)).status_code, 409)
+        self.assertEqual(self.client.post(url('unfollow-user', self.alice)).status_code, 400)
+        self.assertEqual(self.counts(self.alice, self.carol), [(1, 0), (0, 0)])
+
+    def walk(self, url):
+        # ids on every page of a follower/following list, two per page
+        pages = []
+        url += '?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([user['id'] for user in response.data['results']])
+            url = response.data['next']
+        return pages
+
+    def test_follower_and_following_lists(self):
+        for user in (self.carol, self.dave):
+            graph.follow(user, self.bob)
+        graph.follow(self.bob, self.dave)
+        self.client.force_authenticate(None) # Lists are public
+        followers = lambda user: self.walk(reverse('user-followers', kwargs={'pk': user.pk}))
+        following = lambda user: self.walk(reverse('user-following', kwargs={'pk': user.pk}))
+        self.assertEqual(followers(self.bob), [[self.dave.pk, self.carol.pk], [self.alice.pk]]) # Newest accounts first
+        self.assertEqual(following(self.bob), [[self.dave.pk]])
+        self.assertEqual(followers(self.dave), [[self.bob.pk]])
+        self.assertEqual(following(self.alice), [[self.bob.pk]])
+        self.assertEqual(followers(self.alice), [[]])
+        self.assertEqual(self.client.get(reverse('user-followers', kwargs={'pk': User.objects.latest('pk').pk + 1})).status_code, 404)
+
+    def test_profile_counters(self):
+        self.client.post(reverse('follow-user', kwargs={'pk': self.carol.pk}))
+        self.client.force_authenticate(self.carol)
+        self.client.post(reverse('follow-user', kwargs={'pk': self.alice.pk}))
+        self.client.force_authenticate(self.alice)
+        with self.assertNumQueries(1): # No follower or following lists
+            response = self.client.get(reverse('user-profile'))
+        self.assertEqual((response.data['following_count'], response.data['followers_count']), (2, 1))
+        self.assertNotIn('followers', response.data)
+        self.client.post(reverse('unfollow-user', kwargs={'pk': self.bob.pk}))
+        self.assertEqual(self.counts(self.alice, self.bob, self.carol), [(1, 1), (0, 0), (1, 1)])
+        response = self.client.patch(reverse('user-profile'), {'followers_count': 1000}, format='json')
+        self.assertEqual(response.data['followers_count'], 1) # Read-only
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class SuggestionTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice, cls.bob, cls.carol, cls.dave, cls.erin = [
+            User.objects.create_user(username=name, email=f'{name}@example.com', password='password')
+            for name in ('alice', 'bob', 'carol', 'dave', 'erin')
+        ]
+        graph.follow(cls.alice, cls.bob)
+        graph.follow(cls.alice, cls.carol)
+        graph.follow(cls.bob, cls.dave)
+        graph.follow(cls.bob, cls.alice)
+        graph.follow(cls.carol, cls.dave)
+        graph.follow(cls.carol, cls.erin)
+        graph.follow(cls.carol, cls.bob)
+        PendingSuggestionRefresh.objects.all().delete()
+
+    def candidates(self, user):
+        return {row['from_user_id']: row for row in suggestions.compute_candidates(user.pk)}
+
+    def test_candidates_are_second_degree(self):
+        # Not alice herself, nor bob, whom she already follows
+        candidates = self.candidates(self.alice)
+        self.assertEqual(list(candidates), [self.dave.pk, self.erin.pk])
+        self.assertEqual(candidates[self.dave.pk]['mutual_count'], 2)
+        # Each shared follow weighs 1 / ln(2 + following_count) of the user in between
+        self.assertAlmostEqual(candidates[self.dave.pk]['score'], 1 / math.log(2 + 2) + 1 / math.log(2 + 3))
+        self.assertAlmostEqual(candidates[self.erin.pk]['score'], 1 / math.log(2 + 3))
+
+    def test_follow_marks_follower_and_their_followers(self):
+        graph.follow(self.bob, self.erin)
+        # bob's follows are second-degree candidates of alice and carol, who follow him
+        self.assertEqual(
+            set(PendingSuggestionRefresh.objects.values_list('user_id', flat=True)),
+            {self.bob.pk, self.alice.pk, self.carol.pk},
+        )
+
+    @override_settings(FOLLOW_SUGGESTIONS_STALE_FOLLOWERS=1)
+    def test_marked_followers_are_capped(self):
+        graph.unfollow(self.bob, self.dave)
+        # Only the newest follower of bob (carol) is marked with him
+        self.assertEqual(set(PendingSuggestionRefresh.objects.values_list('user_id', flat=True)), {self.bob.pk, self.carol.pk})
+
+    def test_refresh_pending(self):
+        graph.follow(self.dave, self.erin)
+        self.assertEqual(suggestions.refresh_pending(), 3) # dave and his followers bob and carol
+        self.assertFalse(PendingSuggestionRefresh.objects.exists())
+        self.assertEqual(
+            list(FollowSuggestion.objects.filter(user=self.bob).values_list('candidate_id', flat=True)),
+            [self.erin.pk, self.carol.pk], # Through dave, who follows one account, then through alice
+        )
+        # Following a candidate drops it from the stored suggestions at once
+        graph.follow(self.bob, self.erin)
+        self.assertFalse(FollowSuggestion.objects.filter(user=self.bob, candidate=self.erin).exists())
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class TokenAuthenticationTestCase(APITestCase):
+    # Cached, expiring tokens (accounts.authentication)
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username='alice', email='alice@example.com', password='password')
+
+    def setUp(self):
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+        self.token = issue_token(self.alice)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def get_profile(self):
+        # The response and the number of queries it made on the token table
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('user-profile'))
+        return response, sum('authtoken_token' in query['sql'] for query in context.captured_queries)
+
+    def test_resolved_tokens_are_cached(self):
+        self.assertEqual(self.get_profile()[1], 1)
+        response, token_queries = self.get_profile()
+        self.assertEqual((response.status_code, token_queries), (200, 0))
+
+    def test_local_entries_expire(self):
+        cache = TokenCache(max_size=2, ttl=60)
+        with mock.patch('accounts.authentication.time.monotonic', return_value=1000.0):
+            cache.set('a', self.alice, self.token.created)
+            cache.set('b', self.alice, self.token.created)
+            cache.get('a')
+            cache.set('c', self.alice, self.token.created) # Evicts the least recently used, b
+            self.assertEqual([key for key in 'abc' if cache.get(key)], ['a', 'c'])
+        with mock.patch('accounts.authentication.time.monotonic', return_value=1060.0):
+            self.assertIsNone(cache.get('a'))
+
+    def test_delete_user(self):
+        bob = User.objects.create_user(username='bob', email='bob@example.com', password='password')
+        cache = TokenCache(max_size=3, ttl=60)
+        for key, user in (('a', self.alice), ('b', bob), ('c', self.alice), ('d', self.alice)): # a is evicted
+            cache.set(key, user, self.token.created)
+        cache.set('c', bob, self.token.created) # Now bob's
+        cache.delete_user(self.alice.pk)
+        self.assertEqual([key for key in 'abcd' if cache.get(key)], ['b', 'c'])
+        cache.delete_user(bob.pk)
+        self.assertEqual([key for key in 'abcd' if cache.get(key)], [])
+        cache.delete_user(bob.pk) # Nothing cached
+
+    def test_expired_tokens_are_rejected_and_replaced(self):
+        self.get_profile()
+        with override_settings(AUTH_TOKEN_LIFETIME=60):
+            Token.objects.filter(pk=self.token.pk).update(created=timezone.now() - datetime.timedelta(minutes=2))
+            token_cache.clear()
+            response = self.client.get(reverse('user-profile'))
+            self.assertEqual((response.status_code, str(response.data['detail'])), (401, 'Token has expired.'))
+            self.assertNotEqual(issue_token(self.alice).key, self.token.key)
+        self.assertEqual(self.client.get(reverse('user-profile')).status_code, 401) # The old key is gone
+
+    def test_deleted_token_is_invalidated(self):
+        self.get_profile()
+        self.token.delete()
+        self.assertEqual(self.client.get(reverse('user-profile')).status_code, 401)
+
+    def test_user_changes_are_invalidated(self):
+        self.get_profile()
+        self.alice.is_active = False
+        self.alice.save()
+        self.assertEqual(self.client.get(reverse('user-profile')).status_code, 401)
+
+    @override_settings(CACHES=LOCAL_CACHE, TOKEN_AUTH_SHARED_CACHE='default')
+    def test_shared_cache(self):
+        shared_cache().clear()
+        self.get_profile()
+        token_cache.clear() # As seen from another process
+        response, token_queries = self.get_profile()
+        self.assertEqual((response.status_code, token_queries), (200, 0))
+        shared_key = _shared_key(self.token.key)
+        self.alice.save()
+        self.assertIsNone(shared_cache().get(shared_key))
+        self.get_profile()
+        self.assertIsNotNone(shared_cache().get(shared_key))
+        self.token.delete()
+        self.assertIsNone(shared_cache().get(shared_key))
+
+
+def image_file(name='avatar.png', size=(300, 200), fmt='PNG', exif=None):
+    buffer = io.BytesIO()
+    options = {'exif': exif} if exif is not None else {}
+    Image.new('RGB', size, 'red').save(buffer, fmt, **options)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{fmt.lower()}')
+
+
+@override_settings(CACHES=LOCAL_CACHE, PROFILE_PICTURE_PROCESSING_ASYNC=False)
+class ProfilePictureTestCase(APITestCase):
+    # Upload limits and thumbnail rendering (accounts.avatars)
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username='alice', email='alice@example.com', password='password')
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.client.force_authenticate(self.alice)
+
+    def upload(self, file):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.patch(reverse('user-profile'), {'profile_picture': file}, format='multipart')
+
+    @override_settings(PROFILE_PICTURE_MAX_BYTES=1024)
+    def test_oversized_upload_is_refused_while_reading(self):
+        with mock.patch.object(TemporaryFileUploadHandler, 'receive_data_chunk') as stored, \
+                mock.patch.object(MemoryFileUploadHandler, 'receive_data_chunk') as buffered:
+            response = self.upload(image_file(size=(600, 600), fmt='BMP'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['profile_picture'], ['Profile pictures can be at most 1.0\xa0KB.'])
+        stored.assert_not_called()
+        buffered.assert_not_called()
+        self.assertFalse(User.objects.get(pk=self.alice.pk).profile_picture)
+
+    @override_settings(PROFILE_PICTURE_MAX_BYTES=1024, DATA_UPLOAD_MAX_MEMORY_SIZE=1024)
+    def test_oversized_request_is_refused_from_its_length(self):
+        handler = ProfilePictureUploadHandler()
+        with self.assertRaises(exceptions.ValidationError):
+            handler.handle_raw_input(None, {}, 2048 + handler.FORM_OVERHEAD + 1, b'boundary')
+        self.assertIsNone(handler.handle_raw_input(None, {}, 2048 + handler.FORM_OVERHEAD, b'boundary'))
+
+    @override_settings(PROFILE_PICTURE_MAX_PIXELS=1000)
+    def test_too_many_pixels(self):
+        response = self.upload(image_file())
+        self.assertEqual(response.data['profile_picture'], ['Profile pictures can be at most 1,000 pixels.'])
+
+    def test_model_validators_still_run(self):
+        response = self.upload(image_file('avatar.exe'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('File extension “exe” is not allowed.', response.data['profile_picture'][0])
+
+    @override_settings(PROFILE_PICTURE_SIZES={'small': 48, 'large': 160}, PROFILE_PICTURE_FORMAT='JPEG')
+    def test_variants(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6 # Orientation: rotate 90 degrees
+        exif[0x010F] = 'Camera maker'
+        self.assertEqual(self.upload(image_file('avatar.jpg', size=(300, 200), fmt='JPEG', exif=exif)).status_code, 200)
+        user = User.objects.get(pk=self.alice.pk)
+        self.assertEqual(set(user.profile_picture_variants), {'small', 'large'})
+        for label, size in (('small', 48), ('large', 160)):
+            with default_storage.open(user.profile_picture_variants[label]) as file, Image.open(file) as image:
+                self.assertEqual((image.format, image.size), ('JPEG', (size, size)))
+                self.assertFalse(image.getexif()) # Metadata is dropped
+        response = self.client.get(reverse('user-profile'))
+        self.assertEqual(set(response.data['profile_picture_urls']), {'small', 'large'})
+
+        # A new upload replaces the variants and deletes the old files
+        previous = user.profile_picture_variants
+        self.upload(image_file())
+        variants = User.objects.get(pk=self.alice.pk).profile_picture_variants
+        self.assertTrue(variants and not set(variants.values()) & set(previous.values()))
+        self.assertFalse(any(default_storage.exists(name) for name in previous.values()))
+
+    def test_stale_job_keeps_newer_variants(self):
+        self.upload(image_file())
+        user = User.objects.get(pk=self.alice.pk)
+        stale = default_storage.save('profile_pics/old.png', image_file())
+        avatars.process(self.alice.pk, stale) # Picture replaced before this job ran
+        self.assertEqual(User.objects.get(pk=self.alice.pk).profile_picture_variants, user.profile_picture_variants)
+        self.assertTrue(all(default_storage.exists(name) for name in user.profile_picture_variants.values()))
+
+    def test_clearing_the_picture_drops_variants(self):
+        self.upload(image_file())
+        variants = User.objects.get(pk=self.alice.pk).profile_picture_variants
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(reverse('user-profile'), {'profile_picture': ''}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(User.objects.get(pk=self.alice.pk).profile_picture_variants, {})
+        self.assertFalse(any(default_storage.exists(name) for name in variants.values()))
\ No newline at end of file
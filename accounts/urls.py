@@ -1,10 +1,18 @@
 from django.urls import path
-from .views import UserRegistrationView, UserLoginView, UserProfileView, UserFollowView, UserUnfollowView
+from .views import UserRegistrationView, UserLoginView, UserProfileView, UserFollowView, UserUnfollowView, UserFollowersListView, UserFollowingListView, UserRelationshipView, FollowingStatusView, BulkFollowView, BulkUnfollowView, FollowSuggestionListView, UserDataExportView
 
 urlpatterns = [
     path('register/', UserRegistrationView.as_view(), name='register'),
     path('login/', UserLoginView.as_view(), name='login'),
     path('profile/', UserProfileView.as_view(), name='user-profile'),
+    path('export/', UserDataExportView.as_view(), name='user-export'), # Streamed NDJSON of the user's data
     path('users/<int:pk>/follow/', UserFollowView.as_view(), name='follow-user'),
     path('users/<int:pk>/unfollow/', UserUnfollowView.as_view(), name='unfollow-user'),
+    path('users/<int:pk>/relationship/', UserRelationshipView.as_view(), name='user-relationship'),
+    path('users/following_status/', FollowingStatusView.as_view(), name='following-status'),
+    path('users/bulk_follow/', BulkFollowView.as_view(), name='bulk-follow'),
+    path('users/bulk_unfollow/', BulkUnfollowView.as_view(), name='bulk-unfollow'),
+    path('users/<int:pk>/followers/', UserFollowersListView.as_view(), name='user-followers'),
+    path('users/<int:pk>/following/', UserFollowingListView.as_view(), name='user-following'),
+    path('suggestions/', FollowSuggestionListView.as_view(), name='follow-suggestions'),
 ]
\ No newline at end of file
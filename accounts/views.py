@@ -1,16 +1,26 @@
 from rest_framework import generics, status
 from rest_framework.response import Response
-from rest_framework.authtoken.models import Token
 from django.contrib.contenttypes.models import ContentType
 from rest_framework.authtoken.views import ObtainAuthToken
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
 from rest_framework.views import APIView
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from .serializers import UserRegistrationSerializer, UserLoginSerializer, UserSerializer
-from .models import User
-from notifications.models import Notification
-
-class UserRegistrationView(generics.CreateAPIView):
+from django.utils import timezone
+from .serializers import UserRegistrationSerializer, UserLoginSerializer, UserSerializer, UserSummarySerializer, UserIdListSerializer, FollowSuggestionSerializer
+from .models import User, FollowSuggestion
+from . import avatars, export, graph
+from .authentication import issue_token, token_expires_at
+from notifications.dispatch import notify
+from posts.pagination import KeysetPagination
+
+class ProfilePictureUploadMixin:
+    def initialize_request(self, request, *args, **kwargs):
+        # Oversized profile pictures are refused while the body is read, see accounts.avatars
+        request.upload_handlers.insert(0, avatars.ProfilePictureUploadHandler(request))
+        return super().initialize_request(request, *args, **kwargs)
+
+class UserRegistrationView(ProfilePictureUploadMixin, generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = UserRegistrationSerializer
 
@@ -18,10 +28,13 @@ class UserRegistrationView(generics.CreateAPIView):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = serializer.save()
-        token, created = Token.objects.get_or_create(user=user)
+        if user.profile_picture:
+            avatars.schedule(user) # Thumbnails are rendered off the request
+        token = issue_token(user)
         return Response({
             "user": UserSerializer(user).data,
-            "token": token.key
+            "token": token.key,
+            "expires_at": token_expires_at(token.created)
         }, status=status.HTTP_201_CREATED)
 
 class UserLoginView(ObtainAuthToken):
@@ -32,20 +45,27 @@ class UserLoginView(ObtainAuthToken):
                                            context={'request': request})
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data['user']
-        token, created = Token.objects.get_or_create(user=user)
+        token = issue_token(user) # Expired tokens are replaced with a new one
         return Response({
             'token': token.key,
+            'expires_at': token_expires_at(token.created),
             'user_id': user.pk,
             'email': user.email
         })
 
-class UserProfileView(generics.RetrieveUpdateAPIView):
+class UserProfileView(ProfilePictureUploadMixin, generics.RetrieveUpdateAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
+        # request.user may come from the token cache; profiles show current counters
+        return User.objects.get(pk=self.request.user.pk)
+
+    def perform_update(self, serializer):
+        user = serializer.save()
+        if 'profile_picture' in serializer.validated_data:
+            avatars.schedule(user) # New or cleared picture: re-render (or drop) the thumbnails off the request
 
     def put(self, request, *args, **kwargs):
         partial = kwargs.pop('partial', False)
@@ -71,13 +91,10 @@ class UserFollowView(APIView):
         if current_user == user_to_follow:
             return Response({"detail": "You cannot follow yourself."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Add user_to_follow to the current_user's 'following' list.
-        # 'following' is the related_name for the reverse relationship of 'followers' field on User model.
-        if user_to_follow not in current_user.following.all():
-            current_user.following.add(user_to_follow)
-
-            # Create notification for the user who was followed
-            Notification.objects.create(
+        # Add the edge atomically; the follow graph updates counters and the follower's timeline
+        if graph.follow(current_user, user_to_follow):
+            # Queue a notification for the user who was followed
+            notify(
                 recipient=user_to_follow, # User being followed receives notification
                 actor=current_user, # User who initiated the follow
                 verb='followed you',
@@ -99,9 +116,112 @@ class UserUnfollowView(APIView):
         if current_user == user_to_unfollow:
             return Response({"detail": "You cannot unfollow yourself."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Remove user_to_unfollow from the current_user's 'following' list.
-        if user_to_unfollow in current_user.following.all():
-            current_user.following.remove(user_to_unfollow)
+        # Remove the edge atomically; the follow graph updates counters and trims the follower's timeline
+        if graph.unfollow(current_user, user_to_unfollow):
             return Response({"detail": f"You have unfollowed {user_to_unfollow.username}."}, status=status.HTTP_200_OK)
         else:
-            return Response({"detail": f"You are not following {user_to_unfollow.username}."}, status=status.HTTP_409_CONFLICT) # 409 Conflict if not following
\ No newline at end of file
+            return Response({"detail": f"You are not following {user_to_unfollow.username}."}, status=status.HTTP_409_CONFLICT) # 409 Conflict if not following
+
+class UserRelationshipView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk, format=None):
+        # Follow state between the current user and another user, in both directions
+        get_object_or_404(User.objects.only('pk'), pk=pk)
+        return Response(graph.relationship(request.user.pk, pk), status=status.HTTP_200_OK)
+
+class FollowingStatusView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, format=None):
+        # Which of the given users the current user follows, in one query
+        serializer = UserIdListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user_ids = serializer.validated_data['user_ids']
+        following = graph.following_among(request.user.pk, user_ids)
+        return Response({"following": {str(user_id): user_id in following for user_id in user_ids}}, status=status.HTTP_200_OK)
+
+class BulkFollowView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, format=None):
+        # Follow many users at once (e.g. onboarding); already-followed users are left alone
+        serializer = UserIdListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user_ids = [user_id for user_id in serializer.validated_data['user_ids'] if user_id != request.user.pk]
+        users = list(User.objects.filter(pk__in=user_ids))
+
+        followed = graph.bulk_follow(request.user, users)
+        for user in followed:
+            notify(recipient=user, actor=request.user, verb='followed you', target=request.user)
+
+        followed_ids = {user.pk for user in followed}
+        found_ids = {user.pk for user in users}
+        return Response({
+            "followed": sorted(followed_ids),
+            "already_following": sorted(found_ids - followed_ids),
+            "not_found": sorted(set(user_ids) - found_ids),
+        }, status=status.HTTP_200_OK)
+
+class BulkUnfollowView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, format=None):
+        # Unfollow many users at once; users that weren't followed are reported back
+        serializer = UserIdListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user_ids = serializer.validated_data['user_ids']
+        users = list(User.objects.filter(pk__in=user_ids))
+
+        unfollowed_ids = {user.pk for user in graph.bulk_unfollow(request.user, users)}
+        found_ids = {user.pk for user in users}
+        return Response({
+            "unfollowed": sorted(unfollowed_ids),
+            "not_following": sorted(found_ids - unfollowed_ids),
+            "not_found": sorted(set(user_ids) - found_ids),
+        }, status=status.HTTP_200_OK)
+
+class UserFollowersListView(generics.ListAPIView):
+    serializer_class = UserSummarySerializer
+    permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination # Keyset pagination on id; cost doesn't grow with the audience
+
+    def get_queryset(self):
+        # Users who follow the given user
+        user = get_object_or_404(User.objects.only('pk'), pk=self.kwargs['pk'])
+        return User.objects.filter(following=user).order_by('-id')
+
+class UserFollowingListView(generics.ListAPIView):
+    serializer_class = UserSummarySerializer
+    permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        # Users the given user follows
+        user = get_object_or_404(User.objects.only('pk'), pk=self.kwargs['pk'])
+        return User.objects.filter(followers=user).order_by('-id')
+
+class FollowSuggestionListView(generics.ListAPIView):
+    serializer_class = FollowSuggestionSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination # Keyset pagination on (score, id)
+
+    def get_queryset(self):
+        # Served from the precomputed table (see the refresh_suggestions command), best candidates first
+        return FollowSuggestion.objects.filter(user=self.request.user).select_related('candidate').order_by('-score')
+
+class UserDataExportView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, format=None):
+        # The user's own data as streamed NDJSON (see accounts.export); ?compress=gzip for a .ndjson.gz download
+        compress = request.query_params.get('compress') == 'gzip'
+        user = User.objects.get(pk=request.user.pk) # request.user may come from the token cache; export current counters
+        filename = f"export-{user.username}-{timezone.now():%Y%m%d}.ndjson" + ('.gz' if compress else '')
+        response = StreamingHttpResponse(
+            export.stream(user, compress=compress),
+            content_type='application/gzip' if compress else 'application/x-ndjson',
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['Cache-Control'] = 'private, no-store'
+        return response
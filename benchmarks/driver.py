@@ -0,0 +1,215 @@
+"""
+In-process benchmark driver.
+
+Replays a weighted mix of requests as benchmark users (see benchmarks.seed)
+through Django's test client, so the full middleware, auth, view and database
+path is measured without a network hop. `run()` drives the WSGI handler from
+one thread per concurrent client; `run_async()` drives the ASGI handler with one
+task per client. Both return a report with throughput and latency percentiles
+per operation, ready to be saved as JSON and compared with `compare()`.
+"""
+import asyncio
+import datetime
+import math
+import random
+import subprocess
+import threading
+import time
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.db import connection
+from django.test import AsyncClient, Client
+from rest_framework.authtoken.models import Token
+
+from accounts.models import User
+from posts.models import Post
+from .seed import USERNAME_PREFIX
+
+DEFAULT_MIX = {'feed': 40, 'posts': 20, 'like': 15, 'follow': 5, 'notifications': 20}
+
+# Name -> (method, url template, expected statuses). Templates are filled from the sampled ids.
+OPERATIONS = {
+    'feed': ('get', '/api/feed/', {200}),
+    'posts': ('get', '/api/posts/', {200}),
+    'trending': ('get', '/api/posts/trending/', {200}),
+    'like': ('post', '/api/posts/{post_id}/like/', {201, 409}), # 409: already liked
+    'like_put': ('put', '/api/posts/{post_id}/like/', {200}), # Idempotent like
+    'follow': ('post', '/api/accounts/users/{user_id}/follow/', {200, 400, 409}), # 400: drew themselves, 409: already following
+    'notifications': ('get', '/api/notifications/', {200}),
+    'feed_async': ('get', '/api/feed/async/', {200}), # Async views; compare against feed/notifications with --asgi
+    'notifications_async': ('get', '/api/notifications/async/', {200}),
+}
+
+Sample = namedtuple('Sample', ['operation', 'status', 'seconds'])
+
+
+def parse_mix(value):
+    # "feed=40,posts=20" -> {'feed': 40, 'posts': 20}
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f'Unknown operation {name!r}; choose from {", ".join(OPERATIONS)}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+def git_revision():
+    try:
+        result = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+class Workload:
+    """Seeded stream of (operation, method, path, token) requests drawn from the mix."""
+
+    def __init__(self, mix=None, seed=0, max_users=1000):
+        self.mix = mix or DEFAULT_MIX
+        self.rng = random.Random(seed)
+        users = list(User.objects.filter(username__startswith=USERNAME_PREFIX).order_by('pk').values_list('pk', flat=True)[:max_users])
+        if not users:
+            raise ValueError('No benchmark users found; run the seed_benchmark command first.')
+        existing = dict(Token.objects.filter(user_id__in=users).values_list('user_id', 'key'))
+        Token.objects.bulk_create([Token(user_id=pk, key=Token.generate_key()) for pk in users if pk not in existing])
+        self.tokens = dict(Token.objects.filter(user_id__in=users).values_list('user_id', 'key'))
+        self.user_ids = users
+        self.post_ids = list(Post.objects.filter(author_id__in=users).values_list('pk', flat=True)) or [0]
+        self.names = list(self.mix)
+        self.weights = [self.mix[name] for name in self.names]
+        self._lock = threading.Lock()
+
+    def next_request(self):
+        with self._lock: # Shared between client threads; keeps the sequence reproducible for one client
+            name = self.rng.choices(self.names, self.weights)[0]
+            user_id = self.rng.choice(self.user_ids)
+            target = {'user_id': self.rng.choice(self.user_ids), 'post_id': self.rng.choice(self.post_ids)}
+        method, template, _ = OPERATIONS[name]
+        return name, method, template.format(**target), self.tokens[user_id]
+
+
+def _headers(token):
+    return {'Authorization': f'Token {token}'}
+
+
+def _client_headers():
+    # The test client sends Host: testserver, which is only allowed inside the test runner.
+    # Use a configured host instead (localhost is always allowed while DEBUG is on).
+    hosts = [host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')]
+    return {'Host': hosts[0] if hosts else 'localhost'}
+
+
+def _client_worker(workload, count, samples):
+    client = Client(headers=_client_headers(), raise_request_exception=False) # Errors are counted, not raised
+    try:
+        for _ in range(count):
+            name, method, path, token = workload.next_request()
+            started = time.perf_counter()
+            response = getattr(client, method)(path, headers=_headers(token))
+            samples.append(Sample(name, response.status_code, time.perf_counter() - started))
+    finally:
+        connection.close() # Each client thread has its own connection
+
+
+def _split(total, parts):
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+
+def run(workload, requests=1000, concurrency=1, warmup=50):
+    if warmup:
+        _client_worker(workload, warmup, [])
+    samples = []
+    threads = [
+        threading.Thread(target=_client_worker, args=(workload, count, samples))
+        for count in _split(requests, concurrency)
+    ]
+    started = time.perf_counter()
+    if concurrency == 1:
+        threads[0].run() # Stay on this thread (and its database connection)
+    else:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return report(samples, time.perf_counter() - started, mode='wsgi', concurrency=concurrency)
+
+
+async def _async_client_worker(workload, count, samples):
+    client = AsyncClient(headers=_client_headers(), raise_request_exception=False)
+    for _ in range(count):
+        name, method, path, token = workload.next_request()
+        started = time.perf_counter()
+        response = await getattr(client, method)(path, headers=_headers(token))
+        samples.append(Sample(name, response.status_code, time.perf_counter() - started))
+
+
+async def _run_async(workload, requests, concurrency, warmup):
+    if warmup:
+        await _async_client_worker(workload, warmup, [])
+    samples = []
+    started = time.perf_counter()
+    await asyncio.gather(*[_async_client_worker(workload, count, samples) for count in _split(requests, concurrency)])
+    return samples, time.perf_counter() - started
+
+
+def run_async(workload, requests=1000, concurrency=1, warmup=50):
+    samples, elapsed = asyncio.run(_run_async(workload, requests, concurrency, warmup))
+    return report(samples, elapsed, mode='asgi', concurrency=concurrency)
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(sample.seconds * 1000 for sample in samples)
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for sample in samples if sample.status not in OPERATIONS[sample.operation][2]),
+        'statuses': {str(status): count for status, count in sorted(Counter(sample.status for sample in samples).items())},
+        'throughput': len(samples) / elapsed if elapsed else None, # Requests per second of wall time
+        'mean_ms': sum(latencies) / len(latencies) if latencies else None,
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'max_ms': latencies[-1] if latencies else None,
+    }
+
+
+def report(samples, elapsed, mode, concurrency):
+    by_operation = {}
+    for sample in samples:
+        by_operation.setdefault(sample.operation, []).append(sample)
+    return {
+        'recorded_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'git_revision': git_revision(),
+        'mode': mode,
+        'concurrency': concurrency,
+        'database': connection.vendor,
+        'debug': settings.DEBUG, # DEBUG keeps a query log per request; compare like with like
+        'elapsed_seconds': elapsed,
+        'total': summarize(samples, elapsed),
+        'operations': {name: summarize(group, elapsed) for name, group in sorted(by_operation.items())},
+    }
+
+
+def compare(baseline, current):
+    # Rows of (operation, metric, baseline, current, relative change) for the headline metrics
+    rows = []
+    names = ['total'] + sorted(set(baseline['operations']) | set(current['operations']))
+    for name in names:
+        before = baseline['total'] if name == 'total' else baseline['operations'].get(name)
+        after = current['total'] if name == 'total' else current['operations'].get(name)
+        if not before or not after:
+            continue
+        for metric in ('throughput', 'p50_ms', 'p95_ms', 'p99_ms'):
+            old, new = before.get(metric), after.get(metric)
+            change = (new - old) / old if old and new is not None else None
+            rows.append((name, metric, old, new, change))
+    return rows
@@ -0,0 +1,70 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks import driver
+from notifications.dispatch import dispatcher
+
+
+class Command(BaseCommand):
+    help = 'Replay a request mix against the API in-process and report throughput and latency percentiles per operation.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help='Number of measured requests.')
+        parser.add_argument('--warmup', type=int, default=50, help='Requests sent before measuring.')
+        parser.add_argument('--concurrency', type=int, default=1, help='Concurrent clients (threads, or tasks with --asgi).')
+        parser.add_argument('--mix', default=','.join(f'{name}={weight}' for name, weight in driver.DEFAULT_MIX.items()),
+                            help='Weighted request mix, e.g. "feed=40,posts=20,like=15,follow=5,notifications=20".')
+        parser.add_argument('--asgi', action='store_true', help='Drive the ASGI handler instead of WSGI.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the request sequence.')
+        parser.add_argument('--output', help='Where to write the JSON results (default: benchmark_results/<time>-<revision>.json).')
+        parser.add_argument('--compare', help='A previous JSON result to compare this run with.')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--requests and --concurrency must be positive.')
+        try:
+            workload = driver.Workload(driver.parse_mix(options['mix']), seed=options['seed'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        run = driver.run_async if options['asgi'] else driver.run
+        results = run(workload, requests=options['requests'], concurrency=options['concurrency'], warmup=options['warmup'])
+        dispatcher.flush() # Don't leave queued notifications behind
+        results['options'] = {name: options[name] for name in ('requests', 'warmup', 'concurrency', 'mix', 'asgi', 'seed')}
+
+        self.print_results(results)
+        path = Path(options['output']) if options['output'] else self.default_output(results)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(results, indent=2))
+        self.stdout.write(self.style.SUCCESS(f'Results written to {path}'))
+
+        if options['compare']:
+            try:
+                baseline = json.loads(Path(options['compare']).read_text())
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Could not read {options["compare"]}: {e}')
+            self.print_comparison(driver.compare(baseline, results))
+
+    def default_output(self, results):
+        stamp = results['recorded_at'][:19].replace(':', '').replace('-', '')
+        revision = (results['git_revision'] or 'unknown')[:10]
+        return Path(settings.BASE_DIR) / 'benchmark_results' / f'{stamp}-{revision}.json'
+
+    def print_results(self, results):
+        self.stdout.write(f"{results['mode'].upper()}, concurrency {results['concurrency']}, {results['elapsed_seconds']:.2f}s")
+        self.stdout.write(f"{'operation':<15}{'requests':>9}{'errors':>8}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+        rows = list(results['operations'].items()) + [('total', results['total'])]
+        for name, stats in rows:
+            self.stdout.write(
+                f"{name:<15}{stats['requests']:>9}{stats['errors']:>8}{stats['throughput']:>10.1f}"
+                f"{stats['p50_ms']:>9.2f}{stats['p95_ms']:>9.2f}{stats['p99_ms']:>9.2f}"
+            )
+
+    def print_comparison(self, rows):
+        self.stdout.write(f"{'operation':<15}{'metric':<12}{'baseline':>10}{'current':>10}{'change':>9}")
+        for name, metric, old, new, change in rows:
+            change = f'{change:+.1%}' if change is not None else '-'
+            self.stdout.write(f'{name:<15}{metric:<12}{old or 0:>10.2f}{new or 0:>10.2f}{change:>9}')
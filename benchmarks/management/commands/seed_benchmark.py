@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from benchmarks import seed
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic power-law social graph (users, follows, posts, comments, likes, notifications) for benchmarks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Number of benchmark users.')
+        parser.add_argument('--avg-following', type=int, default=50, help='Average number of users each user follows.')
+        parser.add_argument('--avg-posts', type=int, default=10, help='Average number of posts per user.')
+        parser.add_argument('--avg-comments', type=int, default=2, help='Average number of comments per post.')
+        parser.add_argument('--avg-likes', type=int, default=5, help='Average number of likes per post.')
+        parser.add_argument('--alpha', type=float, default=1.0, help='Power-law exponent of follower popularity.')
+        parser.add_argument('--days', type=int, default=30, help='Posts are spread over this many past days.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same options give the same graph.')
+        parser.add_argument('--clear', action='store_true', help='Only delete existing benchmark users and their data.')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted = seed.clear()
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} benchmark rows.'))
+            return
+
+        generator = seed.GraphGenerator(
+            users=options['users'], avg_following=options['avg_following'], avg_posts=options['avg_posts'],
+            avg_comments=options['avg_comments'], avg_likes=options['avg_likes'], alpha=options['alpha'],
+            days=options['days'], seed=options['seed'],
+        )
+        counts = seed.seed(generator, stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS('Seeded ' + ', '.join(f'{count} {name}' for name, count in counts.items()) + '.'))
@@ -0,0 +1,194 @@
+"""
+Synthetic social graph for benchmarks.
+
+Popularity follows a power law: users are ranked and the chance of being
+followed is proportional to 1 / rank**alpha, while how many users someone
+follows (and how much they post) is Pareto distributed. A handful of accounts
+end up with a large share of all followers, as on real networks. Everything is
+generated from a seeded random.Random, so a given set of options always yields
+the same graph. Benchmark users are prefixed with USERNAME_PREFIX; seeding
+replaces any previous benchmark graph and leaves other users alone.
+"""
+import datetime
+import random
+from bisect import bisect_left
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import User
+from notifications.models import Notification
+from posts.models import Post, Comment, Like
+
+Follow = User.followers.through # from_user is followed by to_user
+
+USERNAME_PREFIX = 'bench_'
+PASSWORD = 'benchmark'
+BATCH_SIZE = 1000
+
+
+def clear():
+    # Posts, likes, comments, notifications and follow edges go with the users (CASCADE)
+    return User.objects.filter(username__startswith=USERNAME_PREFIX).delete()[0]
+
+
+def _pareto(rng, mean, cap):
+    # Heavy-tailed count with the given mean (Pareto with alpha=2 has mean 2)
+    return min(cap, int(rng.paretovariate(2) * mean / 2))
+
+
+class GraphGenerator:
+    def __init__(self, users=1000, avg_following=50, avg_posts=10, avg_comments=2, avg_likes=5,
+                 alpha=1.0, days=30, seed=0):
+        self.num_users = users
+        self.avg_following = avg_following
+        self.avg_posts = avg_posts
+        self.avg_comments = avg_comments
+        self.avg_likes = avg_likes
+        self.alpha = alpha
+        self.days = days
+        self.rng = random.Random(seed)
+
+    def follow_edges(self):
+        # (follower index, followee index) pairs, followees drawn by popularity rank
+        ranks = list(range(self.num_users))
+        self.rng.shuffle(ranks) # ranks[i] is the popularity rank of user i
+        by_rank = sorted(range(self.num_users), key=ranks.__getitem__)
+        cumulative = list(accumulate(1 / (rank + 1) ** self.alpha for rank in range(self.num_users)))
+        total = cumulative[-1]
+
+        edges = set()
+        for follower in range(self.num_users):
+            wanted = _pareto(self.rng, self.avg_following, self.num_users - 1)
+            followees = set()
+            for _ in range(wanted * 3): # Popular accounts get drawn repeatedly; give up after a few misses
+                if len(followees) >= wanted:
+                    break
+                followee = by_rank[min(bisect_left(cumulative, self.rng.random() * total), self.num_users - 1)]
+                if followee != follower:
+                    followees.add(followee)
+            edges.update((follower, followee) for followee in followees)
+        return edges
+
+    def post_authors(self):
+        # Author index of every post, in chronological order
+        authors = [author for author in range(self.num_users) for _ in range(_pareto(self.rng, self.avg_posts, self.avg_posts * 20))]
+        self.rng.shuffle(authors)
+        return authors
+
+    def post_times(self, count):
+        now = timezone.now()
+        span = datetime.timedelta(days=self.days).total_seconds()
+        return sorted(now - datetime.timedelta(seconds=self.rng.random() * span) for _ in range(count))
+
+    def comments(self, num_posts):
+        # (post index, commenter index) pairs
+        return [
+            (self.rng.randrange(num_posts), self.rng.randrange(self.num_users))
+            for _ in range(num_posts * self.avg_comments)
+        ]
+
+    def likes(self, num_posts):
+        # Distinct (post index, user index) pairs
+        return {
+            (self.rng.randrange(num_posts), self.rng.randrange(self.num_users))
+            for _ in range(num_posts * self.avg_likes)
+        }
+
+
+def seed(generator, stdout=None):
+    """Write the generated graph and rebuild everything derived from it; returns row counts."""
+    def log(message):
+        if stdout is not None:
+            stdout.write(message)
+
+    edges = generator.follow_edges()
+    authors = generator.post_authors()
+    comments = generator.comments(len(authors)) if authors else []
+    likes = generator.likes(len(authors)) if authors else set()
+
+    followers_count = [0] * generator.num_users
+    following_count = [0] * generator.num_users
+    for follower, followee in edges:
+        following_count[follower] += 1
+        followers_count[followee] += 1
+    likes_count = [0] * len(authors)
+    comments_count = [0] * len(authors)
+    for post, _ in likes:
+        likes_count[post] += 1
+    for post, _ in comments:
+        comments_count[post] += 1
+
+    with transaction.atomic():
+        clear()
+        password = make_password(PASSWORD) # Hashed once; every benchmark user shares it
+        # Primary keys come back from bulk_create (SQLite and PostgreSQL), so rows can be linked by index
+        users = User.objects.bulk_create([
+            User(
+                username=f'{USERNAME_PREFIX}{i}', email=f'{USERNAME_PREFIX}{i}@example.com', password=password,
+                followers_count=followers_count[i], following_count=following_count[i],
+            )
+            for i in range(generator.num_users)
+        ], batch_size=BATCH_SIZE)
+        log(f'Created {len(users)} users.')
+
+        Follow.objects.bulk_create([
+            Follow(from_user_id=users[followee].pk, to_user_id=users[follower].pk) for follower, followee in edges
+        ], batch_size=BATCH_SIZE)
+        log(f'Created {len(edges)} follow edges.')
+
+        posts = Post.objects.bulk_create([
+            Post(author_id=users[author].pk, title=f'Post {i}', content=f'Benchmark post {i} by {users[author].username}',
+                 likes_count=likes_count[i], comments_count=comments_count[i])
+            for i, author in enumerate(authors)
+        ], batch_size=BATCH_SIZE)
+        # auto_now_add stamps every post with "now"; spread them over the configured window instead
+        for post, created_at in zip(posts, generator.post_times(len(posts))):
+            post.created_at = created_at
+        Post.objects.bulk_update(posts, ['created_at'], batch_size=BATCH_SIZE)
+        log(f'Created {len(posts)} posts.')
+
+        new_comments = Comment.objects.bulk_create([
+            Comment(post_id=posts[post].pk, author_id=users[author].pk, content='Benchmark comment')
+            for post, author in comments
+        ], batch_size=BATCH_SIZE)
+        Like.objects.bulk_create([
+            Like(post_id=posts[post].pk, user_id=users[user].pk) for post, user in likes
+        ], batch_size=BATCH_SIZE)
+        log(f'Created {len(new_comments)} comments and {len(likes)} likes.')
+
+        # The notifications those actions would have produced
+        post_type = ContentType.objects.get_for_model(Post)
+        comment_type = ContentType.objects.get_for_model(Comment)
+        user_type = ContentType.objects.get_for_model(User)
+        notifications = [
+            Notification(recipient_id=users[followee].pk, actor_id=users[follower].pk, verb='followed you',
+                         content_type=user_type, object_id=users[follower].pk)
+            for follower, followee in edges
+        ]
+        notifications += [
+            Notification(recipient_id=posts[post].author_id, actor_id=users[user].pk, verb='liked',
+                         content_type=post_type, object_id=posts[post].pk)
+            for post, user in likes if posts[post].author_id != users[user].pk
+        ]
+        notifications += [
+            Notification(recipient_id=posts[post].author_id, actor_id=comment.author_id, verb='commented on',
+                         content_type=comment_type, object_id=comment.pk)
+            for (post, _), comment in zip(comments, new_comments) if posts[post].author_id != comment.author_id
+        ]
+        Notification.objects.bulk_create(notifications, batch_size=BATCH_SIZE)
+        log(f'Created {len(notifications)} notifications.')
+
+    # Derived state the write paths normally maintain
+    for command in ('rebuild_timelines', 'rebuild_search_index', 'reconcile_unread_counts'):
+        call_command(command, stdout=stdout)
+    call_command('refresh_suggestions', '--all', stdout=stdout)
+
+    return {
+        'users': len(users), 'follows': len(edges), 'posts': len(posts),
+        'comments': len(new_comments), 'likes': len(likes), 'notifications': len(notifications),
+    }
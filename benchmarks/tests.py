@@ -0,0 +1,92 @@
+import io
+import json
+import tempfile
+from collections import Counter
+from pathlib import Path
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from accounts.models import User
+from posts.models import Like, Post
+from . import driver
+from .seed import USERNAME_PREFIX, Follow, GraphGenerator, seed
+
+
+# Every test class runs on a LocMemCache of its own, see posts/tests.py.
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmarks-tests'}}
+
+SMALL_GRAPH = {'users': 40, 'avg_following': 6, 'avg_posts': 3, 'avg_comments': 1, 'avg_likes': 2, 'seed': 1}
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class GraphGeneratorTestCase(TestCase):
+    def test_seeded_graphs_repeat(self):
+        self.assertEqual(GraphGenerator(**SMALL_GRAPH).follow_edges(), GraphGenerator(**SMALL_GRAPH).follow_edges())
+        self.assertNotEqual(GraphGenerator(**SMALL_GRAPH).follow_edges(), GraphGenerator(**{**SMALL_GRAPH, 'seed': 2}).follow_edges())
+
+    def test_popularity_is_skewed(self):
+        edges = GraphGenerator(users=500, avg_following=20, seed=0).follow_edges()
+        self.assertFalse(any(follower == followee for follower, followee in edges))
+        followers = sorted(Counter(followee for _, followee in edges).values(), reverse=True)
+        self.assertGreater(sum(followers[:10]), len(edges) / 5) # The top 2% of accounts get over a fifth of the follows
+
+
+@override_settings(CACHES=LOCAL_CACHE, LIKE_BUFFERING=False, NOTIFICATION_DISPATCH_ASYNC=False)
+class BenchmarkTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.other = User.objects.create_user(username='alice', email='alice@example.com', password='password')
+        cls.counts = seed(GraphGenerator(**SMALL_GRAPH), stdout=io.StringIO())
+
+    def setUp(self):
+        cache.clear()
+
+    def test_seed(self):
+        users = User.objects.filter(username__startswith=USERNAME_PREFIX)
+        self.assertEqual(users.count(), self.counts['users'])
+        self.assertEqual(Follow.objects.count(), self.counts['follows'])
+        self.assertEqual((Post.objects.count(), Like.objects.count()), (self.counts['posts'], self.counts['likes']))
+        # Stored counters agree with the rows
+        user = max(users, key=lambda user: user.followers_count)
+        self.assertEqual(Follow.objects.filter(from_user=user).count(), user.followers_count)
+        # Seeding again replaces the benchmark graph and leaves other users alone
+        self.assertEqual(seed(GraphGenerator(**SMALL_GRAPH), stdout=io.StringIO()), self.counts)
+        self.assertEqual(users.count(), self.counts['users'])
+        self.assertTrue(User.objects.filter(pk=self.other.pk).exists())
+
+    def test_workload_repeats(self):
+        first, second = driver.Workload(seed=3), driver.Workload(seed=3)
+        self.assertEqual([first.next_request() for _ in range(20)], [second.next_request() for _ in range(20)])
+        with self.assertRaises(ValueError):
+            driver.parse_mix('feed=1,teleport=2')
+        self.assertEqual(driver.parse_mix('feed=40, posts'), {'feed': 40.0, 'posts': 1.0})
+
+    def test_run(self):
+        workload = driver.Workload(driver.parse_mix('feed=1,posts=1,like=1,follow=1,notifications=1'), seed=0)
+        results = driver.run(workload, requests=25, warmup=0)
+        self.assertEqual((results['mode'], results['total']['requests'], results['total']['errors']), ('wsgi', 25, 0))
+        self.assertEqual(sum(stats['requests'] for stats in results['operations'].values()), 25)
+        self.assertLessEqual(results['total']['p50_ms'], results['total']['p99_ms'])
+
+    def test_command_and_comparison(self):
+        with tempfile.TemporaryDirectory() as directory:
+            baseline, out = Path(directory) / 'baseline.json', io.StringIO()
+            call_command('run_benchmark', requests=10, warmup=0, mix='posts=1', output=str(baseline), stdout=io.StringIO())
+            self.assertEqual(json.loads(baseline.read_text())['options']['requests'], 10)
+            call_command('run_benchmark', requests=10, warmup=0, mix='posts=1', output=str(Path(directory) / 'current.json'),
+                         compare=str(baseline), stdout=out)
+        self.assertIn('throughput', out.getvalue()) # The comparison table
+
+    def test_compare(self):
+        baseline = {'total': {'throughput': 100.0, 'p50_ms': 10.0, 'p95_ms': 20.0, 'p99_ms': 40.0}, 'operations': {}}
+        current = {'total': {'throughput': 120.0, 'p50_ms': 5.0, 'p95_ms': 20.0, 'p99_ms': None}, 'operations': {}}
+        self.assertEqual(driver.compare(baseline, current), [
+            ('total', 'throughput', 100.0, 120.0, 0.2),
+            ('total', 'p50_ms', 10.0, 5.0, -0.5),
+            ('total', 'p95_ms', 20.0, 20.0, 0.0),
+            ('total', 'p99_ms', 40.0, None, None),
+        ])
+        self.assertEqual(driver.percentile([1, 2, 3, 4], 0.5), 2)
+        self.assertIsNone(driver.percentile([], 0.5))
@@ -0,0 +1,26 @@
+"""
+Async variants of the notification list and unread count, served at
+/api/notifications/async/ and /api/notifications/unread_count/async/.
+
+Same data and cursors as the sync views; see social_media_api.async_api.
+"""
+from social_media_api.async_api import async_api_view
+from posts.pagination import KeysetPagination
+from .counters import aget_unread_count
+from .models import Notification
+from .read_state import with_read_state
+from .serializers import NotificationSerializer, with_targets
+
+
+@async_api_view
+async def notification_list(request):
+    queryset = with_read_state(with_targets(Notification.objects.filter(recipient=request.user))).order_by('-timestamp')
+    paginator = KeysetPagination()
+    page = await paginator.apaginate_queryset(queryset, request) # Targets are prefetched per page
+    data = NotificationSerializer(page, many=True, context={'request': request}).data
+    return paginator.get_paginated_response(data).data
+
+
+@async_api_view
+async def unread_count(request):
+    return {"unread_count": await aget_unread_count(request.user.pk)}
@@ -0,0 +1,61 @@
+"""
+Per-user unread notification counters.
+
+The badge count is read from a single UnreadNotificationCounter row instead of a
+COUNT over the recipient's notifications. Writers adjust it with F() expressions;
+a missing row is (re)built from the table on first use. What counts as unread is
+defined by the read watermark and individual reads (see notifications.read_state).
+"""
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.db.models.functions import Greatest
+
+from .models import Notification, NotificationRead, NotificationReadCursor, UnreadNotificationCounter
+
+
+def get_watermark(user_id):
+    return NotificationReadCursor.objects.filter(user_id=user_id).values_list('last_read_id', flat=True).first() or 0
+
+
+def count_unread(user_id):
+    # Source of truth for the counter: notifications above the watermark that weren't read individually
+    return Notification.objects.filter(recipient_id=user_id, pk__gt=get_watermark(user_id)).exclude(
+        Exists(NotificationRead.objects.filter(notification_id=OuterRef('pk'))),
+    ).count()
+
+
+def reconcile_unread(user_id):
+    count = count_unread(user_id)
+    UnreadNotificationCounter.objects.update_or_create(user_id=user_id, defaults={'count': count})
+    return count
+
+
+def get_unread_count(user_id):
+    count = UnreadNotificationCounter.objects.filter(user_id=user_id).values_list('count', flat=True).first()
+    if count is None:
+        with transaction.atomic():
+            count = reconcile_unread(user_id)
+    return count
+
+
+async def aget_unread_count(user_id):
+    count = await UnreadNotificationCounter.objects.filter(user_id=user_id).values_list('count', flat=True).afirst()
+    if count is None:
+        count = await sync_to_async(get_unread_count)(user_id) # Rebuilding the row needs a transaction, which is sync-only
+    return count
+
+
+def increment_unread(counts):
+    # counts: {user_id: number of new unread notifications}
+    for user_id, n in counts.items():
+        if not n:
+            continue
+        updated = UnreadNotificationCounter.objects.filter(user_id=user_id).update(count=F('count') + n)
+        if not updated:
+            reconcile_unread(user_id) # First counter write for this user; the new rows are already counted
+
+
+def decrement_unread(user_id, n):
+    if n:
+        UnreadNotificationCounter.objects.filter(user_id=user_id).update(count=Greatest(F('count') - n, 0))
@@ -0,0 +1,145 @@
+"""
+Notification dispatch.
+
+Views call `notify()` instead of creating Notification rows inline. The event is
+queued once the surrounding transaction commits and a background worker writes
+queued events in batches. Bursts of coalescible events (likes on the same post)
+are folded into a single row per recipient and target, either within a batch or
+into the recipient's existing unread notification, and counted in `actor_count`.
+The actors of coalesced notifications are recorded in NotificationActor, so an
+actor who comes back (unlike and like again) isn't counted twice.
+Written notifications are then published to recipients with a live stream.
+"""
+import logging
+
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from social_media_api.background import BatchWorker
+from .counters import increment_unread
+from .models import Notification, NotificationActor
+from .read_state import with_read_state
+from .pubsub import get_pubsub
+from .serializers import NotificationSerializer, with_targets
+
+logger = logging.getLogger(__name__)
+
+COALESCED_VERBS = {'liked'}
+
+NotificationEvent = namedtuple('NotificationEvent', ['recipient_id', 'actor_id', 'verb', 'content_type_id', 'object_id'])
+
+
+def write_notifications(events):
+    # Group events: coalescible verbs by (recipient, verb, target), everything else is kept per actor
+    groups = {}
+    for event in events:
+        key = (event.recipient_id, event.verb, event.content_type_id, event.object_id)
+        if event.verb not in COALESCED_VERBS:
+            key += (event.actor_id,)
+        groups.setdefault(key, []).append(event.actor_id)
+
+    with transaction.atomic():
+        existing = _existing_unread(key for key in groups if key[1] in COALESCED_VERBS)
+        counted = set(NotificationActor.objects.filter(
+            notification_id__in=[notification.pk for notification in existing.values()],
+        ).values_list('notification_id', 'actor_id'))
+        now = timezone.now()
+        new_rows = []
+        new_actors = [] # (notification, actor ids) to record once new rows have their ids
+        actor_rows = []
+        updated_ids = []
+        for key, actor_ids in groups.items():
+            recipient_id, verb, content_type_id, object_id = key[:4]
+            latest_actor_id = actor_ids[-1]
+            notification = existing.get(key)
+            if notification is not None:
+                added = {actor_id for actor_id in actor_ids if (notification.pk, actor_id) not in counted}
+                Notification.objects.filter(pk=notification.pk).update(
+                    actor_id=latest_actor_id, actor_count=F('actor_count') + len(added), timestamp=now,
+                )
+                actor_rows += [NotificationActor(notification_id=notification.pk, actor_id=actor_id) for actor_id in added]
+                updated_ids.append(notification.pk)
+            else:
+                notification = Notification(
+                    recipient_id=recipient_id, actor_id=latest_actor_id, verb=verb,
+                    content_type_id=content_type_id, object_id=object_id, actor_count=len(set(actor_ids)),
+                )
+                new_rows.append(notification)
+                if verb in COALESCED_VERBS:
+                    new_actors.append((notification, set(actor_ids)))
+        Notification.objects.bulk_create(new_rows)
+        actor_rows += [
+            NotificationActor(notification_id=notification.pk, actor_id=actor_id)
+            for notification, actor_ids in new_actors for actor_id in actor_ids
+        ]
+        NotificationActor.objects.bulk_create(actor_rows, ignore_conflicts=True)
+        # Coalesced rows were already unread; only new rows move the badge counters
+        increment_unread(Counter(row.recipient_id for row in new_rows))
+
+    publish_notifications([row.pk for row in new_rows] + updated_ids, {key[0] for key in groups})
+    return new_rows
+
+
+def publish_notifications(notification_ids, recipient_ids):
+    # Push freshly written notifications to recipients that have a stream open
+    try:
+        pubsub = get_pubsub()
+        listening = pubsub.subscribed(recipient_ids)
+        if not listening:
+            return
+        notifications = with_targets(Notification.objects.filter(pk__in=notification_ids, recipient_id__in=listening))
+        for notification in notifications:
+            pubsub.publish(notification.recipient_id, NotificationSerializer(notification).data)
+    except Exception:
+        logger.exception('Failed to publish %d notifications', len(notification_ids))
+
+
+def _existing_unread(keys):
+    # Unread notifications that new coalescible events can be folded into, keyed like the event groups
+    by_target = {}
+    for recipient_id, verb, content_type_id, object_id in keys:
+        by_target.setdefault((verb, content_type_id), (set(), set()))
+        by_target[(verb, content_type_id)][0].add(object_id)
+        by_target[(verb, content_type_id)][1].add(recipient_id)
+
+    existing = {}
+    for (verb, content_type_id), (object_ids, recipient_ids) in by_target.items():
+        candidates = with_read_state(Notification.objects.filter(
+            verb=verb, content_type_id=content_type_id,
+            object_id__in=object_ids, recipient_id__in=recipient_ids,
+        )).filter(is_read=False).order_by('timestamp')
+        for notification in candidates:
+            existing[(notification.recipient_id, verb, content_type_id, notification.object_id)] = notification
+    return existing
+
+
+dispatcher = BatchWorker(
+    write_notifications,
+    name='notification-dispatcher',
+    batch_size=getattr(settings, 'NOTIFICATION_BATCH_SIZE', 500),
+    flush_interval=getattr(settings, 'NOTIFICATION_FLUSH_INTERVAL', 1.0),
+)
+
+
+def dispatch(event):
+    if getattr(settings, 'NOTIFICATION_DISPATCH_ASYNC', True):
+        dispatcher.submit(event)
+    else:
+        write_notifications([event])
+
+
+def notify(recipient, actor, verb, target):
+    # Queue a notification for delivery once the current transaction commits
+    event = NotificationEvent(
+        recipient_id=recipient.pk,
+        actor_id=actor.pk,
+        verb=verb,
+        content_type_id=ContentType.objects.get_for_model(target).pk,
+        object_id=target.pk,
+    )
+    transaction.on_commit(lambda: dispatch(event))
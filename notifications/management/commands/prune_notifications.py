@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from notifications import retention
+
+
+class Command(BaseCommand):
+    help = 'Delete expired notifications, after archiving them to NDJSON or folding them into digests.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=retention.MODES,
+                            help='What to keep of expired rows (default: NOTIFICATION_RETENTION_MODE). Ignored when resuming.')
+        parser.add_argument('--batch-size', type=int, help='Rows per transaction (default: NOTIFICATION_RETENTION_BATCH_SIZE).')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches; the next run resumes.')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches.')
+        parser.add_argument('--restart', action='store_true', help='Abandon an unfinished run and start over with new cutoffs.')
+
+    def handle(self, *args, **options):
+        checkpoint = retention.run(
+            mode=options['mode'],
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches'],
+            restart=options['restart'],
+            pause=options['pause'],
+        )
+        status = 'Finished' if checkpoint.phase == 'done' else 'Paused (run again to resume)'
+        message = f'{status}: {checkpoint.processed} notifications removed in {checkpoint.mode} mode'
+        if checkpoint.archive_path:
+            message += f', archived to {checkpoint.archive_path}'
+        self.stdout.write(self.style.SUCCESS(message + '.'))
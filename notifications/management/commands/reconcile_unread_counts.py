@@ -0,0 +1,25 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from notifications.counters import reconcile_unread
+
+
+class Command(BaseCommand):
+    help = 'Recompute per-user unread notification counters from the notifications table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='Only reconcile this user id (repeatable).')
+
+    def handle(self, *args, **options):
+        user_ids = get_user_model().objects.order_by('pk').values_list('pk', flat=True)
+        if options['user_ids']:
+            user_ids = user_ids.filter(pk__in=options['user_ids'])
+
+        reconciled = 0
+        for user_id in user_ids.iterator(chunk_size=1000):
+            with transaction.atomic():
+                reconcile_unread(user_id)
+            reconciled += 1
+        self.stdout.write(self.style.SUCCESS(f'Reconciled unread counters for {reconciled} users.'))
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('notifications', '0004_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationDigest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('verb', models.CharField(max_length=255)),
+                ('notification_count', models.PositiveIntegerField(default=0)),
+                ('actor_count', models.PositiveIntegerField(default=0)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('first_timestamp', models.DateTimeField()),
+                ('last_timestamp', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RetentionCheckpoint',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('mode', models.CharField(max_length=10)),
+                ('read_cutoff', models.DateTimeField()),
+                ('unread_cutoff', models.DateTimeField()),
+                ('phase', models.CharField(default='all', max_length=10)),
+                ('position_timestamp', models.DateTimeField(blank=True, null=True)),
+                ('position_id', models.BigIntegerField(blank=True, null=True)),
+                ('archive_path', models.CharField(blank=True, max_length=500)),
+                ('archive_offset', models.BigIntegerField(default=0)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['is_read', 'timestamp'], name='notif_retention'),
+        ),
+        migrations.AddField(
+            model_name='notificationdigest',
+            name='recipient',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notification_digests', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='notificationdigest',
+            unique_together={('recipient', 'verb')},
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max, Min, Q
+
+
+def copy_read_flags(apps, schema_editor):
+    # Each user's watermark starts below their oldest unread notification (or at their newest if all are read);
+    # only read notifications above it become individual reads.
+    Notification = apps.get_model('notifications', 'Notification')
+    NotificationRead = apps.get_model('notifications', 'NotificationRead')
+    NotificationReadCursor = apps.get_model('notifications', 'NotificationReadCursor')
+    watermarks = {}
+    for row in Notification.objects.values('recipient_id').annotate(latest=Max('pk'), first_unread=Min('pk', filter=Q(is_read=False))).order_by():
+        watermarks[row['recipient_id']] = row['latest'] if row['first_unread'] is None else row['first_unread'] - 1
+    NotificationReadCursor.objects.bulk_create(
+        [NotificationReadCursor(user_id=user_id, last_read_id=watermark) for user_id, watermark in watermarks.items() if watermark],
+        batch_size=2000,
+    )
+    read = Notification.objects.filter(is_read=True).values_list('pk', 'recipient_id')
+    NotificationRead.objects.bulk_create(
+        (
+            NotificationRead(notification_id=pk, user_id=recipient_id)
+            for pk, recipient_id in read.iterator(chunk_size=2000) if pk > watermarks[recipient_id]
+        ),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_profile_picture_variants'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('notifications', '0005_retention'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationRead',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('read_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='NotificationReadCursor',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notification_read_cursor', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('last_read_id', models.BigIntegerField(default=0)),
+                ('last_read_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='notificationread',
+            name='notification',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='read_mark', to='notifications.notification'),
+        ),
+        migrations.AddField(
+            model_name='notificationread',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='notificationread',
+            index=models.Index(fields=['user', 'notification'], name='notif_read_user'),
+        ),
+        # Read flags become watermarks, plus individual reads for what was read above them
+        migrations.RunPython(copy_read_flags, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='notification',
+            name='notif_recipient_unread_recent',
+        ),
+        migrations.RemoveIndex(
+            model_name='notification',
+            name='notif_retention',
+        ),
+        migrations.RemoveField(
+            model_name='notification',
+            name='is_read',
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['timestamp'], name='notif_retention'),
+        ),
+    ]
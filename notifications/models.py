@@ -11,10 +11,93 @@ class Notification(models.Model):
     object_id = models.PositiveIntegerField()
     target = GenericForeignKey('content_type', 'object_id')
     timestamp = models.DateTimeField(auto_now_add=True)# Timestamp of when the notification was created
-    is_read = models.BooleanField(default=False)# Boolean to track if the notification has been read
+    actor_count = models.PositiveIntegerField(default=1)# Distinct actors coalesced into this notification ("alice and 41 others liked ...")
 
     class Meta:
         ordering = ['-timestamp'] # Order by newest first
+        # Whether a notification was read is derived from NotificationReadCursor and NotificationRead (see notifications.read_state)
+        indexes = [
+            # A user's notifications newest first
+            models.Index(fields=['recipient', 'timestamp'], name='notif_recipient_recent'),
+            # Oldest notifications first (retention)
+            models.Index(fields=['timestamp'], name='notif_retention'),
+        ]
 
     def __str__(self):
         return f"{self.actor.username} {self.verb} {self.target} (to {self.recipient.username})"
+
+class NotificationActor(models.Model):
+    # Distinct actors folded into a coalesced notification, so a repeat actor (like, unlike, like again) isn't counted twice
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='+')
+    actor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        unique_together = ('notification', 'actor')
+
+    def __str__(self):
+        return f"User {self.actor_id} in notification {self.notification_id}"
+
+class NotificationReadCursor(models.Model):
+    # Read watermark: every notification of the user with an id up to last_read_id has been read
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='notification_read_cursor')
+    last_read_id = models.BigIntegerField(default=0)
+    last_read_at = models.DateTimeField(null=True, blank=True) # When the watermark last moved
+
+    def __str__(self):
+        return f"User {self.user_id} read up to {self.last_read_id}"
+
+class NotificationRead(models.Model):
+    # Notification read on its own above its recipient's watermark; dropped once the watermark passes it
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    notification = models.OneToOneField(Notification, on_delete=models.CASCADE, related_name='read_mark')
+    read_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'notification'], name='notif_read_user'),
+        ]
+
+    def __str__(self):
+        return f"User {self.user_id} read notification {self.notification_id}"
+
+class UnreadNotificationCounter(models.Model):
+    # Per-user unread badge count, maintained alongside notification writes and reads
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='unread_notification_counter')
+    count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.count} unread for user {self.user_id}"
+
+class NotificationDigest(models.Model):
+    # Summary of a recipient's expired notifications, kept when retention compacts them instead of archiving
+    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notification_digests')
+    verb = models.CharField(max_length=255)
+    notification_count = models.PositiveIntegerField(default=0) # Notifications folded into this row
+    actor_count = models.PositiveIntegerField(default=0) # Sum of their actor counts
+    unread_count = models.PositiveIntegerField(default=0) # Of which never read
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('recipient', 'verb')
+
+    def __str__(self):
+        return f"{self.notification_count} '{self.verb}' notifications for user {self.recipient_id}"
+
+class RetentionCheckpoint(models.Model):
+    # Progress of a retention run, committed with every batch so an interrupted run resumes where it stopped
+    name = models.CharField(max_length=50, primary_key=True)
+    mode = models.CharField(max_length=10)
+    read_cutoff = models.DateTimeField()
+    unread_cutoff = models.DateTimeField()
+    phase = models.CharField(max_length=10, default='all') # 'all', 'between', then 'done' (see notifications.retention)
+    position_timestamp = models.DateTimeField(null=True, blank=True) # Last processed (timestamp, id) of the phase
+    position_id = models.BigIntegerField(null=True, blank=True)
+    archive_path = models.CharField(max_length=500, blank=True)
+    archive_offset = models.BigIntegerField(default=0) # Bytes of the archive covered by committed batches
+    processed = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.processed} processed, phase {self.phase}"
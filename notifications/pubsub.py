@@ -0,0 +1,80 @@
+"""
+Pub/sub used to push new notifications to connected streaming clients.
+
+The backend is chosen with the NOTIFICATION_PUBSUB_BACKEND setting. The default
+LocalPubSub keeps per-user asyncio queues in this process: publishers may run in
+any thread (e.g. the notification dispatcher), subscribers are coroutines on the
+ASGI event loop, so idle connections cost a queue rather than a thread each.
+"""
+import asyncio
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_BACKEND = 'notifications.pubsub.LocalPubSub'
+
+
+class LocalSubscription:
+    def __init__(self, broker, user_id, max_queue):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=max_queue)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def deliver(self, message):
+        # Called from the publishing thread; hand the message over to the subscriber's event loop
+        self.loop.call_soon_threadsafe(self._put, message)
+
+    def _put(self, message):
+        if self.queue.full():
+            self.queue.get_nowait() # Slow consumer: drop the oldest message, the client can resume by id
+        self.queue.put_nowait(message)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalPubSub:
+    def __init__(self, max_queue=100):
+        self.max_queue = max_queue
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        # Must be called from a running event loop
+        subscription = LocalSubscription(self, user_id, self.max_queue)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def subscribed(self, user_ids):
+        # Which of these users currently have a listener, so publishers can skip work for the rest
+        with self._lock:
+            return {user_id for user_id in user_ids if user_id in self._subscriptions}
+
+    def publish(self, user_id, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.deliver(message)
+            except RuntimeError: # The subscriber's event loop has been closed
+                subscription.close()
+
+
+@lru_cache(maxsize=None)
+def get_pubsub():
+    return import_string(getattr(settings, 'NOTIFICATION_PUBSUB_BACKEND', DEFAULT_BACKEND))()
@@ -0,0 +1,64 @@
+"""
+Read state of notifications.
+
+Each user has a read watermark (NotificationReadCursor): every notification of
+theirs with an id up to `last_read_id` is read. "Mark all as read" moves the
+watermark, a single-row write however many notifications were unread.
+Notifications read one by one above the watermark are recorded sparsely as
+NotificationRead rows, which are dropped once the watermark passes them.
+
+Querysets get an `is_read` annotation from `with_read_state()`. It is computed
+in the same query from the recipient's watermark and an EXISTS on the sparse
+reads, so lists need no extra query.
+"""
+from django.db import transaction
+from django.db.models import BooleanField, Exists, ExpressionWrapper, Max, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .counters import decrement_unread, get_watermark
+from .models import Notification, NotificationRead, NotificationReadCursor
+
+
+def _recipient_watermark():
+    cursor = NotificationReadCursor.objects.filter(user_id=OuterRef('recipient_id')).values('last_read_id')[:1]
+    return Coalesce(Subquery(cursor), Value(0))
+
+
+def with_read_state(queryset):
+    # Annotate `is_read`: at or below the recipient's watermark, or read individually above it
+    read = Q(pk__lte=_recipient_watermark()) | Exists(NotificationRead.objects.filter(notification_id=OuterRef('pk')))
+    return queryset.annotate(is_read=ExpressionWrapper(read, output_field=BooleanField()))
+
+
+def mark_all_read(user_id, up_to=None):
+    # Move the watermark to the user's largest notification id (or to `up_to`, the largest id the client has seen).
+    # Returns (new watermark, number of notifications it marked as read), both from the same transaction.
+    with transaction.atomic():
+        latest = Notification.objects.filter(recipient_id=user_id).aggregate(latest=Max('pk'))['latest'] or 0
+        if up_to is not None:
+            latest = min(latest, up_to)
+        cursor, _ = NotificationReadCursor.objects.select_for_update().get_or_create(user_id=user_id)
+        if latest <= cursor.last_read_id:
+            return cursor.last_read_id, 0
+        # Newly read: the user's notifications the watermark passes, less those already read one by one
+        passed = Notification.objects.filter(recipient_id=user_id, pk__gt=cursor.last_read_id, pk__lte=latest).count()
+        NotificationReadCursor.objects.filter(user_id=user_id).update(last_read_id=latest, last_read_at=timezone.now())
+        # Sparse reads all lie above the old watermark; the ones it now covers are dropped
+        already_read, _ = NotificationRead.objects.filter(user_id=user_id, notification_id__lte=latest).delete()
+        marked = passed - already_read
+        decrement_unread(user_id, marked)
+    return latest, marked
+
+
+def mark_read(user_id, notification_ids):
+    # Mark some of the user's notifications as read. Returns (ids of the user's notifications among them, newly read count).
+    with transaction.atomic():
+        watermark = get_watermark(user_id)
+        owned = set(Notification.objects.filter(recipient_id=user_id, pk__in=notification_ids).values_list('pk', flat=True))
+        above = {pk for pk in owned if pk > watermark}
+        already = set(NotificationRead.objects.filter(notification_id__in=above).values_list('notification_id', flat=True))
+        new = above - already
+        NotificationRead.objects.bulk_create([NotificationRead(user_id=user_id, notification_id=pk) for pk in new], ignore_conflicts=True)
+        decrement_unread(user_id, len(new))
+    return owned, len(new)
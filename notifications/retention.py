@@ -0,0 +1,205 @@
+"""
+Notification retention.
+
+Read notifications expire NOTIFICATION_RETENTION_READ_DAYS after their timestamp,
+unread ones after NOTIFICATION_RETENTION_UNREAD_DAYS (read state as derived by
+notifications.read_state). Expired rows are handled in one of three modes, then
+deleted:
+
+    delete   just delete them
+    digest   fold them into one NotificationDigest row per (recipient, verb)
+    archive  append them as NDJSON to a gzip file in NOTIFICATION_ARCHIVE_DIR
+
+A run walks the timestamp index oldest first in two phases, in batches of
+NOTIFICATION_RETENTION_BATCH_SIZE:
+
+    all      rows older than both cutoffs, expired whatever their read state
+    between  rows between the cutoffs with the shorter TTL (normally the read
+             ones: at or below the recipient's watermark, or read individually)
+
+so every row a batch loads is removed, and unread rows that haven't expired yet
+are never loaded (SQLite steps over their index entries once per run, in the
+`between` phase). There is one short transaction per batch, so the SQLite write
+lock is only held for one batch at a time and writers get in between batches. Each transaction also moves
+the unread counters of affected recipients and saves a RetentionCheckpoint
+(cutoffs, phase, position, archive offset). An interrupted run therefore resumes with
+the same cutoffs, and anything appended to the archive by a batch that didn't
+commit is cut off again, so every row is archived exactly once. Each batch is a
+separate gzip member; `zcat` and Python's gzip module read the file as one
+stream.
+"""
+import datetime
+import gzip
+import json
+import os
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from .counters import decrement_unread
+from .models import Notification, NotificationDigest, RetentionCheckpoint
+from .read_state import with_read_state
+
+MODES = ('delete', 'digest', 'archive')
+PHASES = ('all', 'between', 'done')
+CHECKPOINT_NAME = 'notifications'
+
+
+def read_ttl():
+    return datetime.timedelta(days=getattr(settings, 'NOTIFICATION_RETENTION_READ_DAYS', 30))
+
+
+def unread_ttl():
+    return datetime.timedelta(days=getattr(settings, 'NOTIFICATION_RETENTION_UNREAD_DAYS', 180))
+
+
+def archive_dir():
+    return getattr(settings, 'NOTIFICATION_ARCHIVE_DIR', settings.BASE_DIR / 'notification_archive')
+
+
+def start(mode, now=None, restart=False):
+    # The unfinished run, or a new one with cutoffs relative to now
+    checkpoint = RetentionCheckpoint.objects.filter(name=CHECKPOINT_NAME).first()
+    if checkpoint is not None and checkpoint.phase != 'done' and not restart:
+        return checkpoint
+    now = now or timezone.now()
+    archive_path = ''
+    if mode == 'archive':
+        archive_path = str(archive_dir() / f'notifications-{now:%Y%m%dT%H%M%S}.ndjson.gz')
+    checkpoint, _ = RetentionCheckpoint.objects.update_or_create(name=CHECKPOINT_NAME, defaults={
+        'mode': mode,
+        'read_cutoff': now - read_ttl(),
+        'unread_cutoff': now - unread_ttl(),
+        'phase': PHASES[0],
+        'position_timestamp': None,
+        'position_id': None,
+        'archive_path': archive_path,
+        'archive_offset': 0,
+        'processed': 0,
+    })
+    return checkpoint
+
+
+def expired(checkpoint):
+    # Expired notifications in the checkpoint's phase, annotated with is_read
+    earlier, later = sorted([checkpoint.read_cutoff, checkpoint.unread_cutoff])
+    queryset = with_read_state(Notification.objects.all())
+    if checkpoint.phase == 'all':
+        return queryset.filter(timestamp__lt=earlier)
+    # Between the cutoffs only the rows with the shorter TTL have expired
+    read_expires_first = checkpoint.read_cutoff > checkpoint.unread_cutoff
+    return queryset.filter(timestamp__gte=earlier, timestamp__lt=later, is_read__in=[read_expires_first])
+
+
+def scan_batch(checkpoint, batch_size):
+    # Next batch of expired rows in the current phase, served by the timestamp index
+    queryset = expired(checkpoint)
+    if checkpoint.position_id is not None:
+        # Range on the index from the last position, skipping rows of that timestamp already processed
+        queryset = queryset.filter(timestamp__gte=checkpoint.position_timestamp).exclude(
+            timestamp=checkpoint.position_timestamp, pk__lte=checkpoint.position_id,
+        )
+    return list(queryset.order_by('timestamp', 'pk')[:batch_size])
+
+
+def to_record(notification):
+    content_type = ContentType.objects.get_for_id(notification.content_type_id)
+    return {
+        'id': notification.pk,
+        'recipient_id': notification.recipient_id,
+        'actor_id': notification.actor_id,
+        'actor_count': notification.actor_count,
+        'verb': notification.verb,
+        'target_type': f'{content_type.app_label}.{content_type.model}',
+        'target_id': notification.object_id,
+        'timestamp': notification.timestamp,
+        'is_read': notification.is_read,
+    }
+
+
+def append_archive(checkpoint, rows):
+    # Write the batch as one gzip member at the committed offset (dropping anything left by an uncommitted batch)
+    os.makedirs(os.path.dirname(checkpoint.archive_path), exist_ok=True)
+    lines = ''.join(json.dumps(to_record(row), cls=DjangoJSONEncoder) + '\n' for row in rows)
+    data = gzip.compress(lines.encode())
+    with open(checkpoint.archive_path, 'ab') as archive:
+        archive.truncate(checkpoint.archive_offset)
+        archive.write(data)
+        archive.flush()
+        os.fsync(archive.fileno())
+    return checkpoint.archive_offset + len(data)
+
+
+def fold_into_digests(rows):
+    groups = {}
+    for row in rows:
+        groups.setdefault((row.recipient_id, row.verb), []).append(row)
+    existing = {
+        (digest.recipient_id, digest.verb): digest
+        for digest in NotificationDigest.objects.filter(
+            recipient_id__in={recipient_id for recipient_id, _ in groups}, verb__in={verb for _, verb in groups},
+        )
+    }
+    created, updated = [], []
+    for (recipient_id, verb), group in groups.items():
+        digest = existing.get((recipient_id, verb))
+        if digest is None:
+            digest = NotificationDigest(
+                recipient_id=recipient_id, verb=verb,
+                first_timestamp=group[0].timestamp, last_timestamp=group[-1].timestamp,
+            )
+            created.append(digest)
+        else:
+            updated.append(digest)
+        digest.notification_count += len(group)
+        digest.actor_count += sum(row.actor_count for row in group)
+        digest.unread_count += sum(1 for row in group if not row.is_read)
+        digest.first_timestamp = min(digest.first_timestamp, group[0].timestamp)
+        digest.last_timestamp = max(digest.last_timestamp, group[-1].timestamp)
+    NotificationDigest.objects.bulk_create(created)
+    NotificationDigest.objects.bulk_update(updated, ['notification_count', 'actor_count', 'unread_count', 'first_timestamp', 'last_timestamp'])
+
+
+def process_batch(checkpoint, batch_size):
+    # One bounded transaction: read a batch, archive or digest it, delete it and save progress.
+    # Returns the number of rows removed (0 when a phase ends).
+    # An exception leaves the checkpoint row as the last batch committed it; the next run starts from there.
+    with transaction.atomic():
+        rows = scan_batch(checkpoint, batch_size)
+        if not rows:
+            checkpoint.phase = PHASES[PHASES.index(checkpoint.phase) + 1]
+            checkpoint.position_timestamp = checkpoint.position_id = None
+            checkpoint.save()
+            return 0
+
+        if checkpoint.mode == 'archive':
+            checkpoint.archive_offset = append_archive(checkpoint, rows)
+        elif checkpoint.mode == 'digest':
+            fold_into_digests(rows)
+        Notification.objects.filter(pk__in=[row.pk for row in rows]).delete()
+        for recipient_id, n in Counter(row.recipient_id for row in rows if not row.is_read).items():
+            decrement_unread(recipient_id, n)
+
+        checkpoint.position_timestamp, checkpoint.position_id = rows[-1].timestamp, rows[-1].pk
+        checkpoint.processed += len(rows)
+        checkpoint.save()
+        return len(rows)
+
+
+def run(mode=None, batch_size=None, max_batches=None, restart=False, pause=0.0, now=None):
+    # Process batches until the run is done (or max_batches have run); returns the checkpoint
+    mode = mode or getattr(settings, 'NOTIFICATION_RETENTION_MODE', 'delete')
+    batch_size = batch_size or getattr(settings, 'NOTIFICATION_RETENTION_BATCH_SIZE', 500)
+    checkpoint = start(mode, now=now, restart=restart)
+    batches = 0
+    while checkpoint.phase != 'done' and (max_batches is None or batches < max_batches):
+        if process_batch(checkpoint, batch_size):
+            batches += 1
+            if pause:
+                time.sleep(pause) # Leave room for other writers
+    return checkpoint
@@ -4,41 +4,60 @@ from accounts.serializers import UserSerializer # For actor/recipient details if
 from posts.serializers import PostSerializer # To serialize target if it's a post
 from posts.models import Post, Comment # For GenericForeignKey target resolution
 from django.contrib.auth import get_user_model # For target if it's a user
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.contenttypes.prefetch import GenericPrefetch
 
 User = get_user_model()
 
+def with_targets(queryset):
+    # Fetch actors with the notifications and targets per content type in one query each (comments with their post).
+    # Targets are looked up by primary key, so the models' default ordering would only add a sort.
+    return queryset.select_related('actor').prefetch_related(GenericPrefetch('target', [
+        Post.objects.order_by(),
+        Comment.objects.select_related('post').order_by(),
+        User.objects.order_by(),
+    ]))
+
+class NotificationIdListSerializer(serializers.Serializer):
+    # Input for marking several notifications as read at once
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=100)
+
 class NotificationSerializer(serializers.ModelSerializer):
     actor_username = serializers.ReadOnlyField(source='actor.username')
     target_info = serializers.SerializerMethodField()
+    is_read = serializers.BooleanField(read_only=True, default=False) # Annotated by read_state.with_read_state(); new notifications are unread
 
     class Meta:
         model = Notification
-        fields = ['id', 'recipient', 'actor_username', 'verb', 'target_info', 'timestamp', 'is_read']
-        read_only_fields = ['recipient', 'actor_username', 'verb', 'target_info', 'timestamp']
+        fields = ['id', 'recipient', 'actor_username', 'actor_count', 'verb', 'target_info', 'timestamp', 'is_read']
+        read_only_fields = ['recipient', 'actor_username', 'actor_count', 'verb', 'target_info', 'timestamp']
 
     def get_target_info(self, obj):
-        # Return a dictionary with relevant info about the target object
-        if obj.target:
-            if isinstance(obj.target, Post):
+        # Return a dictionary with relevant info about the target object.
+        # The target is read once; list views prefetch targets so this doesn't hit the database.
+        target = obj.target
+        if target:
+            if isinstance(target, Post):
                 return {
                     'type': 'Post',
-                    'id': obj.target.id,
-                    'title': obj.target.title,
-                    'content_snippet': obj.target.content[:50] + '...' if len(obj.target.content) > 50 else obj.target.content
+                    'id': target.id,
+                    'title': target.title,
+                    'content_snippet': target.content[:50] + '...' if len(target.content) > 50 else target.content
                 }
-            elif isinstance(obj.target, Comment):
+            elif isinstance(target, Comment):
                 return {
                     'type': 'Comment',
-                    'id': obj.target.id,
-                    'content_snippet': obj.target.content[:50] + '...' if len(obj.target.content) > 50 else obj.target.content,
-                    'post_title': obj.target.post.title
+                    'id': target.id,
+                    'content_snippet': target.content[:50] + '...' if len(target.content) > 50 else target.content,
+                    'post_title': target.post.title
                 }
-            elif isinstance(obj.target, User):
+            elif isinstance(target, User):
                 return {
                     'type': 'User',
-                    'id': obj.target.id,
-                    'username': obj.target.username,
-                    'bio_snippet': obj.target.bio[:50] + '...' if obj.target.bio and len(obj.target.bio) > 50 else obj.target.bio
+                    'id': target.id,
+                    'username': target.username,
+                    'bio_snippet': target.bio[:50] + '...' if target.bio and len(target.bio) > 50 else target.bio
                 }
-            return {'type': obj.content_type.model, 'id': obj.object_id}
+            # ContentType lookups by id are served from Django's content type cache
+            return {'type': ContentType.objects.get_for_id(obj.content_type_id).model, 'id': obj.object_id}
         return None
\ No newline at end of file
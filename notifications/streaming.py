@@ -0,0 +1,115 @@
+"""
+Server-Sent Events stream of new notifications.
+
+Served as an async Django view so that, under ASGI, every open connection is a
+coroutine waiting on its pub/sub queue instead of a worker thread. Clients that
+reconnect send the standard Last-Event-ID header (or ?last_event_id=) and first
+receive what they missed from the database before switching to live messages.
+
+Event ids are "<timestamp in microseconds>-<notification id>". Coalescing updates
+a notification in place with a new timestamp, so resuming after the (timestamp,
+id) of the last event also replays notifications updated while the client was
+away, which resuming after an id would miss.
+
+The stream needs an ASGI server (e.g. `uvicorn social_media_api.asgi:application`):
+under WSGI each open stream would hold a worker thread for as long as the client
+stays connected, so the view answers 501 there instead. Clients authenticate
+with the Authorization header or, since EventSource can't set headers, with
+?token=<token>. Query strings end up in access logs, so keep the ASGI server's
+access log off for /api/notifications/stream/ (or strip query strings from it);
+this project's own request logging (social_media_api.profiling) drops the token.
+"""
+import asyncio
+import datetime
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+
+from accounts.authentication import CachedTokenAuthentication
+from .models import Notification
+from .pubsub import get_pubsub
+from .read_state import with_read_state
+from .serializers import NotificationSerializer, with_targets
+
+KEEPALIVE_SECONDS = 15
+RECONNECT_MILLISECONDS = 3000
+MAX_BACKLOG = 100
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def authenticate_stream(request):
+    # EventSource can't set headers, so a ?token= query parameter is accepted next to the Authorization header
+    authenticator = CachedTokenAuthentication()
+    try:
+        result = authenticator.authenticate(Request(request))
+        if result is None and request.GET.get('token'):
+            result = authenticator.authenticate_credentials(request.GET['token'])
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+def event_id(message):
+    timestamp = parse_datetime(message['timestamp'])
+    return f"{(timestamp - EPOCH) // datetime.timedelta(microseconds=1)}-{message['id']}"
+
+
+def parse_event_id(value):
+    # (timestamp, id) of an event id; raises ValueError if it isn't one
+    micros, pk = value.split('-')
+    return EPOCH + datetime.timedelta(microseconds=int(micros)), int(pk)
+
+
+def missed_notifications(user_id, position):
+    # Notifications written or updated after `position`, on the (recipient, timestamp) index
+    timestamp, pk = position
+    queryset = Notification.objects.filter(recipient_id=user_id, timestamp__gte=timestamp).exclude(timestamp=timestamp, pk__lte=pk)
+    queryset = with_read_state(with_targets(queryset)).order_by('timestamp', 'pk')
+    return NotificationSerializer(queryset[:MAX_BACKLOG], many=True).data
+
+
+def format_event(message):
+    return f"id: {event_id(message)}\nevent: notification\ndata: {json.dumps(message)}\n\n"
+
+
+async def event_stream(user_id, position):
+    # Subscribe before reading the backlog so nothing written in between is lost (duplicates are harmless)
+    subscription = get_pubsub().subscribe(user_id)
+    try:
+        yield f'retry: {RECONNECT_MILLISECONDS}\n\n'
+        if position is not None:
+            for message in await sync_to_async(missed_notifications)(user_id, position):
+                yield format_event(message)
+        while True:
+            try:
+                message = await asyncio.wait_for(subscription.get(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            yield format_event(message)
+    finally:
+        subscription.close()
+
+
+async def notification_stream(request):
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"detail": "Notification streaming requires an ASGI server."}, status=501)
+    user = await sync_to_async(authenticate_stream)(request)
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+
+    last_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    try:
+        position = parse_event_id(last_id) if last_id is not None else None
+    except ValueError:
+        return JsonResponse({"detail": "Invalid last event id."}, status=400)
+
+    response = StreamingHttpResponse(event_stream(user.pk, position), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no' # Keep reverse proxies from buffering the stream
+    return response
@@ -1,3 +1,333 @@
-from django.test import TestCase
+import datetime
+import gzip
+import json
+import os
+import pathlib
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.contenttypes.models import ContentType
+from django.db import OperationalError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from accounts.authentication import issue_token
+from accounts.models import User
+from posts.models import Post, Comment
+from social_media_api.testing import QueryPlanMixin, requires_sqlite
+from . import retention
+from .counters import get_unread_count, reconcile_unread
+from .dispatch import NotificationEvent, write_notifications
+from .models import Notification, NotificationDigest, NotificationRead, RetentionCheckpoint
+from .read_state import mark_all_read, mark_read
+from .streaming import event_id, missed_notifications, parse_event_id
+
+
+# Every test class runs on a LocMemCache of its own, see posts/tests.py.
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'notifications-tests'}}
+
+# Query regression tests, see posts/tests.py.
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class NotificationQueryTestCase(QueryPlanMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice, cls.bob = [
+            User.objects.create_user(username=name, email=f'{name}@example.com', password='password')
+            for name in ('alice', 'bob')
+        ]
+        posts = [Post.objects.create(author=cls.alice, title=f'Post {i}', content='Some content') for i in range(5)]
+        comments = [Comment.objects.create(post=post, author=cls.bob, content='Nice') for post in posts]
+        # Every target type the list resolves: posts, comments (with their post) and users
+        targets = posts + comments + [cls.alice] * 5
+        Notification.objects.bulk_create([
+            Notification(recipient=cls.alice, actor=cls.bob, verb='liked', target=target)
+            for target in targets * 2
+        ])
+        reconcile_unread(cls.alice.pk)
+
+    def setUp(self):
+        ContentType.objects.get_for_models(Post, Comment, User) # Content types are cached per process
+        self.client.force_authenticate(self.alice)
+
+    def test_notification_list_query_count(self):
+        # Notifications with their actors, then one query per target type on the page
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('notification-list') + '?page_size=30')
+        self.assertEqual(len(response.data['results']), 30)
+
+    def test_unread_count_query_count(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('notifications-unread-count'))
+        self.assertEqual(response.data['unread_count'], 30)
+
+    def test_async_views_match(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {issue_token(self.alice).key}')
+        url, async_url = reverse('notification-list') + '?page_size=20', reverse('notification-list-async') + '?page_size=20'
+        while url:
+            response, async_response = self.client.get(url), self.client.get(async_url)
+            self.assertEqual(async_response.json()['results'], response.json()['results'])
+            url, async_url = response.data['next'], async_response.json()['next']
+        self.assertIsNone(async_url)
+        response = self.client.get(reverse('notifications-unread-count-async'))
+        self.assertEqual(response.json(), {'unread_count': 30})
+
+    @requires_sqlite
+    def test_notification_list_plan(self):
+        response = self.assertIndexedQueries(reverse('notification-list'))
+        self.assertIndexedQueries(response.data['next'])
+
+    @requires_sqlite
+    def test_retention_batch_plan(self):
+        # Resuming either phase of a run walks the timestamp index from the checkpoint instead of scanning the table
+        checkpoint = retention.start('delete')
+        for phase in ('all', 'between'):
+            checkpoint.phase = phase
+            checkpoint.position_timestamp, checkpoint.position_id = checkpoint.unread_cutoff, 1
+            with CaptureQueriesContext(connection) as context:
+                retention.scan_batch(checkpoint, 100)
+            self.assertIndexedPlan(context.captured_queries[-1]['sql'])
+
+    @requires_sqlite
+    def test_stream_backlog_plan(self):
+        notification = Notification.objects.filter(recipient=self.alice).order_by('pk')[10]
+        with CaptureQueriesContext(connection) as context:
+            missed_notifications(self.alice.pk, (notification.timestamp, notification.pk))
+        self.assertIndexedPlan(context.captured_queries[0]['sql'])
+
+
+@override_settings(CACHES=LOCAL_CACHE, NOTIFICATION_DISPATCH_ASYNC=False)
+class DispatchTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice, cls.bob, cls.carol, cls.dave = [
+            User.objects.create_user(username=name, email=f'{name}@example.com', password='password')
+            for name in ('alice', 'bob', 'carol', 'dave')
+        ]
+        cls.post = Post.objects.create(author=cls.alice, title='Post', content='Some content')
+
+    def event(self, actor, verb='liked'):
+        return NotificationEvent(self.alice.pk, actor.pk, verb, ContentType.objects.get_for_model(Post).pk, self.post.pk)
+
+    def test_repeat_actors_are_counted_once(self):
+        write_notifications([self.event(self.bob), self.event(self.carol), self.event(self.bob)])
+        notification = Notification.objects.get()
+        self.assertEqual((notification.actor_id, notification.actor_count), (self.bob.pk, 2))
+        write_notifications([self.event(self.bob)]) # Liked again after an unlike
+        self.assertEqual(Notification.objects.get().actor_count, 2)
+        write_notifications([self.event(self.carol), self.event(self.dave)])
+        notification = Notification.objects.get()
+        self.assertEqual((notification.actor_id, notification.actor_count), (self.dave.pk, 3))
+        self.assertEqual(get_unread_count(self.alice.pk), 1)
+
+    def test_read_notifications_are_not_coalesced_into(self):
+        write_notifications([self.event(self.bob)])
+        mark_all_read(self.alice.pk)
+        write_notifications([self.event(self.bob)])
+        self.assertEqual(list(Notification.objects.order_by('pk').values_list('actor_count', flat=True)), [1, 1])
+        self.assertEqual(get_unread_count(self.alice.pk), 1)
+
+    def test_other_verbs_are_kept_per_actor(self):
+        write_notifications([self.event(self.bob, 'commented on'), self.event(self.carol, 'commented on')])
+        self.assertEqual(Notification.objects.count(), 2)
+
+    def test_stream_resume_replays_coalesced_notifications(self):
+        write_notifications([self.event(self.bob)])
+        write_notifications([self.event(self.bob, 'commented on')])
+        first, last = missed_notifications(self.alice.pk, (Notification.objects.earliest('pk').timestamp, 0))
+        self.assertEqual(parse_event_id(event_id(last)), (Notification.objects.get(pk=last['id']).timestamp, last['id']))
+        write_notifications([self.event(self.carol)]) # Updates the first notification after the client saw the last one
+        missed = missed_notifications(self.alice.pk, parse_event_id(event_id(last)))
+        self.assertEqual([(message['id'], message['actor_count']) for message in missed], [(first['id'], 2)])
+
+    def test_stream_requires_asgi(self):
+        token = issue_token(self.alice)
+        response = self.client.get(reverse('notification-stream') + f'?token={token.key}') # A WSGIRequest
+        self.assertEqual(response.status_code, 501)
+
+    async def test_stream_authentication(self):
+        response = await self.async_client.get(reverse('notification-stream') + '?token=bogus')
+        self.assertEqual(response.status_code, 401)
+        token = await sync_to_async(issue_token)(self.alice)
+        response = await self.async_client.get(reverse('notification-stream') + f'?token={token.key}', headers={'Last-Event-ID': 'bogus'})
+        self.assertEqual(response.status_code, 400) # Authenticated (an ASGIRequest), then the event id is checked
+
+
+@override_settings(CACHES=LOCAL_CACHE, NOTIFICATION_DISPATCH_ASYNC=False)
+class ReadStateTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice, cls.bob = [
+            User.objects.create_user(username=name, email=f'{name}@example.com', password='password')
+            for name in ('alice', 'bob')
+        ]
+        post = Post.objects.create(author=cls.alice, title='Post', content='Some content')
+        cls.notifications = Notification.objects.bulk_create([
+            Notification(recipient=cls.alice, actor=cls.bob, verb='commented on', target=post) for _ in range(5)
+        ])
+        cls.other = Notification.objects.create(recipient=cls.bob, actor=cls.alice, verb='followed', target=cls.alice)
+
+    def setUp(self):
+        self.client.force_authenticate(self.alice)
+        self.ids = [notification.pk for notification in self.notifications]
+
+    def read_flags(self):
+        response = self.client.get(reverse('notification-list'))
+        return {row['id']: row['is_read'] for row in response.data['results']}
+
+    def test_mark_read(self):
+        self.assertEqual(mark_read(self.alice.pk, [self.ids[0], self.other.pk]), ({self.ids[0]}, 1))
+        self.assertEqual(mark_read(self.alice.pk, [self.ids[0]]), ({self.ids[0]}, 0)) # Already read
+        self.assertEqual(get_unread_count(self.alice.pk), 4)
+        self.assertEqual(get_unread_count(self.bob.pk), 1)
+
+    def test_mark_one_as_read_endpoint(self):
+        response = self.client.post(reverse('notification-mark-as-read', args=[self.other.pk]))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post(reverse('notification-mark-as-read', args=[self.ids[1]]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([pk for pk, is_read in self.read_flags().items() if is_read], [self.ids[1]])
+
+    def test_bulk_mark_as_read_endpoint(self):
+        url = reverse('notifications-mark-as-read')
+        response = self.client.post(url, {'ids': [self.ids[0], self.ids[2], self.other.pk]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['ids'], [self.ids[0], self.ids[2]])
+        self.assertEqual(response.data['detail'], '2 notifications marked as read.')
+        response = self.client.post(url, {'ids': [self.ids[0]]}, format='json')
+        self.assertEqual(response.data['detail'], '0 notifications marked as read.')
+        self.assertEqual(self.client.post(url, {'ids': []}, format='json').status_code, 400)
+        self.assertEqual(get_unread_count(self.alice.pk), 3)
+        self.assertEqual(sorted(pk for pk, is_read in self.read_flags().items() if is_read), [self.ids[0], self.ids[2]])
+
+    def test_mark_all_read(self):
+        mark_read(self.alice.pk, [self.ids[4]])
+        self.assertEqual(mark_all_read(self.alice.pk), (self.ids[4], 4))
+        self.assertFalse(NotificationRead.objects.exists()) # Covered by the watermark
+        self.assertEqual(mark_all_read(self.alice.pk), (self.ids[4], 0))
+        self.assertEqual(get_unread_count(self.alice.pk), 0)
+        self.assertTrue(all(self.read_flags().values()))
+
+    def test_mark_all_read_counts_once(self):
+        self.assertEqual(get_unread_count(self.alice.pk), 5)
+        mark_read(self.alice.pk, [self.ids[1], self.ids[4]])
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(mark_all_read(self.alice.pk, up_to=self.ids[2]), (self.ids[2], 2)) # ids[1] was already read
+        self.assertEqual(sum('COUNT(' in query['sql'].upper() for query in context.captured_queries), 1)
+        self.assertEqual(list(NotificationRead.objects.values_list('notification_id', flat=True)), [self.ids[4]])
+        self.assertEqual(get_unread_count(self.alice.pk), 1) # The counter was decremented, not rebuilt
+        self.assertEqual(reconcile_unread(self.alice.pk), 1)
+
+    def test_mark_all_read_up_to_last_id(self):
+        mark_read(self.alice.pk, [self.ids[4]])
+        response = self.client.post(reverse('notifications-mark-all-as-read'), {'last_id': self.ids[2]}, format='json')
+        self.assertEqual(response.data, {'detail': '3 notifications marked as read.', 'last_read_id': self.ids[2]})
+        self.assertEqual([pk for pk, is_read in self.read_flags().items() if not is_read], [self.ids[3]])
+        self.assertEqual(get_unread_count(self.alice.pk), 1)
+        response = self.client.post(reverse('notifications-mark-all-as-read'), {'last_id': 'latest'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_retention_skips_unexpired_unread(self):
+        # Read rows expire first; unread rows between the cutoffs are never loaded
+        mark_read(self.alice.pk, self.ids[:2])
+        Notification.objects.update(timestamp=timezone.now() - retention.read_ttl() - datetime.timedelta(days=1))
+        checkpoint = retention.start('delete')
+        self.assertEqual(retention.scan_batch(checkpoint, 100), []) # Nothing is older than both cutoffs
+        checkpoint.phase = 'between'
+        self.assertEqual([row.pk for row in retention.scan_batch(checkpoint, 100)], self.ids[:2])
+
+
+@override_settings(CACHES=LOCAL_CACHE, NOTIFICATION_DISPATCH_ASYNC=False)
+class RetentionTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice, cls.bob = [
+            User.objects.create_user(username=name, email=f'{name}@example.com', password='password')
+            for name in ('alice', 'bob')
+        ]
+        post = Post.objects.create(author=cls.alice, title='Post', content='Some content')
+        cls.now = timezone.now()
+        old, recent = cls.now - datetime.timedelta(days=200), cls.now - datetime.timedelta(days=40)
+        # (recipient, verb, actor count, age, read): expired are the old ones and the recent read one
+        rows = [
+            (cls.alice, 'liked', 2, old, False),
+            (cls.alice, 'liked', 1, old, True),
+            (cls.alice, 'followed', 1, old, False),
+            (cls.bob, 'liked', 1, old, False),
+            (cls.alice, 'liked', 1, recent, True),
+            (cls.alice, 'liked', 1, recent, False),
+            (cls.alice, 'liked', 1, cls.now, False),
+        ]
+        notifications = Notification.objects.bulk_create([
+            Notification(recipient=recipient, actor=cls.bob, verb=verb, actor_count=actor_count, target=post)
+            for recipient, verb, actor_count, _, _ in rows
+        ])
+        for notification, (recipient, _, _, timestamp, is_read) in zip(notifications, rows):
+            Notification.objects.filter(pk=notification.pk).update(timestamp=timestamp)
+            if is_read:
+                mark_read(recipient.pk, [notification.pk])
+        cls.expired = [notification.pk for notification in notifications[:5]]
+        cls.kept = [notification.pk for notification in notifications[5:]]
+        for user in (cls.alice, cls.bob):
+            reconcile_unread(user.pk)
+
+    def interrupt_batch(self, batch_size=2):
+        # A batch that fails before committing, after archiving, digesting and deleting its rows
+        checkpoint = RetentionCheckpoint.objects.get()
+        with mock.patch.object(RetentionCheckpoint, 'save', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                retention.process_batch(checkpoint, batch_size)
+
+    def assertExpiredRemoved(self, checkpoint):
+        self.assertEqual(checkpoint.phase, 'done')
+        self.assertEqual(checkpoint.processed, len(self.expired))
+        self.assertEqual(sorted(Notification.objects.values_list('pk', flat=True)), self.kept)
+        self.assertEqual((get_unread_count(self.alice.pk), get_unread_count(self.bob.pk)), (2, 0))
+
+    def test_process_batch(self):
+        checkpoint = retention.start('delete', now=self.now)
+        self.assertEqual(retention.process_batch(checkpoint, 3), 3)
+        self.assertEqual(retention.process_batch(checkpoint, 3), 1)
+        self.assertEqual(retention.process_batch(checkpoint, 3), 0) # End of the first phase
+        self.assertEqual((checkpoint.phase, checkpoint.position_id), ('between', None))
+        self.assertEqual(retention.process_batch(checkpoint, 3), 1)
+        self.assertEqual(retention.process_batch(checkpoint, 3), 0)
+        self.assertExpiredRemoved(checkpoint)
+
+    def test_resume_after_interrupted_batch(self):
+        checkpoint = retention.run('delete', batch_size=2, max_batches=1, now=self.now)
+        self.assertEqual((checkpoint.phase, checkpoint.processed), ('all', 2))
+        self.interrupt_batch()
+        self.assertEqual(Notification.objects.count(), 5) # Rolled back
+        self.assertEqual(get_unread_count(self.alice.pk), 3)
+        checkpoint = retention.run('delete', batch_size=2, now=timezone.now()) # Resumes with the original cutoffs
+        self.assertExpiredRemoved(checkpoint)
+
+    def test_archive_is_written_once(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(NOTIFICATION_ARCHIVE_DIR=pathlib.Path(directory)):
+            checkpoint = retention.run('archive', batch_size=2, max_batches=1, now=self.now)
+            self.interrupt_batch() # Appends to the archive past the committed offset
+            self.assertGreater(os.path.getsize(checkpoint.archive_path), checkpoint.archive_offset)
+            checkpoint = retention.run('archive', batch_size=2)
+            with gzip.open(checkpoint.archive_path, 'rt') as archive:
+                records = [json.loads(line) for line in archive]
+            self.assertEqual(os.path.getsize(checkpoint.archive_path), checkpoint.archive_offset)
+        self.assertEqual(sorted(record['id'] for record in records), self.expired)
+        self.assertExpiredRemoved(checkpoint)
+
+    def test_digests(self):
+        self.assertExpiredRemoved(retention.run('digest', batch_size=2, now=self.now))
+        digests = {
+            (digest.recipient_id, digest.verb): (digest.notification_count, digest.actor_count, digest.unread_count)
+            for digest in NotificationDigest.objects.all()
+        }
+        self.assertEqual(digests, {
+            (self.alice.pk, 'liked'): (3, 4, 1),
+            (self.alice.pk, 'followed'): (1, 1, 1),
+            (self.bob.pk, 'liked'): (1, 1, 1),
+        })
@@ -1,8 +1,15 @@
 from django.urls import path
-from .views import NotificationListView, NotificationMarkAsReadView, MarkAllNotificationsAsReadView
+from . import async_views
+from .streaming import notification_stream
+from .views import NotificationListView, NotificationMarkAsReadView, BulkMarkNotificationsAsReadView, MarkAllNotificationsAsReadView, UnreadNotificationCountView
 
 urlpatterns = [
     path('', NotificationListView.as_view(), name='notification-list'),
+    path('async/', async_views.notification_list, name='notification-list-async'), # Async views for ASGI workers
     path('<int:pk>/mark_as_read/', NotificationMarkAsReadView.as_view(), name='notification-mark-as-read'),
+    path('mark_as_read/', BulkMarkNotificationsAsReadView.as_view(), name='notifications-mark-as-read'),
     path('mark_all_as_read/', MarkAllNotificationsAsReadView.as_view(), name='notifications-mark-all-as-read'),
+    path('stream/', notification_stream, name='notification-stream'),
+    path('unread_count/', UnreadNotificationCountView.as_view(), name='notifications-unread-count'),
+    path('unread_count/async/', async_views.unread_count, name='notifications-unread-count-async'),
 ]
\ No newline at end of file
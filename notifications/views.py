@@ -3,35 +3,66 @@ from rest_framework.response import Response
 from rest_framework.views import APIView # For marking notifications as read
 
 from .models import Notification
-from .serializers import NotificationSerializer
-from posts.views import StandardResultsPagination # Reuse pagination class
+from .counters import get_unread_count
+from .read_state import mark_all_read, mark_read, with_read_state
+from .serializers import NotificationIdListSerializer, NotificationSerializer, with_targets
+from posts.pagination import KeysetPagination # Reuse keyset pagination class
 
 class NotificationListView(generics.ListAPIView):
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
-    pagination_class = StandardResultsPagination
+    pagination_class = KeysetPagination # Keyset pagination on (timestamp, id)
 
     def get_queryset(self):
-        # Return notifications for the authenticated user, ordered by newest first
-        return Notification.objects.filter(recipient=self.request.user).order_by('-timestamp')
+        # Return notifications for the authenticated user, ordered by newest first.
+        # Targets are fetched per content type in one query each (comments with their post) instead of per row.
+        # Read state is derived from the user's watermark in the same query.
+        return with_read_state(with_targets(Notification.objects.filter(recipient=self.request.user))).order_by('-timestamp')
 
 class NotificationMarkAsReadView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request, pk, format=None):
-        # Mark a specific notification as read
-        try:
-            notification = Notification.objects.get(pk=pk, recipient=request.user)
-            notification.is_read = True
-            notification.save()
+        # Mark a specific notification as read: a sparse read row above the watermark, nothing at or below it
+        owned, _ = mark_read(request.user.pk, [pk])
+        if owned:
             return Response({"detail": "Notification marked as read."}, status=status.HTTP_200_OK)
-        except Notification.DoesNotExist:
-            return Response({"detail": "Notification not found or you don't have permission."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"detail": "Notification not found or you don't have permission."}, status=status.HTTP_404_NOT_FOUND)
+
+class BulkMarkNotificationsAsReadView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, format=None):
+        # Mark several notifications as read in one request; ids of other users' notifications are ignored
+        serializer = NotificationIdListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        owned, newly_read = mark_read(request.user.pk, serializer.validated_data['ids'])
+        return Response({"ids": sorted(owned), "detail": f"{newly_read} notifications marked as read."}, status=status.HTTP_200_OK)
 
 class MarkAllNotificationsAsReadView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request, format=None):
-        # Mark all unread notifications for the current user as read
-        notifications_updated = Notification.objects.filter(recipient=request.user, is_read=False).update(is_read=True)
-        return Response({"detail": f"{notifications_updated} notifications marked as read."}, status=status.HTTP_200_OK)
+        # Mark all notifications for the current user as read by moving their watermark, a single-row write.
+        # Clients can pass `last_id`, the largest notification id they have shown, so newer arrivals stay unread.
+        # It is the largest id, not the id of the first notification in the list: the list is ordered by timestamp,
+        # and a notification that gained actors moves to the top but keeps its id. Only unread notifications gain
+        # actors; a new like on a read one creates a new notification, with a new id above the watermark.
+        up_to = request.data.get('last_id')
+        if up_to is not None:
+            try:
+                up_to = int(up_to)
+            except (TypeError, ValueError):
+                return Response({"last_id": ["A valid integer is required."]}, status=status.HTTP_400_BAD_REQUEST)
+        watermark, notifications_updated = mark_all_read(request.user.pk, up_to=up_to)
+        return Response({
+            "detail": f"{notifications_updated} notifications marked as read.",
+            "last_read_id": watermark,
+        }, status=status.HTTP_200_OK)
+
+class UnreadNotificationCountView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, format=None):
+        # Badge count from the per-user counter row instead of a COUNT over notifications
+        return Response({"unread_count": get_unread_count(request.user.pk)}, status=status.HTTP_200_OK)
@@ -0,0 +1,20 @@
+"""
+Async variant of the feed endpoint, served at /api/feed/async/.
+
+Same data, ordering and cursors as UserFeedView; see social_media_api.async_api.
+"""
+from social_media_api.async_api import async_api_view
+from . import timeline
+from .likes import aliked_post_ids
+from .pagination import KeysetPagination
+from .serializers import PostSerializer
+
+
+@async_api_view
+async def feed(request):
+    queryset = (await timeline.afeed_queryset(request.user)).select_related('author').order_by('-feed_at')
+    paginator = KeysetPagination()
+    page = await paginator.apaginate_queryset(queryset, request)
+    liked = await aliked_post_ids(request.user, [post.pk for post in page])
+    data = PostSerializer(page, many=True, context={'request': request, 'liked_post_ids': liked}).data
+    return paginator.get_paginated_response(data).data
@@ -0,0 +1,116 @@
+"""
+Buffered like/unlike writes.
+
+Like and unlike requests record an intent instead of writing. Intents are kept
+in memory per (user, post), where a later intent replaces an earlier one (see
+posts.likes, which also serves them back to their user), and a background worker
+writes them in batches every LIKE_FLUSH_INTERVAL seconds or once LIKE_BUFFER_SIZE
+intents are queued. A batch is one transaction: new likes with
+bulk_create(ignore_conflicts=True), removed likes with one DELETE, then one
+counter UPDATE per post, however many likes a viral post got in the interval, and
+the posts' trending scores (posts.trending).
+Set LIKE_BUFFERING to False to write each intent during the request instead.
+
+Intents leave the read-your-own-like overlay only once their batch has committed.
+While the worker retries a batch (e.g. on a locked database) they stay visible to
+their users, and a batch it gives up on because the database was locked or busy
+is queued again rather than dropped. Batches failing for any other reason
+(including other OperationalErrors, which would fail again) are dropped and logged.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import OperationalError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from notifications.dispatch import notify
+from social_media_api.background import BatchWorker
+from . import trending
+from .likes import pending
+from .models import Like, Post
+from .response_cache import bump, invalidate_post
+
+User = get_user_model()
+
+
+def write_likes(intents):
+    # Last intent per (user, post) wins; the batch is applied against what the database holds
+    latest = {}
+    for intent in intents:
+        key = (intent.user_id, intent.post_id)
+        if key not in latest or latest[key].seq < intent.seq:
+            latest[key] = intent
+    with transaction.atomic():
+        posts = Post.objects.only('pk', 'author').in_bulk({post_id for _, post_id in latest}) # Deleted posts drop out
+        existing = {
+            (user_id, post_id): (pk, created_at) for pk, user_id, post_id, created_at in Like.objects.filter(
+                user_id__in={user_id for user_id, _ in latest}, post_id__in=list(posts),
+            ).order_by().values_list('pk', 'user_id', 'post_id', 'created_at')
+        }
+        added = [key for key, intent in latest.items() if intent.liked and key[1] in posts and key not in existing]
+        removed = [key for key, intent in latest.items() if not intent.liked and key in existing]
+
+        now = timezone.now()
+        Like.objects.bulk_create([Like(user_id=user_id, post_id=post_id) for user_id, post_id in added], ignore_conflicts=True)
+        Like.objects.filter(pk__in=[existing[key][0] for key in removed]).delete()
+        deltas = Counter(post_id for _, post_id in added)
+        deltas.subtract(post_id for _, post_id in removed)
+        for post_id, delta in deltas.items():
+            if delta:
+                Post.objects.filter(pk=post_id).update(likes_count=F('likes_count') + delta)
+                invalidate_post(post_id, counters=True)
+        # An unlike takes back what the like added when it was made
+        trending.record(
+            [trending.TrendingEvent(post_id, 'like', 1, now) for _, post_id in added]
+            + [trending.TrendingEvent(key[1], 'like', -1, existing[key][1]) for key in removed]
+        )
+
+        # Queue notifications for post authors (bursts of likes are coalesced by the dispatcher)
+        for user_id, post_id in added:
+            post = posts[post_id]
+            # notify() only needs the ids, so the users aren't loaded
+            if post.author_id != user_id: # Don't notify if liking your own post
+                notify(recipient=User(pk=post.author_id), actor=User(pk=user_id), verb='liked', target=post)
+        # Written intents are in the database now; until the commit they are only visible through the overlay
+        transaction.on_commit(lambda: pending.forget(latest.values()))
+    return len(added), len(removed)
+
+
+def is_lock_error(error):
+    # Lock contention (SQLite's "database is locked", a deadlock or lock timeout elsewhere) clears up by itself
+    message = str(error).lower()
+    return isinstance(error, OperationalError) and ('lock' in message or 'busy' in message)
+
+
+def give_up(intents, error):
+    # The worker has stopped retrying this batch
+    if is_lock_error(error):
+        for intent in intents:
+            worker.submit(intent) # Still in the overlay; try again with the next batch
+    else:
+        pending.forget(intents) # Would fail again; stop showing what won't be written
+
+
+worker = BatchWorker(
+    write_likes,
+    name='like-writer',
+    batch_size=getattr(settings, 'LIKE_BUFFER_SIZE', 1000),
+    flush_interval=getattr(settings, 'LIKE_FLUSH_INTERVAL', 0.2),
+    on_give_up=give_up,
+)
+
+
+def record_like(user, post_id, liked=True):
+    # Queue a like (or unlike) of post_id by user; the user sees it at once, everyone else after the flush
+    intent = pending.record(user.pk, post_id, liked)
+    bump(f'likes:{user.pk}') # Drop the user's cached post responses, which embed "liked by me"
+    if getattr(settings, 'LIKE_BUFFERING', True):
+        worker.submit(intent)
+    else:
+        try:
+            write_likes([intent])
+        except Exception:
+            pending.forget([intent]) # The request fails; its intent mustn't outlive it
+            raise
@@ -0,0 +1,79 @@
+"""
+"Liked by me" lookups.
+
+Likes written through posts.like_buffer may still be waiting in memory; until
+they are written, `liked_post_ids` overlays the user's pending intents on what the
+database says, so users see their own like (or unlike) right away.
+
+The overlay lives in the memory of the process that took the request. Another
+worker process only sees the database, so until the batch is written a user can
+see their own like there as missing, and a repeated POST /like/ served by another
+process answers 201 instead of 409. The like is still written once (the unique
+(user, post) constraint makes the second insert a no-op).
+"""
+import itertools
+import threading
+from collections import namedtuple
+
+from .models import Like
+
+LikeIntent = namedtuple('LikeIntent', ['user_id', 'post_id', 'liked', 'seq'])
+
+
+class PendingLikes:
+    """Latest unwritten intent per (user, post), for the read-your-own-like overlay."""
+
+    def __init__(self):
+        self._intents = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def record(self, user_id, post_id, liked):
+        with self._lock:
+            intent = LikeIntent(user_id, post_id, liked, next(self._seq))
+            self._intents[(user_id, post_id)] = intent
+        return intent
+
+    def overlay(self, user_id, post_ids):
+        # post_id -> liked for the user's pending intents among post_ids
+        with self._lock:
+            return {post_id: self._intents[(user_id, post_id)].liked for post_id in post_ids if (user_id, post_id) in self._intents}
+
+    def forget(self, intents):
+        # Drop written intents, unless a newer intent for the same pair arrived meanwhile
+        with self._lock:
+            for intent in intents:
+                current = self._intents.get((intent.user_id, intent.post_id))
+                if current is not None and current.seq <= intent.seq:
+                    del self._intents[(intent.user_id, intent.post_id)]
+
+    def clear(self):
+        with self._lock:
+            self._intents.clear()
+
+
+pending = PendingLikes()
+
+
+def _apply(user_id, post_ids, liked):
+    # Overlay pending intents on the liked ids read from the database
+    liked = set(liked)
+    for post_id, state in pending.overlay(user_id, post_ids).items():
+        if state:
+            liked.add(post_id)
+        else:
+            liked.discard(post_id)
+    return liked
+
+
+def liked_post_ids(user, post_ids):
+    # Resolve which of the given posts the user has liked in a single query
+    if not user.is_authenticated or not post_ids:
+        return set()
+    return _apply(user.pk, post_ids, Like.objects.filter(user=user, post_id__in=post_ids).order_by().values_list('post_id', flat=True))
+
+
+async def aliked_post_ids(user, post_ids):
+    if not user.is_authenticated or not post_ids:
+        return set()
+    return _apply(user.pk, post_ids, [pk async for pk in Like.objects.filter(user=user, post_id__in=post_ids).order_by().values_list('post_id', flat=True)])
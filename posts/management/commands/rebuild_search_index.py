@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for posts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to rebuild the index on.')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Number of posts indexed per statement.')
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        if backend is None or not backend.is_available(options['database']):
+            raise CommandError('No full-text search backend is available for this database.')
+        indexed = backend.rebuild(using=options['database'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} posts.'))
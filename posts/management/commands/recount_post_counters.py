@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from posts.models import Comment, Like, Post
+from posts.response_cache import invalidate
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized likes_count/comments_count on posts and fix any drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of posts recounted per transaction.')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        last_pk = 0
+        checked = fixed = 0
+
+        # Walk posts in primary-key order so each chunk is a short, bounded transaction
+        while True:
+            posts = list(
+                Post.objects.filter(pk__gt=last_pk).order_by('pk')
+                .only('pk', 'likes_count', 'comments_count')[:chunk_size]
+            )
+            if not posts:
+                break
+            last_pk = posts[-1].pk
+            pks = [post.pk for post in posts]
+
+            with transaction.atomic():
+                likes = dict(Like.objects.filter(post__in=pks).order_by().values_list('post').annotate(n=Count('pk')))
+                comments = dict(Comment.objects.filter(post__in=pks).order_by().values_list('post').annotate(n=Count('pk')))
+                drifted = []
+                for post in posts:
+                    counts = (likes.get(post.pk, 0), comments.get(post.pk, 0))
+                    if (post.likes_count, post.comments_count) != counts:
+                        post.likes_count, post.comments_count = counts
+                        drifted.append(post)
+                Post.objects.bulk_update(drifted, ['likes_count', 'comments_count'])
+                if drifted:
+                    # Cached responses still show the drifted counters
+                    invalidate('counters', *[f'post:{post.pk}' for post in drifted])
+
+            checked += len(posts)
+            fixed += len(drifted)
+
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} posts, fixed {fixed} drifted counters.'))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import trending
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the trending rankings from recent likes and comments (run periodically, e.g. every few minutes).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', action='append', choices=list(trending.windows()),
+                            help='Window to rescore; repeat for several (default: all).')
+        parser.add_argument('--every', type=float, help='Keep rescoring every N seconds instead of once.')
+
+    def handle(self, *args, **options):
+        names = options['window'] or list(trending.windows())
+        while True:
+            for name in names:
+                kept = trending.rescore(name)
+                self.stdout.write(self.style.SUCCESS(f'Rescored {name}: {kept} posts ranked.'))
+            if not options['every']:
+                return
+            time.sleep(options['every'])
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+FTS_TABLE = 'posts_post_fts'
+
+
+def create_fts_table(apps, schema_editor):
+    # FTS5 is SQLite-only; other databases fall back to the LIKE-based SearchFilter
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        "title, content, author_username, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    # Titles weigh more than author names, which weigh more than body text
+    schema_editor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES('rank', 'bm25(10.0, 1.0, 5.0)')")
+    schema_editor.execute(
+        f"INSERT INTO {FTS_TABLE}(rowid, title, content, author_username) "
+        "SELECT p.id, p.title, p.content, u.username FROM posts_post p JOIN accounts_user u ON u.id = p.author_id"
+    )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_post_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -8,9 +8,18 @@ class Post(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized counters, kept in step with Like/Comment writes using F() expressions
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         ordering = ['-created_at'] # Order posts by creation date, newest first
+        # Ascending on purpose: scanned backwards, the index (with the rowid SQLite appends)
+        # serves both ORDER BY created_at DESC, id DESC and the ascending keyset pages
+        indexes = [
+            models.Index(fields=['created_at'], name='posts_post_recent'), # Post list
+            models.Index(fields=['author', 'created_at'], name='posts_post_author_recent'), # Per-author listings, timeline backfill
+        ]
 
     def __str__(self):
         return f"{self.title} by {self.author.username}"
@@ -26,6 +35,10 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['created_at'] # Order comments by creation date, oldest first
+        indexes = [
+            models.Index(fields=['post', 'created_at'], name='posts_comment_post_created'), # Comments of a post, in order
+            models.Index(fields=['created_at'], name='posts_comment_created'), # Recent comments, for trending rescores
+        ]
 
     def __str__(self):
         return f"Comment by {self.author.username} on {self.post.title[:30]}..."
@@ -39,6 +52,52 @@ class Like(models.Model):
         # Ensure a user can only like a specific post once
         unique_together = ('user', 'post')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['post', 'created_at'], name='posts_like_post_recent'), # Likers of a post, newest first
+            models.Index(fields=['created_at'], name='posts_like_created'), # Recent likes, for trending rescores
+        ]
 
     def __str__(self):
         return f"{self.user.username} liked {self.post.title}"
+
+class TimelineEntry(models.Model):
+    # Materialized home timeline row: a post pushed to one user's feed when it was written
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    created_at = models.DateTimeField() # Copy of post.created_at so a timeline can be read by range without the posts table
+
+    class Meta:
+        unique_together = ('user', 'post')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='posts_timeline_user_recent'),
+        ]
+
+    def __str__(self):
+        return f"Post {self.post_id} in timeline of user {self.user_id}"
+
+class TrendingWindow(models.Model):
+    # Scores of a trending window are stored relative to its epoch (see posts.trending)
+    name = models.CharField(max_length=10, primary_key=True) # 'hour', 'day', 'week'
+    epoch = models.DateTimeField()
+    rescored_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Trending window {self.name} (epoch {self.epoch:%Y-%m-%d %H:%M})"
+
+class TrendingScore(models.Model):
+    # Time-decayed like/comment score of a post in one trending window
+    window = models.CharField(max_length=10)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='trending_scores')
+    score = models.FloatField(default=0)
+    last_event_at = models.DateTimeField() # Newest like or comment counted; posts quiet for a whole window drop out
+
+    class Meta:
+        unique_together = ('window', 'post')
+        indexes = [
+            # Scanned backwards: the window's ranking, highest score first, without a sort
+            models.Index(fields=['window', 'score', 'post'], name='posts_trending_rank'),
+        ]
+
+    def __str__(self):
+        return f"Post {self.post_id} scores {self.score:.3g} in {self.window}"
@@ -0,0 +1,223 @@
+import datetime
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import namedtuple
+
+from django.core.exceptions import FieldDoesNotExist, FieldError, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+Cursor = namedtuple('Cursor', ['position', 'reverse'])
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder truncates datetimes to milliseconds, which would skip or repeat rows
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on (ordering field, pk).
+
+    The ordering is taken from the queryset itself, so whatever `OrderingFilter`
+    (or the model's Meta.ordering) applied is respected; only its first field is
+    used, with the primary key as a tie-breaker. Pages are fetched with a WHERE
+    clause on the last seen key instead of OFFSET, and no COUNT(*) is ever issued.
+
+    The ordering field may be a model field (relations are keyed on their `_id`
+    column) or an annotation with a resolvable output_field, such as `feed_at`
+    or `search_rank`; cursor values are parsed back through that field.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering = '-created_at' # Fallback when neither the queryset nor the model defines an ordering
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset, cursor = self.get_page_queryset(queryset, request)
+        return self.finish_page(list(queryset), cursor)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        # For async views: the page is read with the async ORM (prefetches included)
+        queryset, cursor = self.get_page_queryset(queryset, request)
+        return self.finish_page([obj async for obj in queryset.aiterator(chunk_size=self.page_size + 1)], cursor)
+
+    def get_page_queryset(self, queryset, request):
+        # Apply keyset ordering and filtering; returns the sliced queryset for one page (+1 look-ahead row)
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.field, self.descending = self.get_ordering(queryset)
+        self.model = queryset.model
+        self.cursor_field = self._cursor_field(queryset)
+
+        cursor = self.decode_cursor(request)
+        descending = self.descending != bool(cursor and cursor.reverse)
+        if cursor is not None:
+            queryset = queryset.filter(self._keyset_condition(cursor.position, descending))
+
+        prefix = '-' if descending else ''
+        keys = [prefix + 'pk'] if self.field == 'pk' else [prefix + self.field, prefix + 'pk']
+        return queryset.order_by(*keys)[:self.page_size + 1], cursor
+
+    def finish_page(self, results, cursor):
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if cursor is not None and cursor.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.next_position = self._get_position(results[-1]) if results else None
+        self.previous_position = self._get_position(results[0]) if results else None
+        return results
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                size = int(request.query_params[self.page_size_query_param])
+            except (KeyError, ValueError):
+                return self.page_size
+            if size > 0:
+                return min(size, self.max_page_size) if self.max_page_size else size
+        return self.page_size
+
+    def get_ordering(self, queryset):
+        ordering = [o for o in (queryset.query.order_by or ()) if isinstance(o, str)]
+        if not ordering and queryset.query.default_ordering:
+            ordering = [o for o in queryset.model._meta.ordering if isinstance(o, str)]
+        field = ordering[0] if ordering else self.ordering
+        descending = field.startswith('-')
+        field = field.lstrip('-')
+        if field in ('id', queryset.model._meta.pk.name):
+            field = 'pk'
+        elif field not in queryset.query.annotations:
+            field = self._column_path(queryset.model, field)
+        return field, descending
+
+    def _column_path(self, model, path):
+        # Key relations on their `_id` column: ordering by `post` would otherwise put a Post instance in the cursor
+        parts = path.split('__')
+        for i, part in enumerate(parts):
+            try:
+                field = model._meta.get_field(part)
+            except (FieldDoesNotExist, AttributeError):
+                return path
+            if field.many_to_one or (field.one_to_one and field.concrete):
+                if i == len(parts) - 1 or parts[i + 1] in ('id', 'pk', field.target_field.name):
+                    return '__'.join(parts[:i] + [field.attname])
+            model = field.related_model
+        return path
+
+    def _keyset_condition(self, position, descending):
+        value, pk = position
+        op = 'lt' if descending else 'gt'
+        if self.field == 'pk':
+            return Q(**{f'pk__{op}': pk})
+        return Q(**{f'{self.field}__{op}': value}) | Q(**{self.field: value, f'pk__{op}': pk})
+
+    def _get_position(self, instance):
+        value = instance
+        for part in self.field.split('__'):
+            value = value[part] if isinstance(value, dict) else getattr(value, part)
+        pk = instance['pk'] if isinstance(instance, dict) else instance.pk
+        return value, pk
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            tokens = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            value, pk = tokens['p']
+            if self.cursor_field is not None:
+                value = self.cursor_field.to_python(value)
+            return Cursor(position=(value, int(pk)), reverse=bool(tokens.get('r')))
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position, reverse):
+        tokens = {'p': list(position)}
+        if reverse:
+            tokens['r'] = 1
+        encoded = urlsafe_b64encode(json.dumps(tokens, cls=CursorEncoder).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def _cursor_field(self, queryset):
+        # Field used to parse cursor values back: the model field, or the annotation's output_field
+        if self.field == 'pk':
+            return self.model._meta.pk
+        annotation = queryset.query.annotations.get(self.field)
+        if annotation is not None:
+            try:
+                return annotation.output_field
+            except FieldError:
+                return None
+        model, field = self.model, None
+        for part in self.field.split('__'):
+            try:
+                field = model._meta.get_field(part)
+            except (FieldDoesNotExist, AttributeError):
+                return None
+            model = field.related_model
+        if field is not None and field.is_relation and field.concrete:
+            field = field.target_field # `<fk>_id` holds the related primary key
+        return field
+
+    def get_next_link(self):
+        if not self.has_next or self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.previous_position is None:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.previous_position, reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+        ]
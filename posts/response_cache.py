@@ -0,0 +1,170 @@
+"""
+Response cache for public post reads.
+
+Rendered GET responses are cached per host, path, query string, viewer (anonymous
+or the user id, since `is_liked_by_current_user` differs per viewer) and
+renderer. Invalidation is versioned: every cached entry records the version of
+each thing it depends on, and writes bump only the versions they affect:
+
+    post:<id>  a post's fields, its counters, its likes and comments
+    posts      which posts exist and what they say (list membership, search)
+    counters   like/comment counts, for lists ordered by them
+
+A hit re-reads those versions in one cache round trip and serves the stored
+bytes without touching the database. Versions are the time of the last bump, so a
+version evicted from the cache comes back newer and invalidates its entries
+instead of resetting a counter. Only JSON responses are cached (the browsable
+API embeds per-session forms).
+Responses carry a strong ETag (hash of the body) and Last-Modified, and
+conditional GETs get 304 Not Modified. Entries also expire after
+RESPONSE_CACHE_TIMEOUT seconds, which bounds how long a list page rendered while
+one of its posts was being written can be served.
+
+Versions only work if every process reads and bumps the same ones, so the cache
+must be shared (Redis, files on one host, ...). On a per-process LocMemCache a
+write in one worker wouldn't invalidate what the others cached, and responses
+aren't cached at all unless RESPONSE_CACHE_ALLOW_LOCAL is set (single process).
+"""
+import hashlib
+import time
+from email.utils import formatdate
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.dateparse import parse_datetime
+from rest_framework.response import Response
+
+KEY_PREFIX = 'response-cache'
+
+
+def get_cache():
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def is_enabled():
+    # Process-local versions can't be invalidated by writes in other processes
+    return getattr(settings, 'RESPONSE_CACHE_ALLOW_LOCAL', False) or not isinstance(get_cache(), LocMemCache)
+
+
+def _version_key(name):
+    return f'{KEY_PREFIX}:v:{name}'
+
+
+def _new_version():
+    # Nanosecond timestamp: unique per bump, and doubles as the time of the change for Last-Modified
+    return time.time_ns()
+
+
+def get_versions(names):
+    cache = get_cache()
+    keys = {_version_key(name): name for name in names}
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        # Unknown (never bumped or evicted): start a new version, which no stored entry can match
+        for key in missing:
+            cache.add(key, _new_version(), None)
+        found.update(cache.get_many(missing))
+    return {name: found.get(key) for key, name in keys.items()}
+
+
+def bump(*names):
+    get_cache().set_many({_version_key(name): _new_version() for name in names}, None)
+
+
+def invalidate(*names):
+    # Bump once the surrounding transaction commits, so readers can't re-cache the old rows
+    transaction.on_commit(lambda: bump(*names))
+
+
+def invalidate_post(post_id, listing=False, counters=False):
+    names = [f'post:{post_id}']
+    if listing:
+        names.append('posts')
+    if counters:
+        names.append('counters')
+    invalidate(*names)
+
+
+def _last_modified(data, versions):
+    # Newest updated_at among the serialized rows, or the newest version bump if that's later
+    rows = data.get('results', [data]) if isinstance(data, dict) else data
+    stamps = [parse_datetime(row['updated_at']).timestamp() for row in rows if isinstance(row, dict) and row.get('updated_at')]
+    stamps += [version / 1e9 for version in versions.values() if version]
+    return max(stamps) if stamps else None
+
+
+def _conditional_response(request, entry, response):
+    # Add the validators and answer a matching If-None-Match / If-Modified-Since with 304
+    response['ETag'] = entry['etag']
+    if entry['last_modified'] is not None:
+        response['Last-Modified'] = formatdate(entry['last_modified'], usegmt=True)
+    response['Cache-Control'] = 'private, no-cache' if entry['private'] else 'public, no-cache' # Always revalidate with the ETag
+    patch_vary_headers(response, ('Accept', 'Authorization'))
+    return get_conditional_response(
+        request, etag=entry['etag'], last_modified=int(entry['last_modified'] or 0) or None, response=response,
+    )
+
+
+class CachedResponseMixin:
+    """
+    Caches the rendered responses of `cached_actions` for GET requests.
+
+    Views declare what a response depends on: `get_request_dependencies()` is read
+    before the handler runs (e.g. the post in the URL), `get_result_dependencies(data)`
+    after it (e.g. the posts on a list page).
+    """
+    cached_actions = ('list', 'retrieve')
+
+    def get_request_dependencies(self):
+        return []
+
+    def get_result_dependencies(self, data):
+        return []
+
+    def get_response_cache_key(self, request):
+        viewer = f'user:{request.user.pk}' if request.user.is_authenticated else 'anon'
+        raw = '|'.join([request.get_host(), request.get_full_path(), viewer])
+        return f'{KEY_PREFIX}:r:' + hashlib.sha256(raw.encode()).hexdigest()
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if request.method != 'GET' or self.action not in self.cached_actions or request.accepted_renderer.format != 'json' or not is_enabled():
+            return handler(request, *args, **kwargs)
+
+        key = self.get_response_cache_key(request)
+        entry = get_cache().get(key)
+        if entry is not None and get_versions(entry['versions']) == entry['versions']:
+            return _conditional_response(request._request, entry, HttpResponse(entry['content'], content_type=entry['content_type']))
+
+        self._response_cache_key = key
+        self._response_cache_versions = get_versions(self.get_request_dependencies())
+        return handler(request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(self, '_response_cache_key', None)
+        if key is None or not isinstance(response, Response) or response.status_code != 200:
+            return response
+
+        response.render()
+        versions = {**self._response_cache_versions, **get_versions(self.get_result_dependencies(response.data))}
+        entry = {
+            'content': response.content,
+            'content_type': response['Content-Type'],
+            'etag': '"%s"' % hashlib.sha256(response.content).hexdigest(),
+            'last_modified': _last_modified(response.data, versions),
+            'private': request.user.is_authenticated,
+            'versions': versions,
+        }
+        get_cache().set(key, entry, getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300))
+        return _conditional_response(request._request, entry, response)
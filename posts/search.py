@@ -0,0 +1,151 @@
+"""
+Full-text search for posts.
+
+The search backend is pluggable through the POSTS_SEARCH_BACKEND setting. The
+default keeps an SQLite FTS5 virtual table (one row per post, rowid = post id)
+in sync through post_save/post_delete signals and ranks matches with bm25.
+When the backend is unavailable (e.g. another database vendor) the filter
+falls back to DRF's LIKE-based SearchFilter.
+"""
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from rest_framework import filters
+from rest_framework.settings import api_settings
+
+from .models import Post
+
+DEFAULT_BACKEND = 'posts.search.SQLiteFTS5Backend'
+RANK_ANNOTATION = 'search_rank'
+
+
+class BaseSearchBackend:
+    def is_available(self, using='default'):
+        return False
+
+    def search(self, queryset, terms):
+        # Restrict the queryset to matching posts, annotated with RANK_ANNOTATION (lower is better)
+        raise NotImplementedError
+
+    def index(self, post, using='default'):
+        pass
+
+    def remove(self, post_id, using='default'):
+        pass
+
+    def rebuild(self, using='default', chunk_size=1000):
+        return 0
+
+
+class SQLiteFTS5Backend(BaseSearchBackend):
+    table = 'posts_post_fts'
+
+    def __init__(self):
+        self._available = {}
+
+    def is_available(self, using='default'):
+        if using not in self._available:
+            connection = connections[using]
+            self._available[using] = (
+                connection.vendor == 'sqlite' and self.table in connection.introspection.table_names()
+            )
+        return self._available[using]
+
+    def build_match_query(self, terms):
+        # Quote every term so user input can't inject FTS5 syntax; a trailing '*' keeps prefix matching
+        tokens = []
+        for term in terms:
+            prefix = term.endswith('*')
+            term = term.rstrip('*').strip()
+            if not term:
+                continue
+            tokens.append('"%s"%s' % (term.replace('"', '""'), '*' if prefix else ''))
+        return ' AND '.join(tokens)
+
+    def search(self, queryset, terms):
+        match = self.build_match_query(terms)
+        if not match:
+            return queryset
+        post_table = Post._meta.db_table
+        return queryset.extra(
+            tables=[self.table],
+            where=[f'{self.table}.rowid = {post_table}.id', f'{self.table} MATCH %s'],
+            params=[match],
+        ).annotate(**{RANK_ANNOTATION: RawSQL(f'{self.table}.rank', ())})
+
+    def _select_documents_sql(self):
+        post_table = Post._meta.db_table
+        user_table = get_user_model()._meta.db_table
+        return (
+            f'SELECT p.id, p.title, p.content, u.username FROM {post_table} p '
+            f'JOIN {user_table} u ON u.id = p.author_id'
+        )
+
+    def index(self, post, using='default'):
+        if not self.is_available(using):
+            return
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [post.pk])
+            cursor.execute(
+                f'INSERT INTO {self.table}(rowid, title, content, author_username) '
+                f'{self._select_documents_sql()} WHERE p.id = %s',
+                [post.pk],
+            )
+
+    def remove(self, post_id, using='default'):
+        if not self.is_available(using):
+            return
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [post_id])
+
+    def rebuild(self, using='default', chunk_size=1000):
+        # Re-index every post in primary-key chunks, then merge the index b-trees
+        if not self.is_available(using):
+            return 0
+        indexed, last_pk = 0, 0
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            while True:
+                cursor.execute(
+                    f'INSERT INTO {self.table}(rowid, title, content, author_username) '
+                    f'{self._select_documents_sql()} WHERE p.id > %s ORDER BY p.id LIMIT %s',
+                    [last_pk, chunk_size],
+                )
+                if cursor.rowcount <= 0:
+                    break
+                indexed += cursor.rowcount
+                cursor.execute(f'SELECT MAX(rowid) FROM {self.table}')
+                last_pk = cursor.fetchone()[0]
+            cursor.execute(f"INSERT INTO {self.table}({self.table}) VALUES('optimize')")
+        return indexed
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    path = getattr(settings, 'POSTS_SEARCH_BACKEND', DEFAULT_BACKEND)
+    return import_string(path)() if path else None
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    Drop-in replacement for SearchFilter backed by the configured search backend.
+
+    Place it after OrderingFilter: results are ordered by relevance unless the
+    client asked for an explicit ?ordering=.
+    """
+    ordering_param = api_settings.ORDERING_PARAM
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        backend = get_search_backend()
+        if not terms or backend is None or not backend.is_available(queryset.db):
+            return super().filter_queryset(request, queryset, view)
+
+        queryset = backend.search(queryset, terms)
+        if RANK_ANNOTATION in queryset.query.annotations and not request.query_params.get(self.ordering_param):
+            queryset = queryset.order_by(RANK_ANNOTATION)
+        return queryset
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Post, Comment, Like
+from .likes import liked_post_ids
 from accounts.serializers import UserSerializer # Import UserSerializer for nested representation
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -12,21 +13,24 @@ class CommentSerializer(serializers.ModelSerializer):
 
 class PostSerializer(serializers.ModelSerializer):
     author = serializers.ReadOnlyField(source='author.username')
-    likes_count = serializers.SerializerMethodField() 
     is_liked_by_current_user = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
-        fields = ['id', 'author', 'title', 'content', 'created_at', 'updated_at', 'likes_count', 'is_liked_by_current_user']
-        read_only_fields = ['author', 'created_at', 'updated_at'] # Author set by view
-
-    def get_likes_count(self, obj):
-        # Returns the total number of likes for the post
-        return obj.likes.count()
+        fields = ['id', 'author', 'title', 'content', 'created_at', 'updated_at', 'likes_count', 'comments_count', 'is_liked_by_current_user']
+        read_only_fields = ['author', 'created_at', 'updated_at', 'likes_count', 'comments_count'] # Author set by view, counters maintained by like/comment views
 
     def get_is_liked_by_current_user(self, obj):
+        # List views resolve the whole page up front and pass the liked ids in the context
+        liked = self.context.get('liked_post_ids')
+        if liked is not None:
+            return obj.pk in liked
         # Checks if the authenticated user has liked this post
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return obj.likes.filter(user=request.user).exists()
-        return False
\ No newline at end of file
+            return obj.pk in liked_post_ids(request.user, [obj.pk])
+        return False
+
+class PostIdListSerializer(serializers.Serializer):
+    # Input for bulk lookups keyed by post id (e.g. refreshing "liked" flags)
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=100)
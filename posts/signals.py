@@ -0,0 +1,24 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Post
+from .search import get_search_backend
+
+INDEXED_FIELDS = {'title', 'content', 'author'}
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, update_fields=None, using='default', **kwargs):
+    # Counter-only saves don't change the searchable text
+    if update_fields is not None and not INDEXED_FIELDS.intersection(update_fields):
+        return
+    backend = get_search_backend()
+    if backend is not None:
+        backend.index(instance, using=using)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, using='default', **kwargs):
+    backend = get_search_backend()
+    if backend is not None:
+        backend.remove(instance.pk, using=using)
@@ -1,3 +1,688 @@
-from django.test import TestCase
+import datetime
+import io
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from accounts import graph
+from accounts.authentication import issue_token
+from accounts.models import User
+from social_media_api.testing import QueryPlanMixin, requires_sqlite
+from . import like_buffer, timeline, trending
+from .likes import liked_post_ids, pending
+from .pagination import KeysetPagination
+from .response_cache import get_cache, get_versions
+from .search import get_search_backend
+from .models import Post, Comment, Like, TimelineEntry, TrendingScore, TrendingWindow
+
+
+# Every test class overrides CACHES with this: setUp calls cache.clear(), which must never reach
+# whatever cache the settings configure (a shared Redis, say).
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'posts-tests'}}
+
+# Query regression tests: each endpoint runs a fixed number of queries however many rows
+# a page holds (an N+1 shows up as a count that grows with the seed data), and its
+# queries are served by indexes.
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class PostQueryTestCase(QueryPlanMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice, cls.bob, cls.carol = [
+            User.objects.create_user(username=name, email=f'{name}@example.com', password='password')
+            for name in ('alice', 'bob', 'carol')
+        ]
+        graph.follow(cls.alice, cls.bob)
+        graph.follow(cls.alice, cls.carol)
+        authors = [cls.alice, cls.bob, cls.carol]
+        for i in range(25):
+            post = Post.objects.create(author=authors[i % 3], title=f'Post {i}', content='Some content')
+            timeline.push_post(post)
+        cls.post = post
+        for i in range(12):
+            Comment.objects.create(post=cls.post, author=authors[i % 3], content=f'Comment {i}')
+        for post in Post.objects.all()[:5]:
+            Like.objects.create(user=cls.alice, post=post)
+        for window in trending.windows():
+            trending.rescore(window)
+
+    def setUp(self):
+        cache.clear()
+        timeline.large_author_ids() # Warm the cached large-author lookup the feed reads
+        self.client.force_authenticate(self.alice)
+
+    def test_post_list_query_count(self):
+        # Page of posts with their authors, then "liked by me" for the whole page
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('post-list'))
+        self.assertEqual(len(response.data['results']), 10)
+        with self.assertNumQueries(2):
+            self.client.get(response.data['next'])
+
+    def test_post_list_anonymous_query_count(self):
+        self.client.force_authenticate(None)
+        with self.assertNumQueries(1):
+            self.client.get(reverse('post-list'))
+
+    def test_post_detail_query_count(self):
+        with self.assertNumQueries(2):
+            self.client.get(reverse('post-detail', args=[self.post.pk]))
+
+    def test_feed_query_count(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('user-feed'))
+        self.assertEqual(len(response.data['results']), 10)
+        with self.assertNumQueries(2):
+            self.client.get(response.data['next'])
+
+    def test_trending_query_count(self):
+        # Ranked scores joined with their posts and authors, then "liked by me"
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('post-trending') + '?window=week')
+        self.assertEqual(response.data['results'][0]['id'], self.post.pk) # Most commented
+
+    def test_comment_list_query_count(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('post-comments-list', args=[self.post.pk]))
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_async_feed_matches_feed(self):
+        # Plain async view with its own token authentication: same pages and cursors as the DRF view
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {issue_token(self.alice).key}')
+        url, async_url = reverse('user-feed') + '?page_size=7', reverse('user-feed-async') + '?page_size=7'
+        while url:
+            response, async_response = self.client.get(url), self.client.get(async_url)
+            self.assertEqual(async_response.status_code, 200)
+            self.assertEqual(async_response.json()['results'], response.json()['results'])
+            url, async_url = response.data['next'], async_response.json()['next']
+        self.assertIsNone(async_url)
+
+    def test_async_view_errors(self):
+        self.assertEqual(self.client.get(reverse('user-feed-async')).status_code, 401) # DRF's force_authenticate doesn't apply
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {issue_token(self.alice).key}')
+        self.assertEqual(self.client.get(reverse('user-feed-async') + '?cursor=bogus').status_code, 404)
+        self.assertEqual(self.client.post(reverse('user-feed-async')).status_code, 405)
+
+    @requires_sqlite
+    def test_post_list_plan(self):
+        response = self.assertIndexedQueries(reverse('post-list'))
+        self.assertIndexedQueries(response.data['next'])
+        self.assertIndexedQueries(reverse('post-list') + '?ordering=created_at')
+
+    @requires_sqlite
+    def test_feed_plan(self):
+        response = self.assertIndexedQueries(reverse('user-feed'))
+        self.assertIndexedQueries(response.data['next'])
+
+    @requires_sqlite
+    def test_comment_list_plan(self):
+        response = self.assertIndexedQueries(reverse('post-comments-list', args=[self.post.pk]))
+        self.assertIndexedQueries(response.data['next'])
+
+    @requires_sqlite
+    def test_trending_plan(self):
+        self.assertIndexedQueries(reverse('post-trending'))
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class KeysetPaginationTestCase(APITestCase):
+    # Cursors on (ordering field, id) over ties and microsecond timestamps (posts.pagination)
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username='alice', email='alice@example.com', password='password')
+        posts = [Post.objects.create(author=cls.alice, title=f'Post {i % 4}', content='Some content') for i in range(11)]
+        base = timezone.now()
+        for i, post in enumerate(posts):
+            # Pairs of equal timestamps, the pairs a microsecond apart
+            Post.objects.filter(pk=post.pk).update(created_at=base + datetime.timedelta(microseconds=i // 2), likes_count=i % 3)
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, url, link='next'):
+        # ids of every page followed through `link`, plus the last response
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([post['id'] for post in response.data['results']])
+            url = response.data[link]
+        return pages, response
+
+    def assertWalks(self, ordering, keys):
+        expected = list(Post.objects.order_by(*keys).values_list('pk', flat=True))
+        pages, last = self.walk(reverse('post-list') + f'?ordering={ordering}&page_size=4')
+        self.assertEqual([len(page) for page in pages], [4, 4, 3])
+        self.assertEqual(sum(pages, []), expected)
+        # And back again through the previous links
+        previous, _ = self.walk(last.data['previous'], link='previous')
+        self.assertEqual(previous, pages[-2::-1])
+
+    def test_timestamp_ties(self):
+        self.assertWalks('-created_at', ['-created_at', '-pk'])
+
+    def test_counter_ties(self):
+        self.assertWalks('likes_count', ['likes_count', 'pk'])
+
+    def test_text_ordering(self):
+        self.assertWalks('-title', ['-title', '-pk'])
+
+    def test_relation_ordering(self):
+        post = Post.objects.first()
+        for i in range(5):
+            Comment.objects.create(post=post, author=self.alice, content=f'Comment {i}')
+        url = reverse('post-comments-list', kwargs={'post_pk': post.pk})
+        for ordering, keys in (('post', ['post_id', 'pk']), ('-post', ['-post_id', '-pk'])):
+            expected = list(Comment.objects.order_by(*keys).values_list('pk', flat=True))
+            pages, _ = self.walk(url + f'?ordering={ordering}&page_size=2') # Cursors hold the `_id` column
+            self.assertEqual(sum(pages, []), expected)
+
+    def test_annotation_cursor_is_typed(self):
+        paginator = KeysetPagination()
+        request = Request(APIRequestFactory().get('/'))
+        queryset = Post.objects.annotate(feed_at=F('created_at')).order_by('-feed_at')
+        page = paginator.paginate_queryset(queryset, request)
+        request = Request(APIRequestFactory().get(paginator.get_next_link()))
+        queryset, cursor = paginator.get_page_queryset(queryset, request)
+        self.assertEqual(cursor.position, (page[-1].feed_at, page[-1].pk)) # A datetime, not its ISO string
+
+    def test_page_size_and_invalid_cursor(self):
+        response = self.client.get(reverse('post-list') + '?page_size=1000')
+        self.assertEqual(len(response.data['results']), 11) # Capped at 100
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(self.client.get(reverse('post-list') + '?cursor=bm90IGpzb24=').status_code, 404)
+
+    def test_no_count_or_offset(self):
+        response = self.client.get(reverse('post-list') + '?page_size=4')
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(response.data['next'])
+        sql = context.captured_queries[0]['sql'].upper()
+        self.assertNotIn('COUNT(', sql)
+        self.assertNotIn('OFFSET', sql)
+
+
+@requires_sqlite
+@override_settings(CACHES=LOCAL_CACHE)
+class SearchTestCase(APITestCase):
+    # FTS5 search (posts.search), kept in sync by signals and ranked by bm25
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice, cls.bob = [
+            User.objects.create_user(username=name, email=f'{name}@example.com', password='password')
+            for name in ('alice', 'bob')
+        ]
+        cls.django, cls.mention, cls.other, cls.djangonaut = [
+            Post.objects.create(author=author, title=title, content=content) for author, title, content in (
+                (cls.alice, 'Django tips', 'Django querysets are lazy; django caches them'),
+                (cls.bob, 'Weekend', 'Went hiking, then read about Django'),
+                (cls.bob, 'Recipes', 'Bread and soup'),
+                (cls.bob, 'Meetup', 'Djangonauts everywhere'),
+            )
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query, **params):
+        response = self.client.get(reverse('post-list'), {'search': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [post['id'] for post in response.json()['results']]
+
+    def test_ranked_matches(self):
+        self.assertEqual(self.search('django'), [self.django.pk, self.mention.pk])
+        self.assertEqual(self.search('django', ordering='-created_at'), [self.mention.pk, self.django.pk])
+        self.assertEqual(self.search('hiking django'), [self.mention.pk]) # Every term must match
+        self.assertEqual(self.search('alice'), [self.django.pk]) # Author usernames are indexed
+
+    def test_prefix_and_quoting(self):
+        self.assertEqual(set(self.search('djang*')), {self.django.pk, self.mention.pk, self.djangonaut.pk})
+        self.assertEqual(self.search('"bread" OR soup NEAR('), []) # Input is quoted, not FTS5 syntax
+
+    def test_ranked_pages(self):
+        Post.objects.bulk_create([Post(author=self.bob, title=f'Soup {i}', content='Soup') for i in range(4)])
+        get_search_backend().rebuild() # bulk_create sends no signals
+        expected = self.search('soup', page_size=10)
+        page = self.client.get(reverse('post-list'), {'search': 'soup', 'page_size': 2}).json()
+        pages = [post['id'] for post in page['results']]
+        while page['next']:
+            page = self.client.get(page['next']).json()
+            pages += [post['id'] for post in page['results']]
+        self.assertEqual(pages, expected)
+        self.assertEqual(len(expected), 5)
+
+    def test_index_follows_writes(self):
+        self.other.title = 'Django bread'
+        self.other.save()
+        self.mention.delete()
+        self.assertEqual(set(self.search('django')), {self.django.pk, self.other.pk})
+
+    def test_rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM posts_post_fts')
+        out = io.StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 4 posts.', out.getvalue())
+        self.assertEqual(self.search('django'), [self.django.pk, self.mention.pk])
+
+    @override_settings(POSTS_SEARCH_BACKEND=None)
+    def test_fallback_search(self):
+        get_search_backend.cache_clear()
+        self.addCleanup(get_search_backend.cache_clear)
+        self.assertEqual(set(self.search('hiking')), {self.mention.pk}) # LIKE-based SearchFilter
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class TimelineTestCase(TestCase):
+    # Fan-out on write, with read-time merge for large authors (posts.timeline)
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice, cls.bob, cls.carol, cls.dave = [
+            User.objects.create_user(username=name, email=f'{name}@example.com', password='password')
+            for name in ('alice', 'bob', 'carol', 'dave')
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.enterContext(mock.patch.object(timeline, 'FANOUT_THRESHOLD', 2))
+
+    def post(self, author):
+        post = Post.objects.create(author=author, title='Post', content='Some content')
+        timeline.push_post(post)
+        return post
+
+    def follow(self, follower, followee):
+        with self.captureOnCommitCallbacks(execute=True):
+            graph.follow(follower, followee)
+
+    def unfollow(self, follower, followee):
+        with self.captureOnCommitCallbacks(execute=True):
+            graph.unfollow(follower, followee)
+
+    def feed(self, user):
+        return list(timeline.feed_queryset(user).order_by('-feed_at', '-pk').values_list('pk', flat=True))
+
+    def entries(self, user):
+        return set(TimelineEntry.objects.filter(user=user).values_list('post_id', flat=True))
+
+    def test_fan_out_backfill_and_trim(self):
+        self.follow(self.alice, self.bob)
+        post = self.post(self.bob)
+        self.assertEqual(self.entries(self.alice), {post.pk}) # Pushed on write
+        self.assertEqual(self.feed(self.bob), [post.pk]) # Authors see their own posts
+
+        older = self.post(self.dave)
+        self.follow(self.carol, self.dave)
+        self.assertEqual(self.entries(self.carol), {older.pk}) # Backfilled on follow
+        self.unfollow(self.carol, self.dave)
+        self.assertEqual(self.feed(self.carol), []) # Trimmed on unfollow
+
+    def test_large_authors_are_merged_at_read_time(self):
+        self.follow(self.alice, self.bob)
+        self.follow(self.carol, self.bob)
+        post = self.post(self.bob)
+        self.assertEqual(self.entries(self.alice), set())
+        self.assertEqual(self.feed(self.alice), [post.pk])
+        self.assertEqual(self.feed(self.carol), [post.pk])
+        self.assertEqual(self.feed(self.dave), [])
+
+    def test_promotion_and_demotion(self):
+        self.follow(self.alice, self.bob)
+        before = self.post(self.bob)
+        self.assertEqual(self.feed(self.alice), [before.pk]) # Caches the large-author set
+        self.follow(self.carol, self.bob) # Promoted
+        during = self.post(self.bob)
+        self.assertEqual(self.feed(self.alice), [during.pk, before.pk])
+        self.assertEqual(self.feed(self.carol), [during.pk, before.pk])
+
+        self.unfollow(self.carol, self.bob) # Demoted: posts written while large are pushed to the followers left
+        self.assertEqual(self.entries(self.alice), {before.pk, during.pk})
+        self.assertEqual(self.feed(self.alice), [during.pk, before.pk])
+        self.assertEqual(self.feed(self.carol), [])
+        after = self.post(self.bob)
+        self.assertEqual(self.feed(self.alice), [after.pk, during.pk, before.pk])
+
+    def test_writes_ignore_a_stale_large_author_cache(self):
+        self.follow(self.alice, self.bob)
+        cache.set(timeline.LARGE_AUTHORS_CACHE_KEY, {self.bob.pk}) # As if another process still thought bob was large
+        post = self.post(self.bob)
+        self.assertEqual(self.entries(self.alice), {post.pk})
+
+    def test_rebuild(self):
+        self.follow(self.alice, self.bob)
+        posts = [self.post(self.bob), self.post(self.alice)]
+        TimelineEntry.objects.filter(user=self.alice).delete()
+        timeline.rebuild(self.alice)
+        self.assertEqual(self.feed(self.alice), [post.pk for post in reversed(posts)])
+
+
+@override_settings(CACHES=LOCAL_CACHE, LIKE_BUFFERING=False, NOTIFICATION_DISPATCH_ASYNC=False)
+class CounterTestCase(APITestCase):
+    # Denormalized likes_count/comments_count, kept with F() updates and repaired by recount_post_counters
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice, cls.bob = [
+            User.objects.create_user(username=name, email=f'{name}@example.com', password='password')
+            for name in ('alice', 'bob')
+        ]
+        cls.posts = [Post.objects.create(author=cls.alice, title=f'Post {i}', content='Some content') for i in range(3)]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.bob)
+
+    def counters(self):
+        return list(Post.objects.order_by('pk').values_list('likes_count', 'comments_count'))
+
+    def test_writes_update_counters(self):
+        post = self.posts[0]
+        self.client.post(reverse('post-like', kwargs={'pk': post.pk}))
+        self.client.force_authenticate(self.alice)
+        self.client.put(reverse('post-like', kwargs={'pk': post.pk}))
+        self.client.put(reverse('post-like', kwargs={'pk': post.pk})) # Idempotent
+        comments_url = reverse('post-comments-list', kwargs={'post_pk': post.pk})
+        comment = self.client.post(comments_url, {'content': 'Nice'}).data
+        self.client.post(comments_url, {'content': 'Nicer'})
+        self.assertEqual(self.counters()[0], (2, 2))
+        self.client.delete(reverse('post-unlike', kwargs={'pk': post.pk}))
+        self.client.delete(reverse('post-unlike', kwargs={'pk': post.pk})) # Not liked any more: no-op
+        self.client.delete(reverse('post-comments-detail', kwargs={'post_pk': post.pk, 'pk': comment['id']}))
+        self.assertEqual(self.counters()[0], (1, 1))
+
+    def test_recount(self):
+        Like.objects.create(user=self.bob, post=self.posts[0])
+        Comment.objects.create(post=self.posts[1], author=self.bob, content='Nice')
+        Post.objects.filter(pk=self.posts[2].pk).update(likes_count=5) # Drifted the other way
+        names = ['counters'] + [f'post:{post.pk}' for post in self.posts]
+        before = get_versions(names)
+        out = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('recount_post_counters', chunk_size=2, stdout=out)
+        self.assertIn('Checked 3 posts, fixed 3 drifted counters.', out.getvalue())
+        self.assertEqual(self.counters(), [(1, 0), (0, 1), (0, 0)])
+        after = get_versions(names)
+        self.assertTrue(all(after[name] != before[name] for name in names)) # Cached responses are dropped
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('recount_post_counters', stdout=out)
+        self.assertIn('Checked 3 posts, fixed 0 drifted counters.', out.getvalue())
+        self.assertEqual(get_versions(names), after) # Nothing to invalidate
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class LikedPostsTestCase(APITestCase):
+    # POST /api/posts/liked/: "liked by me" flags for a list of post ids
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice, cls.bob = [
+            User.objects.create_user(username=name, email=f'{name}@example.com', password='password')
+            for name in ('alice', 'bob')
+        ]
+        cls.posts = [Post.objects.create(author=cls.bob, title=f'Post {i}', content='Some content') for i in range(3)]
+        Like.objects.create(user=cls.alice, post=cls.posts[0])
+        Like.objects.create(user=cls.bob, post=cls.posts[1]) # Someone else's like
+
+    def setUp(self):
+        pending.clear()
+        self.addCleanup(pending.clear)
+        self.client.force_authenticate(self.alice)
+
+    def liked(self, ids):
+        return self.client.post(reverse('post-liked'), {'ids': ids}, format='json')
+
+    def test_mixed_and_unknown_ids(self):
+        missing = Post.objects.latest('pk').pk + 1
+        pending.record(self.alice.pk, self.posts[2].pk, True) # Not written yet, but alice sees it
+        with self.assertNumQueries(1):
+            response = self.liked([post.pk for post in self.posts] + [missing])
+        self.assertEqual(response.status_code, 200)
+        expected = [True, False, True, False] # Unknown ids are simply not liked
+        self.assertEqual(response.data['liked'], {str(pk): liked for pk, liked in zip([post.pk for post in self.posts] + [missing], expected)})
+
+    def test_input_is_validated(self):
+        for ids in ([], ['one'], [0], list(range(1, 102))): # At most 100 ids
+            self.assertEqual(self.liked(ids).status_code, 400)
+        self.assertEqual(self.liked(list(range(1, 101))).status_code, 200)
+
+    def test_anonymous(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.liked([self.posts[0].pk]).status_code, 401)
+
+
+@override_settings(CACHES=LOCAL_CACHE, NOTIFICATION_DISPATCH_ASYNC=False)
+class LikeBufferTestCase(TestCase):
+    # Batched like writes (posts.like_buffer) and the read-your-own-like overlay (posts.likes)
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice, cls.bob, cls.carol = [
+            User.objects.create_user(username=name, email=f'{name}@example.com', password='password')
+            for name in ('alice', 'bob', 'carol')
+        ]
+        cls.post, cls.other_post = [Post.objects.create(author=cls.bob, title=f'Post {i}', content='Some content') for i in range(2)]
+
+    def setUp(self):
+        pending.clear()
+        self.addCleanup(pending.clear)
+
+    def write(self, *intents):
+        with self.captureOnCommitCallbacks(execute=True):
+            return like_buffer.write_likes(intents)
+
+    def likes_count(self, post):
+        return Post.objects.values_list('likes_count', flat=True).get(pk=post.pk)
+
+    def test_intents_are_coalesced_per_user_and_post(self):
+        result = self.write(
+            pending.record(self.alice.pk, self.post.pk, True),
+            pending.record(self.alice.pk, self.post.pk, False),
+            pending.record(self.alice.pk, self.post.pk, True),
+            pending.record(self.carol.pk, self.post.pk, True),
+        )
+        self.assertEqual(result, (2, 0))
+        self.assertEqual(Like.objects.filter(post=self.post).count(), 2)
+        self.assertEqual(self.likes_count(self.post), 2)
+
+    def test_latest_intent_wins(self):
+        # Like then unlike writes nothing; unlike then like of an existing like changes nothing
+        self.assertEqual(self.write(
+            pending.record(self.alice.pk, self.post.pk, True),
+            pending.record(self.alice.pk, self.post.pk, False),
+        ), (0, 0))
+        self.assertFalse(Like.objects.exists())
+        Like.objects.create(user=self.alice, post=self.post)
+        self.assertEqual(self.write(
+            pending.record(self.alice.pk, self.post.pk, False),
+            pending.record(self.alice.pk, self.post.pk, True),
+        ), (0, 0))
+        self.assertTrue(Like.objects.filter(user=self.alice, post=self.post).exists())
+
+    def test_counter_deltas(self):
+        Like.objects.create(user=self.alice, post=self.post)
+        Post.objects.filter(pk=self.post.pk).update(likes_count=1)
+        self.assertEqual(self.write(
+            pending.record(self.alice.pk, self.post.pk, False),
+            pending.record(self.carol.pk, self.post.pk, True),
+            pending.record(self.carol.pk, self.other_post.pk, True),
+            pending.record(self.bob.pk, self.other_post.pk, False), # Not liked: no-op
+        ), (2, 1))
+        self.assertEqual(self.likes_count(self.post), 1)
+        self.assertEqual(self.likes_count(self.other_post), 1)
+
+    def test_overlay_until_written(self):
+        Like.objects.create(user=self.alice, post=self.other_post)
+        Post.objects.filter(pk=self.other_post.pk).update(likes_count=1)
+        like = pending.record(self.alice.pk, self.post.pk, True)
+        unlike = pending.record(self.alice.pk, self.other_post.pk, False)
+        self.assertEqual(liked_post_ids(self.alice, [self.post.pk, self.other_post.pk]), {self.post.pk})
+        self.write(like, unlike)
+        self.assertEqual(pending.overlay(self.alice.pk, [self.post.pk, self.other_post.pk]), {})
+        self.assertEqual(liked_post_ids(self.alice, [self.post.pk, self.other_post.pk]), {self.post.pk})
+
+    def test_newer_intent_survives_write_of_older(self):
+        like = pending.record(self.alice.pk, self.post.pk, True)
+        pending.record(self.alice.pk, self.post.pk, False) # Arrives while the batch is written
+        self.write(like)
+        self.assertEqual(pending.overlay(self.alice.pk, [self.post.pk]), {self.post.pk: False})
+
+    def test_failed_batch_stays_in_overlay(self):
+        like = pending.record(self.alice.pk, self.post.pk, True)
+        with mock.patch.object(Post.objects, 'only', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                self.write(like)
+        self.assertEqual(liked_post_ids(self.alice, [self.post.pk]), {self.post.pk})
+
+    def test_given_up_batches(self):
+        like = pending.record(self.alice.pk, self.post.pk, True)
+        with mock.patch.object(like_buffer.worker, 'submit') as submit:
+            like_buffer.give_up([like], OperationalError('database is locked'))
+        submit.assert_called_once_with(like) # Queued again, and still shown to alice
+        self.assertEqual(pending.overlay(self.alice.pk, [self.post.pk]), {self.post.pk: True})
+        like_buffer.give_up([like], OperationalError('no such table: posts_like')) # Not transient
+        self.assertEqual(pending.overlay(self.alice.pk, [self.post.pk]), {})
+        like = pending.record(self.alice.pk, self.post.pk, True)
+        like_buffer.give_up([like], ValueError())
+        self.assertEqual(pending.overlay(self.alice.pk, [self.post.pk]), {})
+
+
+@override_settings(CACHES=LOCAL_CACHE, TRENDING_WINDOWS={'hour': 60 * 60})
+class TrendingTestCase(TestCase):
+    # Incremental scores (posts.trending.record) against rebuilt ones
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username='alice', email='alice@example.com', password='password')
+        cls.posts = [Post.objects.create(author=cls.alice, title=f'Post {i}', content='Some content') for i in range(3)]
+
+    def record(self, *events):
+        now = timezone.now()
+        trending.record([trending.TrendingEvent(post.pk, kind, count, now) for post, kind, count in events])
+
+    def scores(self):
+        return dict(TrendingScore.objects.filter(window='hour').values_list('post_id', 'score'))
+
+    def test_record(self):
+        self.record((self.posts[0], 'like', 2), (self.posts[1], 'comment', 1), (self.posts[0], 'like', 1))
+        scores = self.scores()
+        self.assertAlmostEqual(scores[self.posts[0].pk], 3.0, places=3)
+        self.assertAlmostEqual(scores[self.posts[1].pk], 3.0, places=3) # Comments weigh 3 likes
+        self.record((self.posts[1], 'like', 1))
+        self.assertAlmostEqual(self.scores()[self.posts[1].pk], 4.0, places=3)
+        self.assertEqual([score.post_id for score in trending.ranked('hour')], [self.posts[1].pk, self.posts[0].pk])
+
+    def test_unlike_subtracts(self):
+        self.record((self.posts[0], 'like', 2))
+        self.record((self.posts[0], 'like', -1), (self.posts[1], 'like', -1))
+        self.assertEqual(list(self.scores()), [self.posts[0].pk]) # No row for a removal alone
+        self.assertAlmostEqual(self.scores()[self.posts[0].pk], 1.0, places=3)
+        self.record((self.posts[0], 'like', -3))
+        self.assertEqual(self.scores()[self.posts[0].pk], 0.0) # Never below zero
+        self.assertFalse(trending.ranked('hour').exists())
+
+    @override_settings(TRENDING_SIZE=2)
+    def test_posts_below_the_ranking_get_no_row(self):
+        self.record((self.posts[0], 'like', 2), (self.posts[1], 'like', 3))
+        self.record((self.posts[2], 'like', 1))
+        self.assertNotIn(self.posts[2].pk, self.scores())
+        self.record((self.posts[2], 'like', 3))
+        self.assertIn(self.posts[2].pk, self.scores())
+        Like.objects.bulk_create([Like(user=self.alice, post=self.posts[2])]) # Picked up by the next rescore
+        self.assertEqual(trending.rescore('hour'), 1)
+        self.assertEqual(list(self.scores()), [self.posts[2].pk])
+
+    def test_rebase(self):
+        # A window left without a rescore for too many half-lives is moved to a new epoch, keeping the order
+        now = timezone.now()
+        epoch = now - datetime.timedelta(seconds=trending.half_life('hour') * 300)
+        TrendingWindow.objects.create(name='hour', epoch=epoch)
+        TrendingScore.objects.bulk_create([
+            TrendingScore(window='hour', post=post, score=n * 2.0 ** 300, last_event_at=now)
+            for n, post in enumerate(self.posts[:2], start=1)
+        ])
+        self.record((self.posts[2], 'like', 1))
+        self.assertGreaterEqual(TrendingWindow.objects.get().epoch, now)
+        scores = self.scores()
+        self.assertEqual([round(scores[post.pk], 2) for post in self.posts], [1.0, 2.0, 1.0])
+        TrendingWindow.objects.update(epoch=now - datetime.timedelta(seconds=trending.half_life('hour') * 2000))
+        self.record((self.posts[2], 'like', 1)) # Old scores have decayed to nothing
+        self.assertEqual([self.scores()[post.pk] for post in self.posts[:2]], [0.0, 0.0])
+
+
+@override_settings(CACHES=LOCAL_CACHE, RESPONSE_CACHE_ALLOW_LOCAL=True, LIKE_BUFFERING=False, NOTIFICATION_DISPATCH_ASYNC=False)
+class ResponseCacheTestCase(APITestCase):
+    # Cached reads (posts.response_cache) and the writes that invalidate them
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice, cls.bob = [
+            User.objects.create_user(username=name, email=f'{name}@example.com', password='password')
+            for name in ('alice', 'bob')
+        ]
+        cls.post = Post.objects.create(author=cls.alice, title='Original', content='Some content')
+
+    def setUp(self):
+        get_cache().clear()
+        pending.clear()
+        self.addCleanup(pending.clear)
+
+    def write(self, method, url, data=None, user=None):
+        # Invalidations are bumped on commit
+        self.client.force_authenticate(user or self.alice)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(url, data, format='json')
+        self.client.force_authenticate(None)
+        return response
+
+    def test_repeated_read_is_served_from_cache(self):
+        url = reverse('post-detail', args=[self.post.pk])
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(second.content, first.content)
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_post_update_invalidates_detail_and_list(self):
+        detail, listing = reverse('post-detail', args=[self.post.pk]), reverse('post-list')
+        etag = self.client.get(detail)['ETag']
+        self.client.get(listing)
+        self.write('patch', detail, {'title': 'Edited'})
+        response = self.client.get(detail, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['title'], 'Edited')
+        self.assertEqual(self.client.get(listing).data['results'][0]['title'], 'Edited')
+
+    def test_new_post_invalidates_list(self):
+        self.client.get(reverse('post-list'))
+        self.write('post', reverse('post-list'), {'title': 'New', 'content': 'More content'})
+        self.assertEqual(len(self.client.get(reverse('post-list')).data['results']), 2)
+
+    def test_comment_invalidates_comment_list_and_counter(self):
+        comments, detail = reverse('post-comments-list', args=[self.post.pk]), reverse('post-detail', args=[self.post.pk])
+        self.client.get(comments)
+        self.client.get(detail)
+        self.write('post', comments, {'content': 'Nice'}, user=self.bob)
+        self.assertEqual(len(self.client.get(comments).data['results']), 1)
+        self.assertEqual(self.client.get(detail).data['comments_count'], 1)
+
+    def test_like_invalidates_only_the_likers_view(self):
+        detail = reverse('post-detail', args=[self.post.pk])
+        self.client.force_authenticate(self.bob)
+        self.assertFalse(self.client.get(detail).data['is_liked_by_current_user'])
+        self.write('put', reverse('post-like', args=[self.post.pk]), user=self.bob)
+        self.client.force_authenticate(self.bob)
+        self.assertTrue(self.client.get(detail).data['is_liked_by_current_user'])
+
+    @override_settings(RESPONSE_CACHE_ALLOW_LOCAL=False)
+    def test_not_cached_on_a_process_local_cache(self):
+        url = reverse('post-detail', args=[self.post.pk])
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            self.client.get(url)
@@ -0,0 +1,157 @@
+"""
+Materialized home timelines (fan-out-on-write).
+
+Every post id is pushed into its author's and followers' TimelineEntry rows when it
+is created, so reading a feed is a ranged read over one user's entries. Authors
+with very large audiences are not fanned out; their posts are merged into the
+feed at read time instead.
+
+Writes decide from the author's current followers_count, never from the cached
+set of large authors, since a stale answer there would lose a post for good.
+When an author drops below the threshold, their recent posts (which were only
+merged at read time) are pushed to their followers in the same transaction, so
+nothing disappears from feeds. Reads use the cached set: after a promotion,
+other processes may show the author's new posts up to LARGE_AUTHORS_CACHE_TIMEOUT
+seconds late.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q
+
+from .models import Post, TimelineEntry
+
+User = get_user_model()
+Follow = User.followers.through # Auto-created through table: from_user is followed by to_user
+
+FANOUT_THRESHOLD = getattr(settings, 'TIMELINE_FANOUT_THRESHOLD', 5000) # Followers above which an author is merged at read time
+BACKFILL_LIMIT = getattr(settings, 'TIMELINE_BACKFILL_LIMIT', 200) # Recent posts copied into a timeline on follow
+BATCH_SIZE = 1000
+LARGE_AUTHORS_CACHE_KEY = 'timeline:large-author-ids'
+LARGE_AUTHORS_CACHE_TIMEOUT = 300
+
+
+def large_author_ids():
+    # Ids of authors whose posts are pulled at read time instead of being fanned out
+    ids = cache.get(LARGE_AUTHORS_CACHE_KEY)
+    if ids is None:
+        ids = set(User.objects.filter(followers_count__gte=FANOUT_THRESHOLD).values_list('pk', flat=True))
+        cache.set(LARGE_AUTHORS_CACHE_KEY, ids, LARGE_AUTHORS_CACHE_TIMEOUT)
+    return ids
+
+
+async def alarge_author_ids():
+    ids = await cache.aget(LARGE_AUTHORS_CACHE_KEY)
+    if ids is None:
+        ids = {pk async for pk in User.objects.filter(followers_count__gte=FANOUT_THRESHOLD).values_list('pk', flat=True)}
+        await cache.aset(LARGE_AUTHORS_CACHE_KEY, ids, LARGE_AUTHORS_CACHE_TIMEOUT)
+    return ids
+
+
+def is_large_author(author_id):
+    # Uncached, for writes: whether the author's posts are merged at read time instead of fanned out
+    return User.objects.filter(pk=author_id, followers_count__gte=FANOUT_THRESHOLD).exists()
+
+
+def _bulk_insert(user_ids, post):
+    entries = [TimelineEntry(user_id=user_id, post_id=post.pk, created_at=post.created_at) for user_id in user_ids]
+    TimelineEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def push_post(post):
+    # The author always sees their own post; followers only get it if the author is not too large
+    _bulk_insert([post.author_id], post)
+    if is_large_author(post.author_id):
+        return
+
+    follower_ids = Follow.objects.filter(from_user_id=post.author_id).values_list('to_user_id', flat=True)
+    batch = []
+    for follower_id in follower_ids.iterator(chunk_size=BATCH_SIZE):
+        batch.append(follower_id)
+        if len(batch) >= BATCH_SIZE:
+            _bulk_insert(batch, post)
+            batch = []
+    if batch:
+        _bulk_insert(batch, post)
+
+
+def _copy_recent_posts(user, author):
+    recent = Post.objects.filter(author=author).order_by('-created_at').values_list('pk', 'created_at')[:BACKFILL_LIMIT]
+    entries = [TimelineEntry(user=user, post_id=pk, created_at=created_at) for pk, created_at in recent]
+    TimelineEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def backfill(user, followee):
+    # Copy the followee's recent posts into the user's timeline after a follow
+    if is_large_author(followee.pk):
+        return # Merged at read time
+    _copy_recent_posts(user, followee)
+
+
+def fan_out_recent(author_id):
+    # Push the author's recent posts to all of their followers (after they stop being a large author)
+    recent = list(Post.objects.filter(author_id=author_id).order_by('-created_at').values_list('pk', 'created_at')[:BACKFILL_LIMIT])
+    if not recent:
+        return
+    follower_ids = Follow.objects.filter(from_user_id=author_id).values_list('to_user_id', flat=True)
+    batch = []
+    for follower_id in follower_ids.iterator(chunk_size=BATCH_SIZE):
+        batch.extend(TimelineEntry(user_id=follower_id, post_id=pk, created_at=created_at) for pk, created_at in recent)
+        if len(batch) >= BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, batch_size=BATCH_SIZE, ignore_conflicts=True)
+            batch = []
+    TimelineEntry.objects.bulk_create(batch, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def audience_changed(author_ids, followed):
+    # Call after the authors' followers_count moved by one (up if `followed`), in the same transaction.
+    # Authors crossing the threshold switch between fan-out and read-time merge.
+    boundary = FANOUT_THRESHOLD if followed else FANOUT_THRESHOLD - 1
+    crossed = list(User.objects.filter(pk__in=author_ids, followers_count=boundary).values_list('pk', flat=True))
+    if not crossed:
+        return
+    if not followed:
+        for author_id in crossed:
+            fan_out_recent(author_id) # Their posts are no longer merged at read time
+    transaction.on_commit(lambda: cache.delete(LARGE_AUTHORS_CACHE_KEY))
+
+
+def trim(user, followee):
+    # Drop the followee's posts from the user's timeline after an unfollow
+    TimelineEntry.objects.filter(user=user, post__author=followee).delete()
+
+
+def rebuild(user):
+    # Recreate a user's timeline from scratch (own posts plus recent posts of everyone they follow)
+    TimelineEntry.objects.filter(user=user).delete()
+    _copy_recent_posts(user, user)
+    for followee in user.following.all().iterator(chunk_size=BATCH_SIZE):
+        backfill(user, followee)
+
+
+def feed_queryset(user):
+    # Posts pushed into the user's timeline, plus read-time merge of large authors they follow.
+    # Annotated with `feed_at`, the key feeds are ordered and paginated on.
+    large_ids = large_author_ids()
+    pulled = []
+    if large_ids:
+        pulled = list(Follow.objects.filter(to_user_id=user.pk, from_user_id__in=large_ids).values_list('from_user_id', flat=True))
+    return _feed(user, pulled)
+
+
+async def afeed_queryset(user):
+    # Same as feed_queryset(), with the lookups it makes up front done through the async ORM
+    large_ids = await alarge_author_ids()
+    pulled = []
+    if large_ids:
+        pulled = [pk async for pk in Follow.objects.filter(to_user_id=user.pk, from_user_id__in=large_ids).values_list('from_user_id', flat=True)]
+    return _feed(user, pulled)
+
+
+def _feed(user, pulled):
+    if not pulled:
+        # Ranged read over the user's (user, created_at) timeline index joined to posts by primary key
+        return Post.objects.filter(timeline_entries__user=user).annotate(feed_at=F('timeline_entries__created_at'))
+    condition = Q(pk__in=TimelineEntry.objects.filter(user=user).values('post_id')) | Q(author__in=pulled)
+    return Post.objects.filter(condition).annotate(feed_at=F('created_at'))
@@ -0,0 +1,168 @@
+"""
+Trending posts.
+
+Each window in TRENDING_WINDOWS (hour, day and week by default) ranks posts by
+their likes and comments, weighted by TRENDING_WEIGHTS and decayed exponentially
+with a half-life of a quarter of the window: an event one window old counts 1/16
+of a new one.
+
+Scores are stored relative to the window's epoch (TrendingWindow): an event at
+time t adds weight * 2 ** ((t - epoch) / half_life). Decay multiplies every score
+of the window by the same factor, so stored scores rank posts exactly like the
+decayed ones, and an event is one F() update of its post's row while the other
+rows stay untouched. Like batches and comment writes call `record()` in their
+transaction. A post without a row only gets one when its events score above the
+window's TRENDING_SIZE-th post, so windows don't collect a row per liked post.
+
+`rescore()` rebuilds a window from the likes and comments inside it with a fresh
+epoch. That keeps the exponents small, drops posts that have gone quiet, trims
+the window to its TRENDING_SIZE best posts and picks up posts that climbed
+through events too small to enter on their own. It must run on a schedule (the
+rescore_trending command, every few minutes) for rankings to stay right.
+/api/posts/trending/ reads the first rows of the (window, score) index, so
+serving a ranking costs the same however many posts and likes there are.
+"""
+import datetime
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max
+from django.db.models.functions import Greatest, Trunc
+from django.utils import timezone
+
+from .models import Comment, Like, TrendingScore, TrendingWindow
+from .response_cache import invalidate
+
+TrendingEvent = namedtuple('TrendingEvent', ['post_id', 'kind', 'count', 'timestamp']) # count < 0 for removals
+
+DEFAULT_WINDOWS = {'hour': 60 * 60, 'day': 24 * 60 * 60, 'week': 7 * 24 * 60 * 60}
+REBASE_EXPONENT = 256 # Rebase a window that hasn't been rescored for this many half-lives, long before floats overflow
+
+
+def windows():
+    # Window name -> length in seconds
+    return getattr(settings, 'TRENDING_WINDOWS', DEFAULT_WINDOWS)
+
+
+def weights():
+    return getattr(settings, 'TRENDING_WEIGHTS', {'like': 1.0, 'comment': 3.0})
+
+
+def size():
+    return getattr(settings, 'TRENDING_SIZE', 100)
+
+
+def half_life(window):
+    return windows()[window] / 4
+
+
+def half_lives(window, epoch, timestamp):
+    return (timestamp - epoch).total_seconds() / half_life(window)
+
+
+def growth(window, epoch, timestamp):
+    # Weight of an event at `timestamp` relative to one at the epoch
+    return 2 ** half_lives(window, epoch, timestamp)
+
+
+def lock_windows(now):
+    # The windows' epochs, locked until the transaction ends so a rescore can't swap them mid-update
+    names = list(windows())
+    rows = TrendingWindow.objects.select_for_update().in_bulk(names)
+    if len(rows) < len(names):
+        TrendingWindow.objects.bulk_create([TrendingWindow(name=name, epoch=now) for name in names if name not in rows], ignore_conflicts=True)
+        rows = TrendingWindow.objects.select_for_update().in_bulk(names)
+    for window in rows.values():
+        if half_lives(window.name, window.epoch, now) > REBASE_EXPONENT:
+            rebase(window, now)
+    return rows
+
+
+def rebase(window, now):
+    # Move the epoch to now: one UPDATE scaling the window's scores down, order unchanged
+    exponent = half_lives(window.name, window.epoch, now)
+    scores = TrendingScore.objects.filter(window=window.name)
+    if exponent < 1000:
+        scores.update(score=F('score') / 2 ** exponent)
+    else:
+        scores.update(score=0.0) # Decayed below what a float can hold
+    window.epoch = now
+    window.save(update_fields=['epoch'])
+
+
+def record(events):
+    # Add like/comment events to every window; call it in the transaction that writes them
+    events = [event for event in events if event.count]
+    if not events:
+        return
+    with transaction.atomic():
+        now = timezone.now()
+        epochs = lock_windows(now)
+        for name, window in epochs.items():
+            deltas, latest, threshold = defaultdict(float), {}, None
+            for event in events:
+                deltas[event.post_id] += weights()[event.kind] * event.count * growth(name, window.epoch, event.timestamp)
+                if event.count > 0:
+                    latest[event.post_id] = max(latest.get(event.post_id, event.timestamp), event.timestamp)
+            for post_id, delta in deltas.items():
+                changes = {'score': Greatest(F('score') + delta, 0.0)}
+                if post_id in latest:
+                    changes['last_event_at'] = Greatest(F('last_event_at'), latest[post_id])
+                updated = TrendingScore.objects.filter(window=name, post_id=post_id).update(**changes)
+                if not updated and delta > 0:
+                    if threshold is None:
+                        threshold = entry_score(name, now)
+                    if delta > threshold:
+                        TrendingScore.objects.create(window=name, post_id=post_id, score=delta, last_event_at=latest[post_id])
+        invalidate('trending')
+
+
+def entry_score(window, now):
+    # Stored score a post must beat to enter the ranking: the TRENDING_SIZE-th best, or 0 while there are fewer
+    scores = list(ranked(window, now).values_list('score', flat=True)[size() - 1:size()])
+    return scores[0] if scores else 0.0
+
+
+def window_scores(window, now):
+    # post_id -> (score relative to now, newest event) from the likes and comments inside the window.
+    # Events are counted per post and time bucket in SQL; buckets are a small fraction of the half-life.
+    kind = 'minute' if half_life(window) < 6 * 60 * 60 else 'hour'
+    middle = datetime.timedelta(seconds=30 if kind == 'minute' else 30 * 60)
+    since = now - datetime.timedelta(seconds=windows()[window])
+    scores, latest = defaultdict(float), {}
+    for event_kind, model in (('like', Like), ('comment', Comment)):
+        buckets = (
+            model.objects.filter(created_at__gte=since, created_at__lte=now)
+            .annotate(bucket=Trunc('created_at', kind))
+            .values('post_id', 'bucket')
+            .annotate(n=Count('pk'), newest=Max('created_at'))
+            .order_by()
+        )
+        for row in buckets.iterator():
+            scores[row['post_id']] += weights()[event_kind] * row['n'] * growth(window, now, min(row['bucket'] + middle, now))
+            latest[row['post_id']] = max(latest.get(row['post_id'], row['newest']), row['newest'])
+    return scores, latest
+
+
+def rescore(window, now=None):
+    # Rebuild a window with a new epoch, keeping its best TRENDING_SIZE posts; returns how many were kept
+    now = now or timezone.now()
+    with transaction.atomic():
+        epoch = lock_windows(now)[window] # Concurrent record() calls wait, then add to the new scores
+        scores, latest = window_scores(window, now)
+        best = [post_id for post_id in sorted(scores, key=scores.get, reverse=True)[:size()] if scores[post_id] > 0]
+        TrendingScore.objects.filter(window=window).delete()
+        TrendingScore.objects.bulk_create([
+            TrendingScore(window=window, post_id=post_id, score=scores[post_id], last_event_at=latest[post_id]) for post_id in best
+        ])
+        epoch.epoch = epoch.rescored_at = now
+        epoch.save(update_fields=['epoch', 'rescored_at'])
+        invalidate('trending')
+    return len(best)
+
+
+def ranked(window, now=None):
+    # The window's posts by decayed score, best first, served by the posts_trending_rank index
+    since = (now or timezone.now()) - datetime.timedelta(seconds=windows()[window])
+    return TrendingScore.objects.filter(window=window, score__gt=0, last_event_at__gte=since).order_by('-score', '-post_id')
@@ -2,6 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_nested import routers
 from .views import PostViewSet, CommentViewSet, UserFeedView, PostLikeUnlikeView
+from . import async_views
 
 # Create a default router for posts
 router = DefaultRouter()
@@ -16,6 +17,7 @@ urlpatterns = [
     path('', include(router.urls)), # Includes /posts/
     path('', include(posts_router.urls)), # Includes /posts/{post_pk}/comments/
     path('feed/', UserFeedView.as_view(), name='user-feed'),
+    path('feed/async/', async_views.feed, name='user-feed-async'), # Same feed as an async view, for ASGI workers
     path('posts/<int:pk>/like/', PostLikeUnlikeView.as_view(), name='post-like'),
     path('posts/<int:pk>/unlike/', PostLikeUnlikeView.as_view(), name='post-unlike'), # DELETE method for unlike
 ]
\ No newline at end of file
@@ -1,43 +1,118 @@
-from rest_framework import viewsets, permissions, filters, status
-from rest_framework.pagination import PageNumberPagination
-from .models import Post, Comment, Like
-from notifications.models import Notification # Import Notification model
-from .serializers import PostSerializer, CommentSerializer
+from rest_framework import viewsets, permissions, filters, status, serializers
+from .models import Post, Comment
+from notifications.dispatch import notify # Queue notifications off the request path
+from .serializers import PostSerializer, CommentSerializer, PostIdListSerializer
 from rest_framework.response import Response
+from rest_framework.decorators import action
 from .permissions import IsOwnerOrReadOnly # Custom permission
 from rest_framework.generics import ListAPIView
 from rest_framework.views import APIView # For Like/Unlike actions
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db import IntegrityError # To handle unique_together constraint
+from django.db import transaction
+from django.db.models import F
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from . import timeline, trending
+from .pagination import KeysetPagination
+from .likes import liked_post_ids
+from .like_buffer import record_like
+from .search import FullTextSearchFilter
+from .response_cache import CachedResponseMixin, invalidate_post
 
-class StandardResultsPagination(PageNumberPagination):
-    page_size = 10
-    page_size_query_param = 'page_size'
-    max_page_size = 100
+class LikedPostsContextMixin:
+    # Resolves "liked by me" for a whole page in one query and hands the result to PostSerializer
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            self.liked_post_ids = liked_post_ids(self.request.user, [post.pk for post in page])
+        return page
 
-class PostViewSet(viewsets.ModelViewSet):
-    queryset = Post.objects.all()
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if getattr(self, 'liked_post_ids', None) is not None:
+            context['liked_post_ids'] = self.liked_post_ids
+        return context
+
+class PostViewSet(CachedResponseMixin, LikedPostsContextMixin, viewsets.ModelViewSet):
+    queryset = Post.objects.select_related('author') # Serializer shows author.username
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
-    pagination_class = StandardResultsPagination # Apply pagination
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter] # Apply filtering
+    pagination_class = KeysetPagination # Keyset pagination on (ordering field, id); no COUNT or OFFSET
+    filter_backends = [filters.OrderingFilter, FullTextSearchFilter] # Apply ordering, then indexed full-text search (ranked unless ?ordering= is given)
     search_fields = ['title', 'content', 'author__username'] # Fields to search by
-    ordering_fields = ['created_at', 'title'] # Fields to order by
+    ordering_fields = ['created_at', 'title', 'likes_count', 'comments_count'] # Fields to order by (counters give popularity sorting)
     ordering = ['-created_at'] # Default ordering
+    cached_actions = ('list', 'retrieve', 'trending_posts')
 
-    def get_serializer_context(self):
-        return {'request': self.request}# Pass the request to the serializer context for `is_liked_by_current_user`
+    def get_request_dependencies(self):
+        # The viewer's own likes are recorded before they are written, and change "liked by me" at once
+        viewer = [f'likes:{self.request.user.pk}'] if self.request.user.is_authenticated else []
+        if self.action == 'retrieve':
+            return [f"post:{self.kwargs['pk']}"] + viewer
+        if self.action == 'trending_posts':
+            return ['posts', 'trending'] + viewer
+        # Lists change when posts are added, edited or removed, and their order when counters move
+        ordering = self.request.query_params.get('ordering', '')
+        return (['posts', 'counters'] if 'count' in ordering else ['posts']) + viewer
+
+    def get_result_dependencies(self, data):
+        if self.action in ('list', 'trending_posts'):
+            return [f"post:{post['id']}" for post in data['results']]
+        return []
 
     def perform_create(self, serializer):
         # Set the author of the post to the current authenticated user
-        serializer.save(author=self.request.user)
+        post = serializer.save(author=self.request.user)
+        # Push the new post into the author's and followers' materialized timelines
+        timeline.push_post(post)
+        invalidate_post(post.pk, listing=True)
+
+    def perform_update(self, serializer):
+        post = serializer.save()
+        invalidate_post(post.pk, listing=True)
+
+    def perform_destroy(self, instance):
+        post_id = instance.pk
+        instance.delete()
+        invalidate_post(post_id, listing=True)
+
+    @action(detail=False, methods=['get'], url_path='trending', url_name='trending')
+    def trending_posts(self, request):
+        # Precomputed ranking of a window (?window=hour|day|week), read from the top of its index (see posts.trending)
+        return self.cached_response(self.get_trending, request)
+
+    def get_trending(self, request):
+        window = request.query_params.get('window', 'day')
+        if window not in trending.windows():
+            raise serializers.ValidationError({"window": [f"Choose one of: {', '.join(trending.windows())}."]})
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), trending.size())
+        except ValueError:
+            raise serializers.ValidationError({"limit": ["A valid integer is required."]})
+        # One query: the scores with their posts and authors, in rank order
+        posts = [score.post for score in trending.ranked(window).select_related('post__author')[:limit]]
+        self.liked_post_ids = liked_post_ids(request.user, [post.pk for post in posts])
+        serializer = self.get_serializer(posts, many=True)
+        return Response({"window": window, "results": serializer.data}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='liked', permission_classes=[permissions.IsAuthenticated])
+    def liked(self, request):
+        # Bulk "liked by me" flags for a list of post ids, so clients can refresh state without refetching posts
+        serializer = PostIdListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        liked = liked_post_ids(request.user, ids)
+        return Response({"liked": {str(post_id): post_id in liked for post_id in ids}}, status=status.HTTP_200_OK)
 
-class CommentViewSet(viewsets.ModelViewSet):
-    queryset = Comment.objects.all()
+class CommentViewSet(CachedResponseMixin, viewsets.ModelViewSet):
+    queryset = Comment.objects.select_related('author') # Serializer shows author.username
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
-    pagination_class = StandardResultsPagination # Apply pagination
+    pagination_class = KeysetPagination # Keyset pagination on (created_at, id)
+    cached_actions = ('list',) # Cached per post; any comment write on the post invalidates it
+
+    def get_request_dependencies(self):
+        return [f"post:{self.kwargs['post_pk']}"] if 'post_pk' in self.kwargs else ['posts']
 
     def get_queryset(self):
         # Allow filtering comments by post ID if a 'post_pk' is provided in the URL
@@ -51,11 +126,15 @@ class CommentViewSet(viewsets.ModelViewSet):
         if post_id:
             try:
                 post = get_object_or_404(Post, pk=post_id)
-                comment = serializer.save(author=self.request.user, post=post)
+                with transaction.atomic():
+                    comment = serializer.save(author=self.request.user, post=post)
+                    Post.objects.filter(pk=post.pk).update(comments_count=F('comments_count') + 1)
+                    invalidate_post(post.pk, counters=True)
+                    trending.record([trending.TrendingEvent(post.pk, 'comment', 1, comment.created_at)])
 
-                # Create notification for the post author
+                # Queue a notification for the post author
                 if post.author != self.request.user: # Don't notify if commenting on own post
-                    Notification.objects.create(
+                    notify(
                         recipient=post.author,
                         actor=self.request.user,
                         verb='commented on',
@@ -66,57 +145,53 @@ class CommentViewSet(viewsets.ModelViewSet):
         else:
             raise serializers.ValidationError({"detail": "Post ID is required to create a comment."})
 
-class UserFeedView(ListAPIView):
+    def perform_update(self, serializer):
+        comment = serializer.save()
+        invalidate_post(comment.post_id)
+
+    def perform_destroy(self, instance):
+        # Keep the post's denormalized comment counter in step with the delete
+        with transaction.atomic():
+            instance.delete()
+            Post.objects.filter(pk=instance.post_id).update(comments_count=F('comments_count') - 1)
+            invalidate_post(instance.post_id, counters=True)
+            trending.record([trending.TrendingEvent(instance.post_id, 'comment', -1, instance.created_at)])
+
+class UserFeedView(LikedPostsContextMixin, ListAPIView):
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticated] # Only authenticated users can see their feed
-    pagination_class = StandardResultsPagination # Apply pagination to the feed
+    pagination_class = KeysetPagination # Keyset pagination on (created_at, id) for the feed
     
     def get_queryset(self):
-        user = self.request.user
-        # Get all users that the current user is following
-        # 'following' is the related_name on the 'followers' ManyToMany field in the User model
-        followed_users = user.following.all()
-        
-        # Combine the followed users with the current user to create a feed
-        combined_users = list(followed_users) + [user] # Include the current user in the feed
-        
-        # Filter posts where the author is one of the followed users
-        # Order by created_at in descending order (most recent first)
-        queryset = Post.objects.filter(author__in=combined_users).order_by('-created_at')
-        return queryset
+        # Read the user's materialized timeline (own posts and posts fanned out from followed users),
+        # merged with posts from followed large authors, most recent first
+        return timeline.feed_queryset(self.request.user).select_related('author').order_by('-feed_at')
     
 class PostLikeUnlikeView(APIView):
+    # Likes are buffered and written in batches (see posts.like_buffer); the liker sees their own like at once.
+    # PUT and DELETE are idempotent; POST keeps reporting an existing like as a conflict.
+    # Unwritten likes are only known to the process that took them, so the 409 is best effort (see posts.likes).
     permission_classes = [permissions.IsAuthenticated]
 
-    def post(self, request, pk, format=None):
-        post = get_object_or_404(Post, pk=pk)
-        user = request.user
+    def get_post_id(self, pk):
+        # Existence check on the primary key only; nothing is locked or written here
+        if not Post.objects.filter(pk=pk).exists():
+            raise Http404
+        return pk
 
-        # Try to create a Like object
-        try:
-            Like.objects.create(user=user, post=post)
-            # Create notification for the post author
-            if post.author != user: # Don't notify if liking your own post
-                Notification.objects.create(
-                    recipient=post.author,
-                    actor=user,
-                    verb='liked',
-                    target=post
-                )
-            return Response({"detail": "Post liked successfully."}, status=status.HTTP_201_CREATED)
-        except IntegrityError:
+    def put(self, request, pk, format=None):
+        record_like(request.user, self.get_post_id(pk), liked=True)
+        return Response({"detail": "Post liked.", "liked": True}, status=status.HTTP_200_OK)
+
+    def post(self, request, pk, format=None):
+        post_id = self.get_post_id(pk)
+        if post_id in liked_post_ids(request.user, [post_id]): # Includes likes still waiting to be written
             return Response({"detail": "You have already liked this post."}, status=status.HTTP_409_CONFLICT) # Conflict if already liked
+        # The post author is notified when the like is written (bursts of likes are coalesced)
+        record_like(request.user, post_id, liked=True)
+        return Response({"detail": "Post liked successfully."}, status=status.HTTP_201_CREATED)
 
     def delete(self, request, pk, format=None):
-        post = get_object_or_404(Post, pk=pk)
-        user = request.user
-
-        # Try to delete the Like object
-        try:
-            like = Like.objects.get(user=user, post=post)
-            like.delete()
-            # Optional: Remove corresponding notification if desired. This can be complex if a user has multiple likes
-            # or if the notification is for general likes. For simplicity, we're just deleting the Like object.
-            return Response({"detail": "Post unliked successfully."}, status=status.HTTP_204_NO_CONTENT)
-        except Like.DoesNotExist:
-            return Response({"detail": "You have not liked this post."}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+        # Unliking a post that isn't liked is a no-op, so retries are safe
+        record_like(request.user, self.get_post_id(pk), liked=False)
+        return Response({"detail": "Post unliked successfully."}, status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
@@ -0,0 +1,51 @@
+"""
+Plumbing for async (ASGI-native) read endpoints.
+
+`async_api_view` turns a coroutine returning response data into a plain Django
+async view: it authenticates with CachedTokenAuthentication through the async
+ORM, hands the view a DRF Request (for query_params, build_absolute_uri and
+serializer context) and renders the result or any APIException as JSON, the
+same way the sync DRF views do. The view itself must only touch the database
+through async ORM calls; serializers then run over rows that are already loaded,
+so they never block the event loop (a stray lazy query raises
+SynchronousOnlyOperation instead of silently blocking).
+"""
+import functools
+
+from rest_framework import status
+from rest_framework.exceptions import APIException, AuthenticationFailed, NotAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from django.http import HttpResponse
+
+from accounts.authentication import CachedTokenAuthentication
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status_code)
+
+
+def async_api_view(view):
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            response = json_response({"detail": f'Method "{request.method}" not allowed.'}, status.HTTP_405_METHOD_NOT_ALLOWED)
+            response['Allow'] = 'GET'
+            return response
+
+        authenticator = CachedTokenAuthentication()
+        try:
+            result = await authenticator.aauthenticate(request)
+            if result is None:
+                raise NotAuthenticated()
+            request = Request(request)
+            request.user, request.auth = result
+            data = await view(request, *args, **kwargs)
+        except (AuthenticationFailed, NotAuthenticated) as exc:
+            response = json_response({"detail": exc.detail}, status.HTTP_401_UNAUTHORIZED)
+            response['WWW-Authenticate'] = authenticator.authenticate_header(request)
+            return response
+        except APIException as exc: # e.g. NotFound for an invalid cursor
+            return json_response({"detail": exc.detail}, exc.status_code)
+        return json_response(data)
+    return wrapper
@@ -0,0 +1,113 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.db import OperationalError, close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWorker:
+    """
+    Collects items on an in-process queue and hands them to `handler` in batches
+    from a daemon thread. A batch is flushed when it reaches `batch_size` items
+    or `flush_interval` seconds after its first item arrived, whichever is first.
+    Batches failing with an OperationalError (e.g. "database is locked") are
+    retried with backoff, so handlers should be transactional. A batch that is
+    given up on (retries exhausted, or any other error) is passed to
+    `on_give_up(batch, error)` when set. Anything still queued when the process
+    exits is flushed by an atexit hook.
+    """
+
+    def __init__(self, handler, name, batch_size=500, flush_interval=1.0, max_retries=3, retry_backoff=0.1, on_give_up=None):
+        self.handler = handler
+        self.on_give_up = on_give_up
+        self.name = name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._atexit_registered = False
+
+    def submit(self, item):
+        self._ensure_started()
+        self._queue.put(item)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def flush(self):
+        # Drain the queue and process it in the calling thread (used at exit, by tests and by commands)
+        items = []
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for start in range(0, len(items), self.batch_size):
+            self._process(items[start:start + self.batch_size])
+        return len(items)
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.flush)
+                self._atexit_registered = True
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._process(batch)
+            finally:
+                # The worker thread owns its own connection; drop it if it has gone stale
+                close_old_connections()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _process(self, batch):
+        if not batch:
+            return
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.handler(batch)
+                return
+            except OperationalError as error:
+                if attempt == self.max_retries:
+                    logger.exception('%s gave up on a batch of %d items', self.name, len(batch))
+                    self._give_up(batch, error)
+                    return
+                time.sleep(self.retry_backoff * 2 ** attempt)
+            except Exception as error:
+                logger.exception('%s failed to process a batch of %d items', self.name, len(batch))
+                self._give_up(batch, error)
+                return
+
+    def _give_up(self, batch, error):
+        if self.on_give_up is None:
+            return
+        try:
+            self.on_give_up(batch, error)
+        except Exception:
+            logger.exception('%s could not hand over a failed batch', self.name)
@@ -0,0 +1,38 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into a replica file (local stand-in for replication).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='replica', help='Replica alias to copy into.')
+        parser.add_argument('--every', type=float, help='Keep copying every N seconds instead of once.')
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        if alias not in settings.DATABASES or alias == DEFAULT_DB_ALIAS:
+            raise CommandError(f'Unknown replica database {alias!r}.')
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite' or connections[alias].vendor != 'sqlite':
+            raise CommandError('Only SQLite databases can be copied this way.')
+        path = str(settings.DATABASES[alias]['NAME'])
+        path = path.removeprefix('file:').split('?')[0] # The replica is usually opened read-only through a URI
+
+        while True:
+            primary.ensure_connection()
+            target = sqlite3.connect(path)
+            try:
+                # Online backup: copied in place, so open replica connections see the new pages
+                primary.connection.backup(target)
+                target.execute('PRAGMA journal_mode=DELETE') # Read-only readers can't open a WAL file without its -shm
+            finally:
+                target.close()
+            self.stdout.write(self.style.SUCCESS(f'Copied {primary.settings_dict["NAME"]} to {path}.'))
+            if not options['every']:
+                return
+            time.sleep(options['every'])
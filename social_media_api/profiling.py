@@ -0,0 +1,183 @@
+"""
+Per-request SQL profiling.
+
+`SQLProfilingMiddleware` is opt-in: it removes itself unless SQL_PROFILING is
+true. When enabled it wraps every database connection with an execute wrapper
+that counts and times the request's queries, adds a Server-Timing header, logs
+requests over the query-count or latency budget with their SQL grouped by
+fingerprint (literals stripped, so an N+1 shows up as one statement run many
+times), and keeps a sampled ring buffer of recent profiles that admins can read
+from /api/profiling/requests/.
+"""
+import logging
+import random
+import re
+import time
+from collections import deque
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+logger = logging.getLogger(__name__)
+
+TOP_FINGERPRINTS = 10
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_LIST = re.compile(r'\((?:\s*(?:%s|\?)\s*,)*\s*(?:%s|\?)\s*\)')
+_SPACE = re.compile(r'\s+')
+REDACTED_QUERY_PARAMS = ('token',) # Credentials some endpoints accept in the query string (notifications.streaming)
+
+
+def fingerprint(sql):
+    # Normalize a statement so executions that differ only in literals or IN-list length group together
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql.replace('%s', '?'))
+    sql = _LIST.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+class QueryProfile:
+    """Execute wrapper collecting the count, time and fingerprints of the queries it sees."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.fingerprints = {} # fingerprint -> [count, seconds]
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.seconds += elapsed
+            entry = self.fingerprints.setdefault(fingerprint(sql), [0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed
+
+    def top(self, limit=TOP_FINGERPRINTS):
+        # Most repeated statements first, then the slowest
+        ranked = sorted(self.fingerprints.items(), key=lambda item: (-item[1][0], -item[1][1]))
+        return [{'sql': sql, 'count': count, 'ms': round(seconds * 1000, 2)} for sql, (count, seconds) in ranked[:limit]]
+
+
+class ProfileBuffer:
+    # Recent request profiles, oldest dropped first; deque appends are thread-safe
+    def __init__(self, size):
+        self._profiles = deque(maxlen=size)
+
+    def add(self, profile):
+        self._profiles.append(profile)
+
+    def list(self):
+        return list(reversed(self._profiles))
+
+    def clear(self):
+        self._profiles.clear()
+
+
+buffer = ProfileBuffer(getattr(settings, 'SQL_PROFILING_BUFFER_SIZE', 200))
+
+
+def wrap_connections(stack, profile):
+    for alias in connections:
+        stack.enter_context(connections[alias].execute_wrapper(profile))
+
+
+class SQLProfilingMiddleware:
+    sync_capable = True
+    async_capable = True # Doesn't force async views through a thread
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SQL_PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.query_budget = getattr(settings, 'SQL_PROFILING_QUERY_BUDGET', 20)
+        self.time_budget_ms = getattr(settings, 'SQL_PROFILING_TIME_BUDGET_MS', 500)
+        self.sample_rate = getattr(settings, 'SQL_PROFILING_SAMPLE_RATE', 0.01)
+        self.server_timing = getattr(settings, 'SQL_PROFILING_SERVER_TIMING', True)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile = QueryProfile()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            wrap_connections(stack, profile)
+            response = self.get_response(request)
+        return self.record(request, response, profile, started)
+
+    async def __acall__(self, request):
+        # Connections are per thread and the async ORM queries from the request's sync thread,
+        # so the wrappers are installed (and removed) there
+        profile = QueryProfile()
+        started = time.perf_counter()
+        stack = ExitStack()
+        await sync_to_async(wrap_connections)(stack, profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.record(request, response, profile, started)
+
+    def record(self, request, response, profile, started):
+        total_ms = (time.perf_counter() - started) * 1000
+        db_ms = profile.seconds * 1000
+
+        if self.server_timing:
+            response['Server-Timing'] = f'db;dur={db_ms:.2f};desc="{profile.count} queries", app;dur={total_ms:.2f}'
+
+        over_budget = profile.count > self.query_budget or total_ms > self.time_budget_ms
+        if over_budget:
+            logger.warning(
+                '%s %s ran %d queries in %.1fms (request %.1fms, budget %d queries / %dms)\n%s',
+                request.method, request.path, profile.count, db_ms, total_ms, self.query_budget, self.time_budget_ms,
+                '\n'.join(f"  {entry['count']}x {entry['ms']}ms {entry['sql']}" for entry in profile.top()),
+            )
+        # Requests over budget are always kept, the rest are sampled
+        if over_budget or random.random() < self.sample_rate:
+            buffer.add({
+                'timestamp': timezone.now().isoformat(),
+                'method': request.method,
+                'path': redacted_path(request),
+                'status': response.status_code,
+                'duration_ms': round(total_ms, 2),
+                'query_count': profile.count,
+                'query_ms': round(db_ms, 2),
+                'over_budget': over_budget,
+                'queries': profile.top(),
+            })
+        return response
+
+
+def redacted_path(request):
+    # Full path without credentials in the query string, for logs and the profile buffer
+    params = request.GET.copy()
+    for name in REDACTED_QUERY_PARAMS:
+        params.pop(name, None)
+    return f'{request.path}?{params.urlencode()}' if params else request.path
+
+
+class ProfiledRequestListView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, format=None):
+        # Newest first; ?over_budget=1 keeps only requests that exceeded a budget
+        profiles = buffer.list()
+        if request.query_params.get('over_budget') in ('1', 'true'):
+            profiles = [profile for profile in profiles if profile['over_budget']]
+        return Response({
+            "enabled": getattr(settings, 'SQL_PROFILING', False),
+            "results": profiles,
+        }, status=status.HTTP_200_OK)
@@ -0,0 +1,118 @@
+"""
+Primary/replica database routing.
+
+Writes always go to the primary ('default'). Reads go to a random alias from
+DATABASE_REPLICAS, except:
+
+- inside a transaction on the primary, so a write path reads its own rows;
+- for the rest of a request once it has written anything;
+- for REPLICA_PIN_SECONDS after a client's write, so the next requests of the
+  same client (same Authorization header or session) read their own writes
+  even if the replicas lag. Pins are kept in the default cache;
+- for authentication tokens and sessions, which are read right after they are
+  created at login.
+
+Request state lives in a context variable set by DatabaseRoutingMiddleware.
+Without replicas the router and the middleware step aside.
+"""
+import hashlib
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PRIMARY_ONLY_APPS = {'authtoken', 'sessions'}
+
+
+class RoutingState:
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state = ContextVar('database_routing_state', default=None)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not replicas():
+            return None
+        if model._meta.app_label in PRIMARY_ONLY_APPS or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        state = _state.get()
+        if state is not None and (state.pinned or state.wrote):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas())
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        pool = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        if db in replicas():
+            return False
+        return None
+
+
+def _client_key(request):
+    credentials = request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not credentials:
+        return None
+    return 'db-pin:' + hashlib.sha256(credentials.encode()).hexdigest()
+
+
+class DatabaseRoutingMiddleware:
+    sync_capable = True
+    async_capable = True # Doesn't force async views through a thread
+
+    def __init__(self, get_response):
+        if not replicas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        key = _client_key(request)
+        state = RoutingState(pinned=key is not None and cache.get(key) is not None)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote and key is not None:
+            cache.set(key, 1, self.pin_seconds)
+        return response
+
+    async def __acall__(self, request):
+        key = _client_key(request)
+        state = RoutingState(pinned=key is not None and await cache.aget(key) is not None)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote and key is not None:
+            await cache.aset(key, 1, self.pin_seconds)
+        return response
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,11 +43,15 @@ INSTALLED_APPS = [
     'rest_framework.authtoken',  # Token authentication for DRF
     'posts',
     'notifications',
+    'benchmarks', # Synthetic data and in-process load driver (seed_benchmark / run_benchmark commands)
+    'social_media_api', # Project-level management commands (sync_sqlite_replica)
 ]
 
 AUTH_USER_MODEL = 'accounts.User'  # Use custom user model
 
 MIDDLEWARE = [
+    'social_media_api.profiling.SQLProfilingMiddleware', # Opt-in, see SQL_PROFILING below
+    'social_media_api.routers.DatabaseRoutingMiddleware', # Read-your-writes pinning; inactive without replicas
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,13 +84,53 @@ WSGI_APPLICATION = 'social_media_api.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLite tuning applied to every new connection: WAL lets readers run alongside the writer,
+# synchronous=NORMAL is durable in WAL mode without an fsync per commit, and the timeout makes
+# concurrent writers wait for the lock instead of failing with "database is locked".
+# IMMEDIATE transactions take the write lock up front, so they never fail halfway on a lock upgrade.
+SQLITE_OPTIONS = {
+    'timeout': 20,
+    'transaction_mode': 'IMMEDIATE',
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        'PRAGMA cache_size=-20000;' # 20 MB page cache per connection
+        'PRAGMA temp_store=MEMORY;'
+        'PRAGMA mmap_size=134217728;'
+    ),
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': SQLITE_OPTIONS,
+        'CONN_MAX_AGE': 60, # Keep connections (and their page cache) between requests
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Read replicas (social_media_api.routers). Aliases listed in DATABASE_REPLICAS serve reads; writes
+# and reads that must see them go to 'default'. For a local two-file setup set SQLITE_REPLICA_PATH
+# and refresh the copy with `manage.py sync_sqlite_replica [--every N]`.
+DATABASE_ROUTERS = ['social_media_api.routers.PrimaryReplicaRouter']
+DATABASE_REPLICAS = []
+REPLICA_PIN_SECONDS = 5 # How long a client's reads stay on the primary after it writes
+
+if os.environ.get('SQLITE_REPLICA_PATH'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f"file:{os.environ['SQLITE_REPLICA_PATH']}?mode=ro", # Opened read-only
+        'OPTIONS': {
+            'timeout': 20,
+            'init_command': 'PRAGMA cache_size=-20000;PRAGMA temp_store=MEMORY;PRAGMA mmap_size=134217728;',
+        },
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS = ['replica']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -131,9 +176,21 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploads larger than this are streamed to a temporary file instead of being held in memory
+FILE_UPLOAD_MAX_MEMORY_SIZE = 256 * 1024
+
+# Profile pictures (accounts.avatars): uploads are limited in bytes (checked while the request is read)
+# and pixels, and thumbnails are rendered by a background worker. Set PROFILE_PICTURE_PROCESSING_ASYNC
+# to False to render them on commit.
+PROFILE_PICTURE_MAX_BYTES = 5 * 1024 * 1024
+PROFILE_PICTURE_MAX_PIXELS = 25_000_000
+PROFILE_PICTURE_SIZES = {'small': 48, 'medium': 160, 'large': 480} # Square edge in pixels per size label
+PROFILE_PICTURE_FORMAT = 'WEBP' # Falls back to JPEG if Pillow was built without WebP
+PROFILE_PICTURE_PROCESSING_ASYNC = True
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'accounts.authentication.CachedTokenAuthentication', # Token auth with a per-process token -> user cache
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
@@ -145,3 +202,74 @@ REST_FRAMEWORK = {
         'rest_framework.filters.OrderingFilter',
     ]
 }
+
+# Notifications are queued after commit and written in batches by a background thread.
+# Set NOTIFICATION_DISPATCH_ASYNC to False to write them synchronously on commit instead.
+NOTIFICATION_DISPATCH_ASYNC = True
+NOTIFICATION_BATCH_SIZE = 500
+NOTIFICATION_FLUSH_INTERVAL = 1.0 # Seconds a batch may wait before it is written
+
+# Notification retention (notifications.retention, run with `manage.py prune_notifications`)
+NOTIFICATION_RETENTION_READ_DAYS = 30
+NOTIFICATION_RETENTION_UNREAD_DAYS = 180
+NOTIFICATION_RETENTION_MODE = 'digest' # 'delete', 'digest' (summary rows) or 'archive' (gzipped NDJSON)
+NOTIFICATION_RETENTION_BATCH_SIZE = 500 # Rows per transaction; keeps the write lock short
+NOTIFICATION_ARCHIVE_DIR = BASE_DIR / 'notification_archive'
+
+# Likes are buffered in memory per (user, post) and written in batches by a background thread
+# (posts.like_buffer). Set LIKE_BUFFERING to False to write each like during its request instead.
+LIKE_BUFFERING = True
+LIKE_BUFFER_SIZE = 1000 # Intents that trigger a write before the interval is up
+LIKE_FLUSH_INTERVAL = 0.2 # Seconds a like may wait before it is written
+
+# "People you may know" (accounts.suggestions, refreshed with `manage.py refresh_suggestions`)
+FOLLOW_SUGGESTIONS_PER_USER = 50
+FOLLOW_SUGGESTIONS_STALE_FOLLOWERS = 1000 # Followers of a user whose follows changed that are queued for a refresh
+
+# Trending posts (posts.trending, served at /api/posts/trending/?window=). Scores decay with a half-life
+# of a quarter of the window; run `manage.py rescore_trending --every 300` to rebuild and trim the rankings.
+TRENDING_WINDOWS = {'hour': 60 * 60, 'day': 24 * 60 * 60, 'week': 7 * 24 * 60 * 60} # Name -> seconds
+TRENDING_WEIGHTS = {'like': 1.0, 'comment': 3.0}
+TRENDING_SIZE = 100 # Posts kept per window by a rescore, and the largest ?limit=
+
+# Data exports (accounts.export, /api/accounts/export/ and `manage.py export_user_data`) are streamed;
+# rows are fetched EXPORT_CHUNK_SIZE at a time, so memory use doesn't depend on the account's size.
+EXPORT_CHUNK_SIZE = 2000
+
+# Pub/sub backend used to push new notifications to clients of /api/notifications/stream/
+NOTIFICATION_PUBSUB_BACKEND = 'notifications.pubsub.LocalPubSub'
+
+# Per-request SQL profiling (social_media_api.profiling). Off unless SQL_PROFILING is True.
+# Requests over either budget are logged with their queries grouped by fingerprint;
+# those and a sample of the rest are kept for admins at /api/profiling/requests/.
+SQL_PROFILING = False
+SQL_PROFILING_QUERY_BUDGET = 20
+SQL_PROFILING_TIME_BUDGET_MS = 500
+SQL_PROFILING_SAMPLE_RATE = 0.01
+SQL_PROFILING_BUFFER_SIZE = 200
+SQL_PROFILING_SERVER_TIMING = True # Add a Server-Timing header with db and total time
+
+# Token authentication (accounts.authentication). Tokens expire AUTH_TOKEN_LIFETIME seconds after
+# they are issued (None: never). Resolved tokens are cached per process for TOKEN_AUTH_CACHE_TTL
+# seconds, and in the cache alias named by TOKEN_AUTH_SHARED_CACHE when set.
+AUTH_TOKEN_LIFETIME = 60 * 60 * 24 * 30
+TOKEN_AUTH_CACHE_SIZE = 10000
+TOKEN_AUTH_CACHE_TTL = 60
+TOKEN_AUTH_SHARED_CACHE = None
+
+# The default cache holds response cache versions and read-your-writes pins, which every worker
+# process must see: a write in one process has to invalidate the responses cached by the others.
+# REDIS_URL selects Redis (needs the redis package), shared between processes and hosts; otherwise
+# the cache is per process and the response cache stays off (see RESPONSE_CACHE_ALLOW_LOCAL below).
+if os.environ.get('REDIS_URL'):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': os.environ['REDIS_URL']}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+# Cached post/comment reads (posts.response_cache): entries live in this cache alias for at most
+# RESPONSE_CACHE_TIMEOUT seconds and are invalidated earlier by post, comment and like writes.
+# The response cache stays off on a per-process cache (LocMemCache) unless RESPONSE_CACHE_ALLOW_LOCAL
+# is True, which is only correct with a single process.
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = 300
+RESPONSE_CACHE_ALLOW_LOCAL = False
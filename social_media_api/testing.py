@@ -0,0 +1,51 @@
+"""
+Helpers for query regression tests.
+
+`QueryPlanMixin` captures the SQL an endpoint runs and checks it with SQLite's
+EXPLAIN QUERY PLAN: a full table scan or a whole-result sort for ORDER BY fails
+the test. Ordered index scans (`SCAN t USING INDEX ...`) are fine, and so is
+SQLite sorting ties on the right part of an ORDER BY that an index already
+orders by its leading column.
+"""
+import re
+import unittest
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+FULL_SCAN = re.compile(r'^SCAN (\S+)$') # Only "SCAN t"; "SCAN t USING [COVERING] INDEX i" walks an index
+FULL_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+
+requires_sqlite = unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+
+
+class QueryPlanMixin:
+    def capture_queries(self, url, **extra):
+        # GET the url and return the response with every SQL statement it ran
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, **extra)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response, [query['sql'] for query in context.captured_queries]
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[3] for row in cursor.fetchall()]
+
+    def assertIndexedPlan(self, sql):
+        plan = self.explain(sql)
+        for step in plan:
+            scan = FULL_SCAN.match(step)
+            if scan:
+                self.fail(f'Full scan of {scan.group(1)}:\n{sql}\n' + '\n'.join(plan))
+            if step == FULL_SORT:
+                self.fail(f'Sort without an index:\n{sql}\n' + '\n'.join(plan))
+        return plan
+
+    def assertIndexedQueries(self, url, **extra):
+        # Every SELECT the endpoint runs must be served by indexes
+        response, queries = self.capture_queries(url, **extra)
+        for sql in queries:
+            if sql.startswith('SELECT'):
+                self.assertIndexedPlan(sql)
+        return response
@@ -0,0 +1,147 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from accounts.authentication import issue_token
+from accounts.models import User
+from posts.models import Post
+from .profiling import QueryProfile, SQLProfilingMiddleware, buffer, fingerprint
+from .routers import DatabaseRoutingMiddleware, PrimaryReplicaRouter
+
+
+# Every test class runs on a LocMemCache of its own, see posts/tests.py.
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'routing-tests'}}
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], CACHES=LOCAL_CACHE)
+class DatabaseRoutingTestCase(SimpleTestCase):
+    # Primary/replica routing (social_media_api.routers); the router only picks aliases, nothing is queried
+    def setUp(self):
+        cache.clear()
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def view(self, write=False):
+        # A view recording where its read went, after an optional write
+        def get_response(request):
+            if write:
+                self.router.db_for_write(Post)
+            return HttpResponse(self.router.db_for_read(Post))
+        return get_response
+
+    def request(self, middleware, token='alice'):
+        return middleware(self.factory.get('/', HTTP_AUTHORIZATION=f'Token {token}')).content.decode()
+
+    def test_reads_go_to_replicas(self):
+        self.assertEqual(self.router.db_for_read(Post), 'replica')
+        self.assertEqual(self.router.db_for_write(Post), 'default')
+
+    def test_primary_reads(self):
+        self.assertEqual(self.router.db_for_read(Token), 'default') # Read right after login creates it
+        with mock.patch.object(connections['default'], 'in_atomic_block', True):
+            self.assertEqual(self.router.db_for_read(Post), 'default') # A write path reads its own rows
+
+    def test_request_reads_its_writes(self):
+        self.assertEqual(self.request(DatabaseRoutingMiddleware(self.view(write=True))), 'default')
+        self.assertEqual(self.router.db_for_read(Post), 'replica') # State ends with the request
+
+    def test_client_is_pinned_after_a_write(self):
+        self.request(DatabaseRoutingMiddleware(self.view(write=True)))
+        reader = DatabaseRoutingMiddleware(self.view())
+        self.assertEqual(self.request(reader), 'default')
+        self.assertEqual(self.request(reader, token='bob'), 'replica') # Other clients aren't pinned
+        cache.clear() # The pin expires after REPLICA_PIN_SECONDS
+        self.assertEqual(self.request(reader), 'replica')
+
+    async def test_async_requests(self):
+        async def get_response(request):
+            return self.view(write=request.method == 'POST')(request)
+
+        middleware = DatabaseRoutingMiddleware(get_response)
+        await middleware(self.factory.post('/', HTTP_AUTHORIZATION='Token alice'))
+        response = await middleware(self.factory.get('/', HTTP_AUTHORIZATION='Token alice'))
+        self.assertEqual(response.content, b'default')
+        response = await middleware(self.factory.get('/', HTTP_AUTHORIZATION='Token bob'))
+        self.assertEqual(response.content, b'replica')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas(self):
+        self.assertIsNone(self.router.db_for_read(Post))
+        with self.assertRaises(MiddlewareNotUsed):
+            DatabaseRoutingMiddleware(self.view())
+
+
+@override_settings(CACHES=LOCAL_CACHE, SQL_PROFILING=True, SQL_PROFILING_SAMPLE_RATE=0, SQL_PROFILING_QUERY_BUDGET=50)
+class SQLProfilingTestCase(APITestCase):
+    # Per-request SQL profiling (social_media_api.profiling)
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username='alice', email='alice@example.com', password='password')
+        cls.admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='password')
+        cls.token = issue_token(cls.alice)
+
+    def setUp(self):
+        buffer.clear()
+        self.addCleanup(buffer.clear)
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'O''Brien' LIMIT 21"),
+            'SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?',
+        )
+
+    def test_repeated_statements_are_grouped(self):
+        profile = QueryProfile()
+        with connection.execute_wrapper(profile):
+            for user in (self.alice, self.admin, self.alice):
+                User.objects.filter(pk=user.pk).exists()
+            User.objects.count()
+        self.assertEqual(profile.count, 4)
+        self.assertEqual([entry['count'] for entry in profile.top()], [3, 1]) # The N+1 shows as one statement
+
+    def test_server_timing(self):
+        self.client.force_authenticate(self.alice)
+        response = self.client.get(reverse('notifications-unread-count'))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", app;dur=[\d.]+$')
+        self.assertEqual(buffer.list(), []) # Within budget and not sampled
+
+    def test_requests_over_budget_are_logged_and_kept(self):
+        self.client.force_authenticate(self.alice)
+        with override_settings(SQL_PROFILING_QUERY_BUDGET=0), self.assertLogs('social_media_api.profiling', 'WARNING'):
+            self.client.get(reverse('notifications-unread-count')) # Budgets are read when the middleware loads
+        [profile] = buffer.list()
+        self.assertTrue(profile['over_budget'])
+        self.assertGreater(profile['query_count'], 0)
+        self.assertTrue(any('notifications_unreadnotificationcounter' in entry['sql'] for entry in profile['queries']))
+
+        response = self.client.get(reverse('profiled-requests'))
+        self.assertEqual(response.status_code, 403) # Admins only
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse('profiled-requests') + '?over_budget=1')
+        self.assertEqual([profile['path'] for profile in response.data['results']], ['/api/notifications/unread_count/'])
+
+    def test_tokens_are_kept_out_of_profiles(self):
+        self.client.force_authenticate(self.alice)
+        with override_settings(SQL_PROFILING_QUERY_BUDGET=0), self.assertLogs('social_media_api.profiling', 'WARNING'):
+            self.client.get(reverse('notifications-unread-count') + f'?token={self.token.key}&page=2')
+        [profile] = buffer.list()
+        self.assertEqual(profile['path'], '/api/notifications/unread_count/?page=2')
+
+    async def test_async_views(self):
+        response = await self.async_client.get(
+            reverse('notifications-unread-count-async'), headers={'Authorization': f'Token {self.token.key}'},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
+
+    @override_settings(SQL_PROFILING=False)
+    def test_disabled(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            SQLProfilingMiddleware(lambda request: HttpResponse())
@@ -18,12 +18,14 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from .profiling import ProfiledRequestListView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/accounts/', include('accounts.urls')),
     path('api/', include('posts.urls')),
     path('api/notifications/', include('notifications.urls')),
+    path('api/profiling/requests/', ProfiledRequestListView.as_view(), name='profiled-requests'),
 ]
 
 if settings.DEBUG: